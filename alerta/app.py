@@ -91,6 +91,9 @@ def create_app(config_override: Dict[str, Any] = None, environment: str = None)
     from alerta.management import mgmt
     app.register_blueprint(mgmt)
 
+    from alerta.utils.housekeeping import housekeeper
+    housekeeper.init_app(app)
+
     return app
 
 
@@ -0,0 +1,4 @@
+
+BUILD_NUMBER = 'PROD'
+BUILD_DATE = '2026-10-18T20:22:49Z'
+BUILD_VCS_NUMBER = '0e48e4bc62d8f257fbf11af87091318dfbba4c7f'
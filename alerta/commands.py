@@ -216,3 +216,57 @@ def users():
         else:
             if user:
                 click.echo('{} {}'.format(user.id, user.login))
+
+
+@cli.command('migrate-history', short_help='Move alert history into history table')
+@click.option('--batch-size', default=1000, type=int, help='Number of alerts migrated per transaction')
+@with_appcontext
+def migrate_history(batch_size):
+    """
+    Move history stored in alerts into the separate history table. Safe to
+    re-run and to run while the server is receiving alerts.
+    """
+    if not current_app.config['HISTORY_TABLE']:
+        raise click.UsageError('Must set HISTORY_TABLE = True before migrating history')
+
+    total = 0
+    while True:
+        try:
+            count = db.migrate_history(batch_size)
+        except Exception as e:
+            raise click.ClickException(str(e))
+        if not count:
+            break
+        total += count
+    click.echo('Migrated history of {} alerts'.format(total))
+
+
+@cli.command('indexes', short_help='List database indexes')
+@click.option('--check', is_flag=True, help='Exit with error if any indexes are missing or invalid')
+@with_appcontext
+def indexes(check):
+    """
+    List the managed set of database indexes and whether they exist and are
+    valid, and any other invalid indexes.
+    """
+    errors = 0
+    for table, name, state in db.get_indexes():
+        if state != 'ok':
+            errors += 1
+        click.echo('{:16} {:40} {}'.format(table, name, state))
+    if check and errors:
+        raise click.ClickException('{} missing or invalid indexes'.format(errors))
+
+
+@cli.command('rebuild-rollups', short_help='Recount alert rollups')
+@with_appcontext
+def rebuild_rollups():
+    """
+    Recount the alert counts by environment, service, project, group and tag
+    that are maintained as alerts change. Run after upgrading.
+    """
+    try:
+        count = db.rebuild_rollups()
+    except Exception as e:
+        raise click.ClickException(str(e))
+    click.echo('Rebuilt {} alert rollups'.format(count))
@@ -1,17 +1,51 @@
+import os
+import re
 from collections import defaultdict
 from datetime import datetime, timedelta
 
 from flask import current_app
-from pymongo import ASCENDING, TEXT, MongoClient, ReturnDocument
-from pymongo.errors import ConnectionFailure
+from pymongo import (ASCENDING, DESCENDING, TEXT, InsertOne, MongoClient,
+                     ReturnDocument, UpdateOne)
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError
 
 from alerta.app import alarm_model
 from alerta.database.base import Database
-from alerta.exceptions import NoCustomerMatch
+from alerta.exceptions import ApiError, NoCustomerMatch
 from alerta.models.enums import ADMIN_SCOPES
+from alerta.utils.format import DateTime
 
+from .pool import PoolMetrics
 from .utils import Query
 
+# managed index set, as (collection, keys, options)
+INDEXES = [
+    ('alerts', [('environment', ASCENDING), ('customer', ASCENDING), ('resource', ASCENDING), ('event', ASCENDING)], {'unique': True}),
+    ('alerts', [('$**', TEXT)], {}),
+    ('alerts', [('lastReceiveId', ASCENDING)], {}),
+    ('alerts', [('lastReceiveTime', DESCENDING)], {}),
+    ('alerts', [('status', ASCENDING)], {}),
+    ('alerts', [('severity', ASCENDING)], {}),
+    ('alerts', [('service', ASCENDING)], {}),
+    ('alerts', [('tags', ASCENDING)], {}),
+    ('alerts', [('changeTime', ASCENDING)], {}),
+    ('tombstones', [('deleteTime', ASCENDING)], {}),
+    ('rollups', [('customer', ASCENDING), ('environment', ASCENDING), ('dimension', ASCENDING), ('value', ASCENDING),
+                 ('severity', ASCENDING), ('status', ASCENDING)], {'unique': True}),
+    ('history', [('alertId', ASCENDING), ('updateTime', DESCENDING)], {}),
+    ('history', [('updateTime', DESCENDING)], {}),
+    ('customers', [('match', ASCENDING)], {}),
+    ('heartbeats', [('origin', ASCENDING), ('customer', ASCENDING)], {'unique': True}),
+    ('keys', [('key', ASCENDING)], {'unique': True}),
+    ('perms', [('match', ASCENDING)], {'unique': True}),
+    ('users', [('login', ASCENDING)], {'unique': True, 'partialFilterExpression': {'login': {'$type': 'string'}}}),
+    ('users', [('email', ASCENDING)], {'unique': True, 'partialFilterExpression': {'email': {'$type': 'string'}}}),
+    ('groups', [('name', ASCENDING)], {'unique': True}),
+    ('metrics', [('group', ASCENDING), ('name', ASCENDING)], {'unique': True})
+]
+
+# alert fields that rollup counts are keyed by
+ROLLUP_FIELDS = ['customer', 'environment', 'project', 'group', 'service', 'tags', 'severity', 'status']
+
 # See https://github.com/MongoEngine/flask-mongoengine/blob/master/flask_mongoengine/__init__.py
 # See https://github.com/dcrosta/flask-pymongo/blob/master/flask_pymongo/__init__.py
 
@@ -21,13 +55,26 @@ class Backend(Database):
     def create_engine(self, app, uri, dbname=None):
         self.uri = uri
         self.dbname = dbname
+        self.pool_config = dict(
+            minPoolSize=app.config['DATABASE_POOL_MIN_SIZE'],
+            maxPoolSize=app.config['DATABASE_POOL_MAX_SIZE'],
+            waitQueueTimeoutMS=app.config['DATABASE_POOL_TIMEOUT'] * 1000
+        )
+        self.history_table = app.config['HISTORY_TABLE']
+        if getattr(self, 'client', None):
+            self.client.close()
+        self.client = None
 
         db = self.connect()
         self._create_indexes(db)
         self._update_lookups(db)
 
     def connect(self):
-        self.client = MongoClient(self.uri)
+        # reuse client (and its connection pool) across requests, but not after a fork
+        if not self.client or self.client_pid != os.getpid():
+            self.pool_metrics = PoolMetrics(max_size=self.pool_config['maxPoolSize'])
+            self.client = MongoClient(self.uri, event_listeners=[self.pool_metrics], **self.pool_config)
+            self.client_pid = os.getpid()
         if self.dbname:
             return self.client[self.dbname]
         else:
@@ -35,28 +82,11 @@ class Backend(Database):
 
     @staticmethod
     def _create_indexes(db):
-        db.alerts.create_index(
-            [('environment', ASCENDING), ('customer', ASCENDING), ('resource', ASCENDING), ('event', ASCENDING)],
-            unique=True
-        )
-        db.alerts.create_index([('$**', TEXT)])
-
         db.customers.drop_indexes()  # FIXME: should only drop customers index if it's unique (ie. the old one)
-        db.customers.create_index([('match', ASCENDING)])
-
-        db.heartbeats.create_index([('origin', ASCENDING), ('customer', ASCENDING)], unique=True)
-
-        db.keys.create_index([('key', ASCENDING)], unique=True)
-
-        db.perms.create_index([('match', ASCENDING)], unique=True)
-
         db.users.drop_indexes()
-        db.users.create_index([('login', ASCENDING)], unique=True, partialFilterExpression={'login': {'$type': 'string'}})
-        db.users.create_index([('email', ASCENDING)], unique=True, partialFilterExpression={'email': {'$type': 'string'}})
 
-        db.groups.create_index([('name', ASCENDING)], unique=True)
-
-        db.metrics.create_index([('group', ASCENDING), ('name', ASCENDING)], unique=True)
+        for collection, keys, options in INDEXES:
+            db[collection].create_index(keys, **options)
 
     @staticmethod
     def _update_lookups(db):
@@ -89,13 +119,42 @@ class Backend(Database):
             return False
         return True
 
+    @property
+    def pool_stats(self):
+        return self.pool_metrics.stats
+
+    @property
+    def query_histograms(self):
+        return {}  # query timing is not recorded for MongoDB
+
     def close(self, db):
-        self.client.close()
+        pass  # connections are returned to the client connection pool
 
     def destroy(self):
         db = self.connect()
         self.client.drop_database(db.name)
 
+    def get_indexes(self):
+        """
+        Return (collection, name, state) for every index in the managed index set.
+        """
+        db = self.get_db()
+        indexes = []
+        for collection, keys, _ in INDEXES:
+            existing = [info['key'] for info in db[collection].index_information().values()]
+            if keys[0][1] == TEXT:
+                keys = [('_fts', 'text'), ('_ftsx', 1)]  # text indexes are stored by weights, not field names
+            name = '_'.join('{}_{}'.format(k, v) for k, v in keys)
+            indexes.append((collection, name, 'ok' if keys in existing else 'MISSING'))
+        return indexes
+
+    @staticmethod
+    def _id_prefix(id):
+        """
+        Return query for an alert id prefix, anchored so it can use the _id index.
+        """
+        return {'$regex': '^' + re.escape(id)}
+
     # ALERTS
 
     def get_severity(self, alert):
@@ -147,7 +206,7 @@ class Backend(Database):
             'severity': alert.severity,
             'customer': alert.customer
         }
-        return self.get_db().alerts.find_one(query)
+        return self._with_history(self.get_db().alerts.find_one(query))
 
     def is_correlated(self, alert):
         query = {
@@ -164,7 +223,30 @@ class Backend(Database):
                 }],
             'customer': alert.customer
         }
-        return self.get_db().alerts.find_one(query)
+        return self._with_history(self.get_db().alerts.find_one(query))
+
+    def is_duplicate_or_correlated(self, alert):
+        """
+        Return the duplicate alert, or the correlated alert if there is no duplicate.
+        """
+        query = {
+            'environment': alert.environment,
+            'resource': alert.resource,
+            '$or': [
+                {
+                    'event': alert.event
+                },
+                {
+                    'correlate': alert.event
+                }],
+            'customer': alert.customer
+        }
+        correlated = None
+        for doc in self.get_db().alerts.find(query):
+            if doc['event'] == alert.event and doc['severity'] == alert.severity:
+                return self._with_history(doc)
+            correlated = correlated or doc
+        return self._with_history(correlated)
 
     def is_flapping(self, alert, window=1800, count=2):
         """
@@ -177,7 +259,7 @@ class Backend(Database):
                 'event': alert.event,
                 'customer': alert.customer
             }},
-            {'$unwind': '$history'},
+            *self._unwind_history(),
             {'$match': {
                 'history.updateTime': {'$gt': datetime.utcnow() - timedelta(seconds=window)},
                 'history.type': 'severity'
@@ -203,6 +285,17 @@ class Backend(Database):
             'customer': alert.customer
         }
 
+        response = self.get_db().alerts.find_one_and_update(
+            query,
+            update=self._dedup_update(alert, history),
+            return_document=ReturnDocument.AFTER
+        )
+        if response and history:
+            self._append_history([(response['_id'], history)])
+        self._sync_rollups([response])
+        return self._with_history(response)
+
+    def _dedup_update(self, alert, history):
         now = datetime.utcnow()
         update = {
             '$set': {
@@ -214,7 +307,8 @@ class Backend(Database):
                 'rawData': alert.raw_data,
                 'repeat': True,
                 'lastReceiveId': alert.id,
-                'lastReceiveTime': now
+                'lastReceiveTime': now,
+                'changeTime': now
             },
             '$addToSet': {'tags': {'$each': alert.tags}},
             '$inc': {'duplicateCount': 1}
@@ -228,18 +322,8 @@ class Backend(Database):
             update['$set']['updateTime'] = alert.update_time
 
         if history:
-            update['$push'] = {
-                'history': {
-                    '$each': [history.serialize],
-                    '$slice': -abs(current_app.config['HISTORY_LIMIT'])
-                }
-            }
-
-        return self.get_db().alerts.find_one_and_update(
-            query,
-            update=update,
-            return_document=ReturnDocument.AFTER
-        )
+            self._push_history(update, [history])
+        return update
 
     # TODO(RylandCai): can project field be updated?
     def correlate_alert(self, alert, history):
@@ -262,6 +346,17 @@ class Backend(Database):
             'customer': alert.customer
         }
 
+        response = self.get_db().alerts.find_one_and_update(
+            query,
+            update=self._correlate_update(alert, history),
+            return_document=ReturnDocument.AFTER
+        )
+        if response:
+            self._append_history([(response['_id'], h) for h in history])
+        self._sync_rollups([response])
+        return self._with_history(response)
+
+    def _correlate_update(self, alert, history):
         update = {
             '$set': {
                 'event': alert.event,
@@ -279,16 +374,12 @@ class Backend(Database):
                 'trendIndication': alert.trend_indication,
                 'receiveTime': alert.receive_time,
                 'lastReceiveId': alert.last_receive_id,
-                'lastReceiveTime': alert.last_receive_time
+                'lastReceiveTime': alert.last_receive_time,
+                'changeTime': datetime.utcnow()
             },
-            '$addToSet': {'tags': {'$each': alert.tags}},
-            '$push': {
-                'history': {
-                    '$each': [h.serialize for h in history],
-                    '$slice': -abs(current_app.config['HISTORY_LIMIT'])
-                }
-            }
+            '$addToSet': {'tags': {'$each': alert.tags}}
         }
+        self._push_history(update, history)
 
         # only update those attributes that are specifically defined
         attributes = {'attributes.' + k: v for k, v in alert.attributes.items()}
@@ -296,16 +387,18 @@ class Backend(Database):
 
         if alert.update_time:
             update['$set']['updateTime'] = alert.update_time
+        return update
 
-        return self.get_db().alerts.find_one_and_update(
-            query,
-            update=update,
-            return_document=ReturnDocument.AFTER
-        )
+    def create_alert(self, alert):
+        data = self._alert_document(alert)
+        if self.get_db().alerts.insert_one(data).inserted_id == alert.id:
+            self._append_history([(alert.id, h) for h in alert.history])
+            self._sync_rollups([data])
+            return self._with_history(data)
 
     # TODO(RylandCai): 抽取model
-    def create_alert(self, alert):
-        data = {
+    def _alert_document(self, alert):
+        return {
             '_id': alert.id,
             'resource': alert.resource,
             'event': alert.event,
@@ -334,13 +427,86 @@ class Backend(Database):
             'lastReceiveId': alert.last_receive_id,
             'lastReceiveTime': alert.last_receive_time,
             'updateTime': alert.update_time,
-            'history': [h.serialize for h in alert.history]
+            'changeTime': datetime.utcnow(),
+            'history': [] if self.history_table else [h.serialize for h in alert.history]
         }
-        if self.get_db().alerts.insert_one(data).inserted_id == alert.id:
-            return data
+
+    def get_duplicates_or_correlated(self, alerts):
+        """
+        Return the duplicate or correlated alert (or None) for every alert in a batch using
+        a single query. Results are in the same order as the alerts.
+        """
+        query = {
+            '$or': [{
+                'environment': alert.environment,
+                'resource': alert.resource,
+                '$or': [
+                    {
+                        'event': alert.event
+                    },
+                    {
+                        'correlate': alert.event
+                    }],
+                'customer': alert.customer
+            } for alert in alerts]
+        }
+        candidates = defaultdict(list)
+        for doc in self.get_db().alerts.find(query):
+            candidates[(doc['environment'], doc['resource'], doc.get('customer'))].append(doc)
+
+        found = []
+        for alert in alerts:
+            correlated = None
+            for doc in candidates[(alert.environment, alert.resource, alert.customer)]:
+                if doc['event'] == alert.event and doc['severity'] == alert.severity:
+                    correlated = doc
+                    break
+                if doc['event'] == alert.event or alert.event in (doc.get('correlate') or []):
+                    correlated = correlated or doc
+            found.append(correlated)
+        return self._with_history(found)
+
+    def dedup_alerts(self, changes):
+        """
+        Same as dedup_alert() for a batch of (id, alert, history) tuples, where id is
+        the id of the duplicate alert, using a single bulk write.
+        """
+        requests = [UpdateOne({'_id': id}, self._dedup_update(alert, history)) for id, alert, history in changes]
+        return self._bulk_write_and_find(requests, [id for id, _, _ in changes],
+                                         [(id, history) for id, _, history in changes if history])
+
+    def correlate_alerts(self, changes):
+        """
+        Same as correlate_alert() for a batch of (id, alert, history) tuples, where id is
+        the id of the correlated alert, using a single bulk write.
+        """
+        requests = [UpdateOne({'_id': id}, self._correlate_update(alert, history)) for id, alert, history in changes]
+        return self._bulk_write_and_find(requests, [id for id, _, _ in changes],
+                                         [(id, h) for id, _, history in changes for h in history])
+
+    def create_alerts(self, alerts):
+        """
+        Same as create_alert() for a batch of alerts, using a single bulk write. Alerts that
+        could not be inserted (eg. created by another request since the lookup) are not returned.
+        """
+        requests = [InsertOne(self._alert_document(alert)) for alert in alerts]
+        return self._bulk_write_and_find(requests, [alert.id for alert in alerts],
+                                         [(alert.id, h) for alert in alerts for h in alert.history])
+
+    def _bulk_write_and_find(self, requests, ids, history):
+        failed = set()
+        try:
+            self.get_db().alerts.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            current_app.logger.warning('Batch write of alerts partially failed: {}'.format(e.details.get('writeErrors')))
+            failed = {ids[err['index']] for err in e.details.get('writeErrors', [])}
+        self._append_history([(id, h) for id, h in history if id not in failed])
+        docs = list(self.get_db().alerts.find({'_id': {'$in': ids}}))
+        self._sync_rollups(docs)
+        return self._with_history(docs)
 
     def set_alert(self, id, severity, status, tags, attributes, timeout, previous_severity, update_time, history=None):
-        query = {'_id': {'$regex': '^' + id}}
+        query = {'_id': self._id_prefix(id)}
 
         update = {
             '$set': {
@@ -349,33 +515,56 @@ class Backend(Database):
                 'attributes': attributes,
                 'timeout': timeout,
                 'previousSeverity': previous_severity,
-                'updateTime': update_time
+                'updateTime': update_time,
+                'changeTime': datetime.utcnow()
             },
-            '$addToSet': {'tags': {'$each': tags}},
-            '$push': {
-                'history': {
-                    '$each': [h.serialize for h in history],
-                    '$slice': -abs(current_app.config['HISTORY_LIMIT'])
-                }
-            }
+            '$addToSet': {'tags': {'$each': tags}}
         }
+        self._push_history(update, history)
 
-        return self.get_db().alerts.find_one_and_update(
+        response = self.get_db().alerts.find_one_and_update(
             query,
             update=update,
             return_document=ReturnDocument.AFTER
         )
+        if response:
+            self._append_history([(response['_id'], h) for h in history])
+        self._sync_rollups([response])
+        return self._with_history(response)
+
+    def set_alerts(self, changes):
+        """
+        Same as set_alert() for a batch of dicts of set_alert() arguments, using a single bulk write.
+        """
+        requests = list()
+        for c in changes:
+            update = {
+                '$set': {
+                    'severity': c['severity'],
+                    'status': c['status'],
+                    'attributes': c['attributes'],
+                    'timeout': c['timeout'],
+                    'previousSeverity': c['previous_severity'],
+                    'updateTime': c['update_time'],
+                    'changeTime': datetime.utcnow()
+                },
+                '$addToSet': {'tags': {'$each': c['tags']}}
+            }
+            self._push_history(update, c['history'])
+            requests.append(UpdateOne({'_id': c['id']}, update))
+        return self._bulk_write_and_find(requests, [c['id'] for c in changes],
+                                         [(c['id'], h) for c in changes for h in c['history']])
 
     def get_alert(self, id, customers=None):
         if len(id) == 8:
-            query = {'$or': [{'_id': {'$regex': '^' + id}}, {'lastReceiveId': {'$regex': '^' + id}}]}
+            query = {'$or': [{'_id': self._id_prefix(id)}, {'lastReceiveId': self._id_prefix(id)}]}
         else:
             query = {'$or': [{'_id': id}, {'lastReceiveId': id}]}
 
         if customers:
             query['customer'] = {'$in': customers}
 
-        return self.get_db().alerts.find_one(query)
+        return self._with_history(self.get_db().alerts.find_one(query))
 
     # STATUS, TAGS, ATTRIBUTES
 
@@ -383,37 +572,38 @@ class Backend(Database):
         """
         Set status and update history.
         """
-        query = {'_id': {'$regex': '^' + id}}
+        query = {'_id': self._id_prefix(id)}
 
         update = {
-            '$set': {'status': status, 'timeout': timeout, 'updateTime': update_time},
-            '$push': {
-                'history': {
-                    '$each': [history.serialize],
-                    '$slice': -abs(current_app.config['HISTORY_LIMIT'])
-                }
-            }
+            '$set': {'status': status, 'timeout': timeout, 'updateTime': update_time, 'changeTime': datetime.utcnow()}
         }
-        return self.get_db().alerts.find_one_and_update(
+        self._push_history(update, [history])
+        response = self.get_db().alerts.find_one_and_update(
             query,
             update=update,
             projection={'history': 0},
             return_document=ReturnDocument.AFTER
         )
+        if response:
+            self._append_history([(response['_id'], history)])
+        self._sync_rollups([response])
+        return response
 
     def tag_alert(self, id, tags):
         """
         Append tags to tag list. Don't add same tag more than once.
         """
         response = self.get_db().alerts.update_one(
-            {'_id': {'$regex': '^' + id}}, {'$addToSet': {'tags': {'$each': tags}}})
+            {'_id': self._id_prefix(id)}, self._changed({'$addToSet': {'tags': {'$each': tags}}}))
+        self._sync_rollups([self.get_db().alerts.find_one({'_id': self._id_prefix(id)})])
         return response.matched_count > 0
 
     def untag_alert(self, id, tags):
         """
         Remove tags from tag list.
         """
-        response = self.get_db().alerts.update_one({'_id': {'$regex': '^' + id}}, {'$pullAll': {'tags': tags}})
+        response = self.get_db().alerts.update_one({'_id': self._id_prefix(id)}, self._changed({'$pullAll': {'tags': tags}}))
+        self._sync_rollups([self.get_db().alerts.find_one({'_id': self._id_prefix(id)})])
         return response.matched_count > 0
 
     def update_attributes(self, id, old_attrs, new_attrs):
@@ -429,25 +619,46 @@ class Backend(Database):
             update['$unset'] = unset_value
 
         if update:
-            response = self.get_db().alerts.update_one({'_id': {'$regex': '^' + id}}, update=update)
+            response = self.get_db().alerts.update_one({'_id': self._id_prefix(id)}, update=self._changed(update))
             return response.matched_count > 0
 
     def delete_alert(self, id):
-        response = self.get_db().alerts.delete_one({'_id': {'$regex': '^' + id}})
-        return True if response.deleted_count == 1 else False
+        response = self.get_db().alerts.find_one_and_delete({'_id': self._id_prefix(id)}, projection={'_id': 1, 'customer': 1, 'rollup': 1})
+        if response:
+            self._add_tombstones([response])
+            self._inc_rollups([(response.get('rollup'), None)])
+        if response and self.history_table:
+            self.get_db().history.delete_many({'alertId': response['_id']})
+        return True if response else False
+
+    @staticmethod
+    def _changed(update):
+        update.setdefault('$set', {})['changeTime'] = datetime.utcnow()
+        return update
+
+    def _add_tombstones(self, deleted):
+        # remember deleted alerts for changed-since queries
+        if deleted:
+            now = datetime.utcnow()
+            self.get_db().tombstones.bulk_write([
+                UpdateOne({'_id': d['_id']}, {'$set': {'customer': d.get('customer'), 'deleteTime': now}}, upsert=True)
+                for d in deleted
+            ], ordered=False)
 
     # BULK
 
     def tag_alerts(self, query=None, tags=None):
         query = query or Query()
         updated = list(self.get_db().alerts.find(query.where, projection={'_id': 1}))
-        response = self.get_db().alerts.update(query.where, {'$addToSet': {'tags': {'$each': tags}}})
+        response = self.get_db().alerts.update(query.where, self._changed({'$addToSet': {'tags': {'$each': tags}}}))
+        self._sync_rollups(self.get_db().alerts.find({'_id': {'$in': [d['_id'] for d in updated]}}))
         return updated if response['n'] else []
 
     def untag_alerts(self, query=None, tags=None):
         query = query or Query()
         updated = list(self.get_db().alerts.find(query.where, projection={'_id': 1}))
-        response = self.get_db().alerts.update(query.where, {'$pullAll': {'tags': tags}})
+        response = self.get_db().alerts.update(query.where, self._changed({'$pullAll': {'tags': tags}}))
+        self._sync_rollups(self.get_db().alerts.find({'_id': {'$in': [d['_id'] for d in updated]}}))
         return updated if response['n'] else []
 
     def update_attributes_by_query(self, query=None, attributes=None):
@@ -461,28 +672,31 @@ class Backend(Database):
             update['$unset'] = unset_value
 
         updated = list(self.get_db().alerts.find(query.where, projection={'_id': 1}))
-        response = self.get_db().alerts.update_many(query.where, update=update)
+        response = self.get_db().alerts.update_many(query.where, update=self._changed(update))
         return updated if response.matched_count > 0 else []
 
     def delete_alerts(self, query=None):
         query = query or Query()
-        deleted = list(self.get_db().alerts.find(query.where, projection={'_id': 1}))
+        deleted = list(self.get_db().alerts.find(query.where, projection={'_id': 1, 'customer': 1, 'rollup': 1}))
         response = self.get_db().alerts.remove(query.where)
+        self._add_tombstones(deleted)
+        self._inc_rollups([(d.get('rollup'), None) for d in deleted])
+        if self.history_table:
+            self.get_db().history.delete_many({'alertId': {'$in': [d['_id'] for d in deleted]}})
         return deleted if response['n'] else []
 
     # SEARCH & HISTORY
 
     def add_history(self, id, history):
-        query = {'_id': {'$regex': '^' + id}}
+        query = {'_id': self._id_prefix(id)}
 
-        update = {
-            '$push': {
-                'history': {
-                    '$each': [history.serialize],
-                    '$slice': -abs(current_app.config['HISTORY_LIMIT'])
-                }
-            }
-        }
+        if self.history_table:
+            response = self.get_db().alerts.find_one(query, projection={'history': 0})
+            if response:
+                self._append_history([(response['_id'], history)])
+            return response
+
+        update = self._changed(self._push_history({}, [history]))
         return self.get_db().alerts.find_one_and_update(
             query,
             update=update,
@@ -490,9 +704,196 @@ class Backend(Database):
             return_document=ReturnDocument.AFTER
         )
 
-    def get_alerts(self, query=None, page=None, page_size=None):
+    def get_alerts(self, query=None, page=None, page_size=None, fields=None):
         query = query or Query()
-        pipeline = [
+        pipeline = self._codes_and_states() + [
+            {'$match': query.where},
+            {'$sort': {k: v for k, v in query.sort}},
+            {'$skip': (page - 1) * page_size},
+            {'$limit': page_size}
+        ]
+        if fields is not None:
+            pipeline.append({'$project': self._projection(fields)})
+        alerts = list(self.get_db().alerts.aggregate(pipeline))
+        return self._with_history(alerts) if fields is None or 'history' in fields else alerts
+
+    def get_alerts_by_ids(self, ids, query=None):
+        query = query or Query()
+        pipeline = self._codes_and_states() + [
+            {'$match': {'$and': [{'_id': {'$in': ids}}, query.where]}}
+        ]
+        return self._with_history(list(self.get_db().alerts.aggregate(pipeline)))
+
+    def get_alerts_changed_since(self, query=None, changed_since=None, customers=None, page_size=None, fields=None):
+        """
+        Return up to page_size alerts changed after "changed_since" in change order, ids of
+        alerts deleted since then, ids of alerts changed since then that no longer match the
+        query, the watermark to use as "changed_since" next time, and whether there are more
+        changes. Alerts changed at the same time as the last one are always returned together,
+        so that the watermark can move past them.
+
+        Change times are set when a row is written, not when it is committed, so the watermark
+        is never later than CHANGED_SINCE_OVERLAP seconds ago, even when paging. Alerts can be
+        returned again by the next request, so clients must de-duplicate them by id.
+        """
+        query = query or Query()
+        page_size = page_size or current_app.config['DEFAULT_PAGE_SIZE']
+        now = datetime.utcnow()
+        projection = self._projection(fields, required=['changeTime']) if fields is not None else None
+
+        alerts = list(self.get_db().alerts.find(
+            {'$and': [{'changeTime': {'$gt': changed_since}}, query.where]}, projection=projection
+        ).sort([('changeTime', ASCENDING), ('_id', ASCENDING)]).limit(page_size + 1))
+
+        overlap = now - timedelta(seconds=current_app.config['CHANGED_SINCE_OVERLAP'])
+        more = len(alerts) > page_size
+        if more:
+            last_change = alerts[page_size - 1]['changeTime']
+            changed = {'changeTime': {'$gt': changed_since, '$lte': last_change}}
+            alerts = list(self.get_db().alerts.find(
+                {'$and': [changed, query.where]}, projection=projection
+            ).sort([('changeTime', ASCENDING), ('_id', ASCENDING)]))
+            watermark = min(last_change, overlap)
+        else:
+            watermark = overlap
+            changed = {'changeTime': {'$gt': changed_since}}
+
+        # alerts that stopped matching, eg. acked alerts when polling for open alerts
+        stopped_matching = [changed, {'$nor': [query.where]}]
+        if customers:
+            stopped_matching.append({'customer': {'$in': customers}})
+        removed = [d['_id'] for d in self.get_db().alerts.find({'$and': stopped_matching}, projection={'_id': 1})]
+
+        tombstones = {'deleteTime': {'$gt': changed_since}}
+        if customers:
+            tombstones['customer'] = {'$in': customers}
+        deleted = [d['_id'] for d in self.get_db().tombstones.find(tombstones, projection={'_id': 1})]
+
+        if fields is None or 'history' in fields:
+            alerts = self._with_history(alerts)
+        return alerts, deleted, removed, watermark, more
+
+    def get_alert_changes(self, timeout=None):
+        """
+        Generate lists of alert changes from a change stream on the alerts collection,
+        which requires a replica set. Yields an empty list after "timeout" seconds
+        without changes.
+        """
+        pipeline = [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}}}]
+        max_await_time_ms = int(timeout * 1000) if timeout else None
+        with self.get_db().alerts.watch(pipeline, full_document='updateLookup', max_await_time_ms=max_await_time_ms) as stream:
+            while stream.alive:
+                changes = []
+                change = stream.try_next()
+                while change is not None:
+                    changes.append(self._alert_change(change))
+                    change = stream.try_next()
+                yield changes
+
+    # alert state sent with each change, because it may change again before it is sent
+    CHANGE_FIELDS = ['severity', 'status', 'previousSeverity', 'trendIndication', 'duplicateCount', 'repeat', 'value',
+                     'text', 'tags', 'timeout', 'lastReceiveId', 'lastReceiveTime', 'updateTime']
+
+    @classmethod
+    def _alert_change(cls, change):
+        op = change['operationType']
+        updated = {}
+        if op == 'insert':
+            kind = 'create'
+            updated = change.get('fullDocument') or {}
+        elif op == 'delete':
+            kind = 'delete'
+        else:
+            updated = change.get('updateDescription', {}).get('updatedFields', {})
+            if 'duplicateCount' in updated and updated['duplicateCount'] > 0:
+                kind = 'dedup'
+            elif 'lastReceiveId' in updated:
+                kind = 'correlate'
+            elif 'status' in updated:
+                kind = 'status'
+            elif any(f == 'tags' or f.startswith('tags.') for f in updated):
+                kind = 'tag'
+            else:
+                kind = 'update'
+        return {
+            'id': change['documentKey']['_id'],
+            'change': kind,
+            'customer': (change.get('fullDocument') or {}).get('customer'),
+            'alert': {f: DateTime.iso8601(v) if isinstance(v, datetime) else v for f, v in updated.items() if f in cls.CHANGE_FIELDS}
+        }
+
+    def get_alerts_and_counts(self, query=None, page=1, page_size=0, cursor=None, fields=None):
+        """
+        Return a page of alerts, severity and status counts of all matching alerts, and the
+        sort key of the last alert if there are more, using a single aggregation.
+        The page starts after the cursor, if given. If page_size is 0 only counts are returned.
+        Alerts only have the given fields, if any.
+        """
+        query = query or Query()
+        keys, seek = self._keyset(query.sort, '_id', cursor)
+        facets = {
+            'severity': [{'$group': {'_id': '$severity', 'count': {'$sum': 1}}}],
+            'status': [{'$group': {'_id': '$status', 'count': {'$sum': 1}}}]
+        }
+        if page_size:
+            facets['alerts'] = [
+                {'$match': seek},
+                {'$sort': {k: v for k, v in keys}},
+                {'$skip': (page - 1) * page_size},
+                {'$limit': page_size + 1}
+            ]
+            if fields is not None:
+                required = ['severity', 'status', 'lastReceiveTime'] + [k.split('.')[0] for k, _ in keys]
+                facets['alerts'].append({'$project': self._projection(fields, required)})
+        pipeline = (self._codes_and_states() if page_size else []) + [
+            {'$match': query.where},
+            {'$facet': facets}
+        ]
+        response = next(self.get_db().alerts.aggregate(pipeline, allowDiskUse=True))
+        alerts = response.get('alerts', [])
+        return (
+            self._with_history(alerts[:page_size]) if fields is None or 'history' in fields else alerts[:page_size],
+            {r['_id']: r['count'] for r in response['severity']},
+            {r['_id']: r['count'] for r in response['status']},
+            [self._get_field(alerts[page_size - 1], k) for k, _ in keys] if len(alerts) > page_size else None
+        )
+
+    @staticmethod
+    def _keyset(sort, id_field, cursor):
+        """
+        Return sort keys and seek condition for keyset pagination, where cursor is the
+        sort key of the last document of the previous page. Ties are ordered by id.
+        """
+        keys = list(sort)
+        same_direction = all(d == keys[0][1] for _, d in keys)
+        keys.append((id_field, keys[0][1] if keys and same_direction else ASCENDING))
+
+        if not cursor:
+            return keys, {}
+        if len(cursor) != len(keys):
+            raise ApiError('invalid cursor for sort order', 400)
+        return keys, {'$or': [
+            dict([(keys[j][0], cursor[j]) for j in range(i)] + [(keys[i][0], {'$gt' if keys[i][1] == ASCENDING else '$lt': cursor[i]})])
+            for i in range(len(keys))
+        ]}
+
+    @staticmethod
+    def _projection(fields, required=None):
+        """
+        Return projection of the given alert fields and required top-level fields.
+        """
+        return {('_id' if f == 'id' else f): 1 for f in {'id'} | set(fields) | set(required or [])}
+
+    @staticmethod
+    def _get_field(doc, path):
+        for name in path.split('.'):
+            doc = doc.get(name) if isinstance(doc, dict) else None
+        return doc
+
+    @staticmethod
+    def _codes_and_states():
+        # add severity code and status state, used for sorting
+        return [
             {'$lookup': {
                 'from': 'codes',
                 'localField': 'severity',
@@ -508,13 +909,8 @@ class Backend(Database):
                 'as': 'fromStates'
             }},
             {'$replaceRoot': {'newRoot': {'$mergeObjects': [{'$arrayElemAt': ['$fromStates', 0]}, '$$ROOT']}}},
-            {'$project': {'fromStates': 0}},
-            {'$match': query.where},
-            {'$sort': {k: v for k, v in query.sort}},
-            {'$skip': (page - 1) * page_size},
-            {'$limit': page_size}
+            {'$project': {'fromStates': 0}}
         ]
-        return self.get_db().alerts.aggregate(pipeline)
 
     def get_alert_history(self, alert, page=None, page_size=None):
         query = {
@@ -545,8 +941,8 @@ class Backend(Database):
         }
 
         pipeline = [
-            {'$unwind': '$history'},
             {'$match': query},
+            *self._unwind_history(),
             {'$project': fields},
             {'$sort': {'history.updateTime': -1}},
             {'$skip': (page - 1) * page_size},
@@ -581,8 +977,9 @@ class Backend(Database):
             )
         return history
 
-    def get_history(self, query=None, page=None, page_size=None):
+    def get_history(self, query=None, page=None, page_size=None, cursor=None):
         query = query or Query()
+        keys, seek = self._keyset([('history.updateTime', DESCENDING)], 'history.id', cursor)
         fields = {
             'resource': 1,
             'event': 1,
@@ -600,10 +997,11 @@ class Backend(Database):
         }
 
         pipeline = [
-            {'$unwind': '$history'},
+            *self._unwind_history(),
             {'$match': query.where},
+            {'$match': seek},
             {'$project': fields},
-            {'$sort': {'history.updateTime': -1}},
+            {'$sort': {k: v for k, v in keys}},
             {'$skip': (page - 1) * page_size},
             {'$limit': page_size},
         ]
@@ -636,6 +1034,70 @@ class Backend(Database):
             )
         return history
 
+    def _push_history(self, update, history):
+        """
+        Add history to an alert update, unless history is stored in its own collection.
+        """
+        if history and not self.history_table:
+            update['$push'] = {
+                'history': {
+                    '$each': [h.serialize for h in history],
+                    '$slice': -abs(current_app.config['HISTORY_LIMIT'])
+                }
+            }
+        return update
+
+    def _append_history(self, entries):
+        """
+        Insert (alert_id, history) entries into the history collection.
+        """
+        if self.history_table and entries:
+            self.get_db().history.insert_many([dict(h.serialize, alertId=alert_id) for alert_id, h in entries], ordered=False)
+
+    def _with_history(self, docs):
+        """
+        Attach the most recent history to alerts read from the alerts collection.
+        """
+        if not self.history_table or not docs:
+            return docs
+        many = isinstance(docs, list)
+        pipeline = [
+            {'$match': {'alertId': {'$in': [d['_id'] for d in (docs if many else [docs]) if d]}}},
+            {'$sort': {'updateTime': -1}},
+            {'$group': {'_id': '$alertId', 'history': {'$push': '$$ROOT'}}},
+            {'$project': {'history': {'$slice': ['$history', abs(current_app.config['HISTORY_LIMIT'])]}}}
+        ]
+        history = {r['_id']: r['history'][::-1] for r in self.get_db().history.aggregate(pipeline)}
+        for d in (docs if many else [docs]):
+            if d:
+                d['history'] = history.get(d['_id'], [])
+        return docs
+
+    def _unwind_history(self):
+        """
+        Return pipeline stages that output one document per alert history entry.
+        """
+        if self.history_table:
+            return [
+                {'$lookup': {
+                    'from': 'history',
+                    'localField': '_id',
+                    'foreignField': 'alertId',
+                    'as': 'history'
+                }},
+                {'$unwind': '$history'}
+            ]
+        return [{'$unwind': '$history'}]
+
+    def _delete_with_history(self, query):
+        deleted = list(self.get_db().alerts.find(query, projection={'_id': 1, 'customer': 1, 'rollup': 1}))
+        ids = [d['_id'] for d in deleted]
+        self.get_db().alerts.delete_many({'_id': {'$in': ids}})
+        if self.history_table:
+            self.get_db().history.delete_many({'alertId': {'$in': ids}})
+        self._add_tombstones(deleted)
+        self._inc_rollups([(d.get('rollup'), None) for d in deleted])
+
     # COUNTS
 
     def get_count(self, query=None):
@@ -709,7 +1171,7 @@ class Backend(Database):
         pipeline = [
             {'$match': query.where},
             {'$unwind': '$service'},
-            {'$unwind': '$history'},
+            *self._unwind_history(),
             {'$match': {'history.type': 'severity'}},
             {
                 '$group': {
@@ -936,6 +1398,94 @@ class Backend(Database):
             )
         return tags
 
+    # ROLLUPS
+
+    def get_rollups(self, dimension, customers=None):
+        """
+        Return (environment, value, severity, status, count) of alerts by environment and
+        one of project, service, group or tag (or nothing), from the rollups collection.
+        """
+        match = {'dimension': dimension}
+        if customers:
+            match['customer'] = {'$in': customers}
+        pipeline = [
+            {'$match': match},
+            {'$group': {
+                '_id': {'environment': '$environment', 'value': '$value', 'severity': '$severity', 'status': '$status'},
+                'count': {'$sum': '$count'}
+            }},
+            {'$match': {'count': {'$gt': 0}}},
+            {'$sort': {'_id.environment': 1, '_id.value': 1}}
+        ]
+        return [
+            (r['_id']['environment'], r['_id']['value'], r['_id']['severity'], r['_id']['status'], r['count'])
+            for r in self.get_db().rollups.aggregate(pipeline)
+        ]
+
+    def rebuild_rollups(self, batch_size=1000):
+        """
+        Recount rollups from all alerts. Alerts written while the rebuild runs may be
+        miscounted, so run it again if alerts were received meanwhile.
+        """
+        changes = []
+        requests = []
+        for doc in self.get_db().alerts.find({}, projection=ROLLUP_FIELDS):
+            key = self._rollup_key(doc)
+            changes.append((None, key))
+            requests.append(UpdateOne({'_id': doc['_id']}, {'$set': {'rollup': key}}))
+            if len(requests) >= batch_size:
+                self.get_db().alerts.bulk_write(requests, ordered=False)
+                requests = []
+        if requests:
+            self.get_db().alerts.bulk_write(requests, ordered=False)
+        self.get_db().rollups.delete_many({})
+        self._inc_rollups(changes)
+        return self.get_db().rollups.count_documents({})
+
+    @staticmethod
+    def _rollup_key(doc):
+        return {f: doc.get(f) for f in ROLLUP_FIELDS}
+
+    @staticmethod
+    def _rollup_counts(key, n):
+        dimensions = [('environment', None), ('project', key['project']), ('group', key['group'])]
+        dimensions += [('service', s) for s in key['service'] or []] + [('tag', t) for t in key['tags'] or []]
+        return [
+            ((key['customer'], key['environment'], dimension, value, key['severity'], key['status']), n)
+            for dimension, value in dimensions
+        ]
+
+    def _inc_rollups(self, changes):
+        # apply a list of (old key, new key) changes, where None means the alert was created or deleted
+        counts = defaultdict(int)
+        for old, new in changes:
+            for k, n in (self._rollup_counts(old, -1) if old else []) + (self._rollup_counts(new, 1) if new else []):
+                counts[k] += n
+        requests = [
+            UpdateOne(dict(zip(['customer', 'environment', 'dimension', 'value', 'severity', 'status'], k)), {'$inc': {'count': n}}, upsert=True)
+            for k, n in sorted(counts.items(), key=lambda c: [str(v) for v in c[0]]) if n
+        ]
+        if requests:
+            self.get_db().rollups.bulk_write(requests, ordered=False)
+
+    def _sync_rollups(self, docs):
+        """
+        Update rollups after alerts were written, using the rollup key each alert was last
+        counted with. The key is swapped first (compare-and-set) so that concurrent writers
+        of the same alert count each change once.
+        """
+        changes = []
+        for doc in docs:
+            while doc:
+                old, new = doc.get('rollup'), self._rollup_key(doc)
+                if old == new:
+                    break
+                if self.get_db().alerts.update_one({'_id': doc['_id'], 'rollup': old}, {'$set': {'rollup': new}}).modified_count:
+                    changes.append((old, new))
+                    break
+                doc = self.get_db().alerts.find_one({'_id': doc['_id']}, projection=ROLLUP_FIELDS + ['rollup'])
+        self._inc_rollups(changes)
+
     # BLACKOUTS
 
     def create_blackout(self, blackout):
@@ -974,9 +1524,16 @@ class Backend(Database):
 
         return self.get_db().blackouts.find_one(query)
 
-    def get_blackouts(self, query=None):
+    def get_blackouts(self, query=None, page=1, page_size=None, cursor=None):
         query = query or Query()
-        return self.get_db().blackouts.find(query.where)
+        keys, seek = self._keyset([], '_id', cursor)
+        blackouts = self.get_db().blackouts.find({'$and': [query.where, seek]}).sort(keys)
+        if page_size:
+            blackouts = blackouts.skip((page - 1) * page_size).limit(page_size)
+        return blackouts
+
+    def get_blackouts_ending_after(self, end_time):
+        return self.get_db().blackouts.find({'endTime': {'$gt': end_time}})
 
     def is_blackout_period(self, alert):
         query = dict()
@@ -1266,9 +1823,13 @@ class Backend(Database):
 
         return self.get_db().heartbeats.find_one(query)
 
-    def get_heartbeats(self, query=None):
+    def get_heartbeats(self, query=None, page=1, page_size=None, cursor=None):
         query = query or Query()
-        return self.get_db().heartbeats.find(query.where)
+        keys, seek = self._keyset([], '_id', cursor)
+        heartbeats = self.get_db().heartbeats.find({'$and': [query.where, seek]}).sort(keys)
+        if page_size:
+            heartbeats = heartbeats.skip((page - 1) * page_size).limit(page_size)
+        return heartbeats
 
     def delete_heartbeat(self, id):
         response = self.get_db().heartbeats.delete_one({'_id': {'$regex': '^' + id}})
@@ -1323,6 +1884,18 @@ class Backend(Database):
             }
         ).matched_count == 1
 
+    def update_keys_last_used(self, usage):
+        requests = [
+            UpdateOne(
+                {'$or': [{'key': key}, {'_id': key}]},
+                {
+                    '$max': {'lastUsedTime': last_used_time},
+                    '$inc': {'count': count}
+                }
+            ) for key, count, last_used_time in usage
+        ]
+        return self.get_db().keys.bulk_write(requests, ordered=False).matched_count
+
     # delete
     def delete_key(self, key):
         query = {'$or': [{'key': key}, {'_id': key}]}
@@ -1706,37 +2279,40 @@ class Backend(Database):
 
     # HOUSEKEEPING
 
-    def get_expired(self, expired_threshold, info_threshold):
+    def get_expired(self, after=None, limit=None):
+        # get list of alerts to be newly expired, ordered by id after "after"
+        pipeline = [
+            {'$match': {'status': {'$nin': ['expired']}, '_id': {'$gt': after or ''}}},
+            {'$addFields': {
+                'computedTimeout': {'$multiply': [{'$ifNull': ['$timeout', current_app.config['ALERT_TIMEOUT']]}, 1000]}
+            }},
+            {'$addFields': {
+                'isExpired': {'$lt': [{'$add': ['$lastReceiveTime', '$computedTimeout']}, datetime.utcnow()]}
+            }},
+            {'$match': {'isExpired': True, 'computedTimeout': {'$ne': 0}}},
+            {'$sort': {'_id': 1}},
+            {'$limit': limit or current_app.config['DEFAULT_PAGE_SIZE']}
+        ]
+        return self._with_history(list(self.get_db().alerts.aggregate(pipeline)))
+
+    def delete_expired(self, expired_threshold, info_threshold):
         # delete 'closed' or 'expired' alerts older than "expired_threshold" hours
         # and 'informational' alerts older than "info_threshold" hours
 
         if expired_threshold:
             expired_hours_ago = datetime.utcnow() - timedelta(hours=expired_threshold)
-            self.get_db().alerts.delete_many(
+            self._delete_with_history(
                 {'status': {'$in': ['closed', 'expired']}, 'lastReceiveTime': {'$lt': expired_hours_ago}})
 
         if info_threshold:
             info_hours_ago = datetime.utcnow() - timedelta(hours=info_threshold)
-            self.get_db().alerts.delete_many({'severity': 'informational', 'lastReceiveTime': {'$lt': info_hours_ago}})
+            self._delete_with_history({'severity': 'informational', 'lastReceiveTime': {'$lt': info_hours_ago}})
 
-        # get list of alerts to be newly expired
-        pipeline = [
-            {'$match': {'status': {'$nin': ['expired']}}},
-            {'$addFields': {
-                'computedTimeout': {'$multiply': [{'$ifNull': ['$timeout', current_app.config['ALERT_TIMEOUT']]}, 1000]}
-            }},
-            {'$addFields': {
-                'isExpired': {'$lt': [{'$add': ['$lastReceiveTime', '$computedTimeout']}, datetime.utcnow()]}
-            }},
-            {'$match': {'isExpired': True, 'computedTimeout': {'$ne': 0}}}
-        ]
-        return self.get_db().alerts.aggregate(pipeline)
-
-    def get_unshelve(self):
+    def get_unshelve(self, after=None, limit=None):
         # get list of alerts to be unshelved
         pipeline = [
-            {'$match': {'status': 'shelved'}},
-            {'$unwind': '$history'},
+            {'$match': {'status': 'shelved', '_id': {'$gt': after or ''}}},
+            *self._unwind_history(),
             {'$match': {
                 'history.type': 'shelve',
                 'history.status': 'shelved'
@@ -1778,15 +2354,17 @@ class Backend(Database):
             {'$addFields': {
                 'isExpired': {'$lt': [{'$add': ['$updateTime', '$computedTimeout']}, datetime.utcnow()]}
             }},
-            {'$match': {'isExpired': True, 'computedTimeout': {'$ne': 0}}}
+            {'$match': {'isExpired': True, 'computedTimeout': {'$ne': 0}}},
+            {'$sort': {'_id': 1}},
+            {'$limit': limit or current_app.config['DEFAULT_PAGE_SIZE']}
         ]
         return self.get_db().alerts.aggregate(pipeline)
 
-    def get_unack(self):
+    def get_unack(self, after=None, limit=None):
         # get list of alerts to be unack'ed
         pipeline = [
-            {'$match': {'status': 'ack'}},
-            {'$unwind': '$history'},
+            {'$match': {'status': 'ack', '_id': {'$gt': after or ''}}},
+            *self._unwind_history(),
             {'$match': {
                 'history.type': 'ack',
                 'history.status': 'ack'
@@ -1828,6 +2406,73 @@ class Backend(Database):
             {'$addFields': {
                 'isExpired': {'$lt': [{'$add': ['$updateTime', '$computedTimeout']}, datetime.utcnow()]}
             }},
-            {'$match': {'isExpired': True, 'computedTimeout': {'$ne': 0}}}
+            {'$match': {'isExpired': True, 'computedTimeout': {'$ne': 0}}},
+            {'$sort': {'_id': 1}},
+            {'$limit': limit or current_app.config['DEFAULT_PAGE_SIZE']}
         ]
         return self.get_db().alerts.aggregate(pipeline)
+
+    def acquire_lease(self, name, owner, ttl):
+        """
+        Take or renew the named lease for "ttl" seconds, unless it is held by another owner.
+        """
+        now = datetime.utcnow()
+        try:
+            self.get_db().leases.find_one_and_update(
+                {'_id': name, '$or': [{'owner': owner}, {'expireTime': {'$lt': now}}]},
+                {'$set': {'owner': owner, 'expireTime': now + timedelta(seconds=ttl)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False  # lease held by another owner
+        return True
+
+    def release_lease(self, name, owner):
+        return self.get_db().leases.delete_one({'_id': name, 'owner': owner}).deleted_count == 1
+
+    def prune_tombstones(self):
+        # forget deleted alerts older than "max_age" hours
+        max_age = current_app.config['DELETED_ALERTS_MAX_AGE']
+        if not max_age:
+            return 0
+        max_age_ago = datetime.utcnow() - timedelta(hours=max_age)
+        return self.get_db().tombstones.delete_many({'deleteTime': {'$lt': max_age_ago}}).deleted_count
+
+    def prune_history(self, batch_size=1000):
+        # delete history older than "max_age" days and all but the latest HISTORY_LIMIT entries of each alert
+        if not self.history_table:
+            return 0
+
+        count = 0
+        max_age = current_app.config['HISTORY_MAX_AGE']
+        if max_age:
+            max_age_ago = datetime.utcnow() - timedelta(days=max_age)
+            count += self.get_db().history.delete_many({'updateTime': {'$lt': max_age_ago}}).deleted_count
+
+        # only alerts with too much history are sorted, a batch of alerts at a time
+        limit = abs(current_app.config['HISTORY_LIMIT'])
+        pipeline = [
+            {'$group': {'_id': '$alertId', 'count': {'$sum': 1}}},
+            {'$match': {'count': {'$gt': limit}}}
+        ]
+        alert_ids = [r['_id'] for r in self.get_db().history.aggregate(pipeline, allowDiskUse=True)]
+
+        for i in range(0, len(alert_ids), batch_size):
+            pipeline = [
+                {'$match': {'alertId': {'$in': alert_ids[i:i + batch_size]}}},
+                {'$sort': {'updateTime': -1}},
+                {'$group': {'_id': '$alertId', 'ids': {'$push': '$_id'}}},
+                {'$project': {'ids': {'$slice': ['$ids', limit, {'$size': '$ids'}]}}}
+            ]
+            for r in self.get_db().history.aggregate(pipeline, allowDiskUse=True):
+                count += self.get_db().history.delete_many({'_id': {'$in': r['ids']}}).deleted_count
+        return count
+
+    def migrate_history(self, batch_size=1000):
+        # move history arrays of a batch of alerts into the history collection
+        count = 0
+        for doc in self.get_db().alerts.find({'history.0': {'$exists': True}}, projection={'history': 1}).limit(batch_size):
+            self.get_db().history.insert_many([dict(h, alertId=doc['_id']) for h in doc['history']], ordered=False)
+            self.get_db().alerts.update_one({'_id': doc['_id']}, {'$set': {'history': []}})
+            count += 1
+        return count
@@ -0,0 +1,72 @@
+import threading
+
+from pymongo.monitoring import ConnectionPoolListener
+
+
+class PoolMetrics(ConnectionPoolListener):
+    """
+    Track connection pool usage of a MongoClient so that it can be reported
+    the same way as the Postgres connection pool.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+        self.size = 0
+        self.in_use = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.discarded = 0
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'idle': self.size - self.in_use,
+                'in_use': self.in_use,
+                'max_size': self.max_size,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'discarded': self.discarded
+            }
+
+    def pool_created(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.size += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.size -= 1
+            if event.reason != 'poolClosed':
+                self.discarded += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            if event.reason == 'timeout':
+                self.timeouts += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
@@ -8,6 +8,7 @@ from werkzeug.datastructures import MultiDict
 
 from alerta.database.base import QueryBuilder
 from alerta.exceptions import ApiError
+from alerta.utils.cache import MISSING, TTLCache
 from alerta.utils.format import DateTime
 
 from .queryparser import QueryParser
@@ -15,21 +16,33 @@ from .queryparser import QueryParser
 Query = namedtuple('Query', ['where', 'sort', 'group'])
 Query.__new__.__defaults__ = ({}, {}, 'lastReceiveTime', 'status')  # type: ignore
 
+QUERY_CACHE_SIZE = 1024  # most recently used "q" queries kept parsed per process
+
 
 class QueryBuilderImpl(QueryBuilder):
 
+    query_cache = TTLCache(maxsize=QUERY_CACHE_SIZE)
+
+    @staticmethod
+    def parse_query(q, default_field=None, default_operator=None):
+        """
+        Return filter for "q", parsed once per distinct query. The filter is decoded
+        from JSON every time, so that callers can add to it.
+        """
+        key = (q, default_field, default_operator)
+        parsed = QueryBuilderImpl.query_cache.get(key)
+        if parsed is MISSING:
+            parsed = QueryParser().parse(query=q, default_field=default_field, default_operator=default_operator)
+            QueryBuilderImpl.query_cache.set(key, parsed)
+        return json.loads(parsed)
+
     @staticmethod
     def from_params(params: MultiDict, customers=None, query_time=None):
 
         # q
         if params.get('q', None):
             try:
-                parser = QueryParser()
-                query = json.loads(parser.parse(
-                    query=params['q'],
-                    default_field=params.get('q.df'),
-                    default_operator=params.get('q.op')
-                ))
+                query = QueryBuilderImpl.parse_query(params['q'], params.get('q.df'), params.get('q.op'))
             except ParseException as e:
                 raise ApiError('Failed to parse query string.', 400, [e])
         else:
@@ -92,7 +105,8 @@ class QueryBuilderImpl(QueryBuilder):
 
         EXCLUDE_QUERY = ['_', 'callback', 'token', 'api-key', 'q', 'q.df', 'q.op', 'id',
                          'from-date', 'to-date', 'duplicateCount', 'repeat', 'sort-by',
-                         'reverse', 'group-by', 'page', 'page-size', 'limit']
+                         'reverse', 'group-by', 'page', 'page-size', 'limit', 'cursor',
+                         'changed-since', 'fields']
         # fields
         for field in params:
             if field in EXCLUDE_QUERY:
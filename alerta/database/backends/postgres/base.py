@@ -1,23 +1,66 @@
+import json
+import logging
+import os
+import re
+import selectors
+import sys
 import time
 from collections import defaultdict, namedtuple
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import psycopg2
-from flask import current_app
-from psycopg2.extensions import AsIs, adapt, register_adapter
-from psycopg2.extras import Json, NamedTupleCursor, register_composite
+from flask import current_app, g
+from psycopg2.extensions import (ISOLATION_LEVEL_AUTOCOMMIT, AsIs, adapt,
+                                 register_adapter)
+from psycopg2.extras import (Json, NamedTupleCursor, execute_values,
+                             register_composite)
 
 from alerta.app import alarm_model
 from alerta.database.base import Database
-from alerta.exceptions import NoCustomerMatch
+from alerta.database.stats import QueryStats
+from alerta.exceptions import ApiError, NoCustomerMatch
 from alerta.models.enums import ADMIN_SCOPES
 from alerta.utils.format import DateTime
 from alerta.utils.response import absolute_url
 
+from .pool import ConnectionPool
 from .utils import Query
 
 MAX_RETRIES = 5
 
+# alerts table column for each alert field, as named in the alert body
+ALERT_COLUMNS = {
+    'id': 'id',
+    'resource': 'resource',
+    'event': 'event',
+    'environment': 'environment',
+    'project': 'project',
+    'severity': 'severity',
+    'correlate': 'correlate',
+    'status': 'status',
+    'service': 'service',
+    'group': '"group"',
+    'value': 'value',
+    'text': 'text',
+    'tags': 'tags',
+    'attributes': 'attributes',
+    'origin': 'origin',
+    'type': 'type',
+    'createTime': 'create_time',
+    'timeout': 'timeout',
+    'rawData': 'raw_data',
+    'customer': 'customer',
+    'duplicateCount': 'duplicate_count',
+    'repeat': 'repeat',
+    'previousSeverity': 'previous_severity',
+    'trendIndication': 'trend_indication',
+    'receiveTime': 'receive_time',
+    'lastReceiveId': 'last_receive_id',
+    'lastReceiveTime': 'last_receive_time',
+    'updateTime': 'update_time',
+    'history': 'history'
+}
+
 
 class HistoryAdapter:
     def __init__(self, history):
@@ -63,6 +106,20 @@ class Backend(Database):
     def create_engine(self, app, uri, dbname=None):
         self.uri = uri
         self.dbname = dbname
+        self.pool_config = dict(
+            min_size=app.config['DATABASE_POOL_MIN_SIZE'],
+            max_size=app.config['DATABASE_POOL_MAX_SIZE'],
+            timeout=app.config['DATABASE_POOL_TIMEOUT'],
+            pre_ping=app.config['DATABASE_POOL_PRE_PING']
+        )
+        if getattr(self, '_pool', None):
+            self._pool.closeall()
+        self._pool = None
+        self.query_stats = QueryStats(
+            timing=app.config['DATABASE_QUERY_TIMING'],
+            slow_query_threshold=app.config['DATABASE_SLOW_QUERY_THRESHOLD']
+        )
+        self.history_table = app.config['HISTORY_TABLE']
 
         conn = self.connect()
         with app.open_resource('sql/schema.sql') as f:
@@ -106,6 +163,26 @@ class Backend(Database):
         else:
             raise RuntimeError('Database connect error. Failed to connect after {} retries.'.format(MAX_RETRIES))
 
+    @property
+    def pool(self):
+        # connections must not be shared with a parent process after a fork
+        if not getattr(self, '_pool', None) or self._pool.pid != os.getpid():
+            self._pool = ConnectionPool(self.connect, **self.pool_config)
+        return self._pool
+
+    @property
+    def pool_stats(self):
+        return self.pool.stats
+
+    @property
+    def query_histograms(self):
+        return self.query_stats.histograms
+
+    def get_db(self):
+        if 'db' not in g:
+            g.db = self.pool.getconn()
+        return g.db
+
     @staticmethod
     def _adapt_datetime(dt):
         return AsIs('%s' % adapt(DateTime.iso8601(dt)))
@@ -129,12 +206,12 @@ class Backend(Database):
         return cursor.fetchone()
 
     def close(self, db):
-        db.close()
+        self.pool.putconn(db)
 
     def destroy(self):
         conn = self.connect()
         cursor = conn.cursor()
-        for table in ['alerts', 'blackouts', 'customers', 'groups', 'heartbeats', 'keys', 'metrics', 'perms', 'users']:
+        for table in ['alert_history', 'alert_rollups', 'alert_tombstones', 'alerts', 'blackouts', 'customers', 'groups', 'heartbeats', 'keys', 'leases', 'metrics', 'perms', 'users']:
             cursor.execute('DROP TABLE IF EXISTS %s' % table)
         conn.commit()
         conn.close()
@@ -149,7 +226,7 @@ class Backend(Database):
                 OR (event!=%(event)s AND %(event)s=ANY(correlate)))
                AND {customer}
             """.format(customer='customer=%(customer)s' if alert.customer else 'customer IS NULL')
-        return self._fetchone(select, vars(alert)).severity
+        return self._fetchone(select, alert.vars).severity
 
     def get_status(self, alert):
         select = """
@@ -158,7 +235,7 @@ class Backend(Database):
               AND (event=%(event)s OR %(event)s=ANY(correlate))
               AND {customer}
             """.format(customer='customer=%(customer)s' if alert.customer else 'customer IS NULL')
-        return self._fetchone(select, vars(alert)).status
+        return self._fetchone(select, alert.vars).status
 
     def is_duplicate(self, alert):
         select = """
@@ -169,7 +246,7 @@ class Backend(Database):
                AND severity=%(severity)s
                AND {customer}
             """.format(customer='customer=%(customer)s' if alert.customer else 'customer IS NULL')
-        return self._fetchone(select, vars(alert))
+        return self._with_history(self._fetchone(select, alert.vars))
 
     def is_correlated(self, alert):
         select = """
@@ -179,7 +256,22 @@ class Backend(Database):
                 OR (event!=%(event)s AND %(event)s=ANY(correlate)))
                AND {customer}
         """.format(customer='customer=%(customer)s' if alert.customer else 'customer IS NULL')
-        return self._fetchone(select, vars(alert))
+        return self._with_history(self._fetchone(select, alert.vars))
+
+    def is_duplicate_or_correlated(self, alert):
+        """
+        Return the duplicate alert, or the correlated alert if there is no duplicate, using
+        a single lookup on the environment-resource-event-customer index.
+        """
+        select = """
+            SELECT * FROM alerts
+             WHERE environment=%(environment)s AND resource=%(resource)s
+               AND (event=%(event)s OR %(event)s=ANY(correlate))
+               AND {customer}
+          ORDER BY (event=%(event)s AND severity=%(severity)s) DESC
+             LIMIT 1
+        """.format(customer='customer=%(customer)s' if alert.customer else 'customer IS NULL')
+        return self._with_history(self._fetchone(select, alert.vars))
 
     def is_flapping(self, alert, window=1800, count=2):
         """
@@ -187,15 +279,19 @@ class Backend(Database):
         """
         select = """
             SELECT COUNT(*)
-              FROM alerts, unnest(history) h
+              FROM {history}
              WHERE environment=%(environment)s
                AND resource=%(resource)s
                AND h.event=%(event)s
                AND h.update_time > (NOW() at time zone 'utc' - INTERVAL '{window} seconds')
                AND h.type='severity'
                AND {customer}
-        """.format(window=window, customer='customer=%(customer)s' if alert.customer else 'customer IS NULL')
-        return self._fetchone(select, vars(alert)).count > count
+        """.format(
+            history=self._history_from('alerts', 'alerts'),
+            window=window,
+            customer='customer=%(customer)s' if alert.customer else 'customer IS NULL'
+        )
+        return self._fetchone(select, alert.vars).count > count
 
     def dedup_alert(self, alert, history):
         """
@@ -209,7 +305,7 @@ class Backend(Database):
                    timeout=%(timeout)s, raw_data=%(raw_data)s, repeat=%(repeat)s,
                    last_receive_id=%(last_receive_id)s, last_receive_time=%(last_receive_time)s,
                    tags=ARRAY(SELECT DISTINCT UNNEST(tags || %(tags)s)), attributes=attributes || %(attributes)s,
-                   duplicate_count=duplicate_count + 1, {update_time}, history=(%(history)s || history)[1:{limit}]
+                   duplicate_count=duplicate_count + 1, {update_time}, {history}
              WHERE environment=%(environment)s
                AND resource=%(resource)s
                AND event=%(event)s
@@ -217,11 +313,11 @@ class Backend(Database):
                AND {customer}
          RETURNING *
         """.format(
-            limit=current_app.config['HISTORY_LIMIT'],
+            history=self._history_update('%(history)s'),
             update_time='update_time=%(update_time)s' if alert.update_time else 'update_time=update_time',
             customer='customer=%(customer)s' if alert.customer else 'customer IS NULL'
         )
-        return self._updateone(update, vars(alert), returning=True)
+        return self._updatealert(update, alert.vars, history)
 
     def correlate_alert(self, alert, history):
         alert.history = history
@@ -232,18 +328,18 @@ class Backend(Database):
                    duplicate_count=%(duplicate_count)s, repeat=%(repeat)s, previous_severity=%(previous_severity)s,
                    trend_indication=%(trend_indication)s, receive_time=%(receive_time)s, last_receive_id=%(last_receive_id)s,
                    last_receive_time=%(last_receive_time)s, tags=ARRAY(SELECT DISTINCT UNNEST(tags || %(tags)s)),
-                   attributes=attributes || %(attributes)s, {update_time}, history=(%(history)s || history)[1:{limit}]
+                   attributes=attributes || %(attributes)s, {update_time}, {history}
              WHERE environment=%(environment)s
                AND resource=%(resource)s
                AND ((event=%(event)s AND severity!=%(severity)s) OR (event!=%(event)s AND %(event)s=ANY(correlate)))
                AND {customer}
          RETURNING *
         """.format(
-            limit=current_app.config['HISTORY_LIMIT'],
+            history=self._history_update('%(history)s'),
             update_time='update_time=%(update_time)s' if alert.update_time else 'update_time=update_time',
             customer='customer=%(customer)s' if alert.customer else 'customer IS NULL'
         )
-        return self._updateone(update, vars(alert), returning=True)
+        return self._updatealert(update, alert.vars, history)
 
     # TODO(RylandCai): 这种做法 增删字段 每条sql都给改...
     def create_alert(self, alert):
@@ -259,58 +355,186 @@ class Backend(Database):
                 %(last_receive_time)s, %(update_time)s, %(history)s::history[])
             RETURNING *
         """
-        return self._insert(insert, vars(alert))
+        return self._updatealert(insert, {**alert.vars, 'history': self._history_column(alert.history)}, alert.history)
+
+    def get_duplicates_or_correlated(self, alerts):
+        """
+        Return the duplicate or correlated alert (or None) for every alert in a batch using
+        a single lookup. Results are in the same order as the alerts.
+        """
+        select = """
+            SELECT DISTINCT ON (b.idx) b.idx, a.*
+              FROM unnest(%(idx)s::integer[], %(environment)s::text[], %(resource)s::text[], %(event)s::text[],
+                          %(severity)s::text[], %(customer)s::text[]) AS b(idx, environment, resource, event, severity, customer)
+              JOIN alerts a
+                ON a.environment=b.environment AND a.resource=b.resource
+               AND (a.event=b.event OR b.event=ANY(a.correlate))
+               AND COALESCE(a.customer, '')=COALESCE(b.customer, '')
+          ORDER BY b.idx, (a.event=b.event AND a.severity=b.severity) DESC
+        """
+        vars = {
+            'idx': list(range(len(alerts))),
+            'environment': [a.environment for a in alerts],
+            'resource': [a.resource for a in alerts],
+            'event': [a.event for a in alerts],
+            'severity': [a.severity for a in alerts],
+            'customer': [a.customer for a in alerts]
+        }
+        found = {r.idx: r for r in self._with_history(self._fetchall(select, vars, limit=len(alerts)))}
+        return [found.get(i) for i in range(len(alerts))]
+
+    def dedup_alerts(self, changes):
+        """
+        Same as dedup_alert() for a batch of (id, alert, history) tuples, where id is
+        the id of the duplicate alert, using a single statement.
+        """
+        update = """
+            UPDATE alerts
+               SET status=v.status, service=v.service, value=v.value, text=v.text,
+                   timeout=v.timeout, raw_data=v.raw_data, repeat=v.repeat,
+                   last_receive_id=v.last_receive_id, last_receive_time=v.last_receive_time,
+                   tags=ARRAY(SELECT DISTINCT UNNEST(alerts.tags || v.tags)), attributes=alerts.attributes || v.attributes,
+                   duplicate_count=alerts.duplicate_count + 1, update_time=COALESCE(v.update_time, alerts.update_time),
+                   {history}
+              FROM (VALUES %s) AS v(id, status, service, value, text, timeout, raw_data, repeat, last_receive_id,
+                   last_receive_time, tags, attributes, update_time, history)
+             WHERE alerts.id=v.id
+         RETURNING alerts.*
+        """.format(history=self._history_update('v.history', 'alerts.history'))
+        template = """
+            (%(match_id)s, %(status)s::text, %(service)s::text[], %(value)s::text, %(text)s::text, %(timeout)s::integer,
+             %(raw_data)s::text, %(repeat)s::boolean, %(last_receive_id)s::text, %(last_receive_time)s::timestamp,
+             %(tags)s::text[], %(attributes)s::jsonb, %(update_time)s::timestamp, %(history)s::history[])
+        """
+        argslist = [{**alert.vars, 'match_id': id, 'history': self._history_column(history)}
+                    for id, alert, history in changes]
+        return self._updatealerts(update, argslist, template, {id: history for id, _, history in changes})
+
+    def correlate_alerts(self, changes):
+        """
+        Same as correlate_alert() for a batch of (id, alert, history) tuples, where id is
+        the id of the correlated alert, using a single statement.
+        """
+        update = """
+            UPDATE alerts
+               SET event=v.event, severity=v.severity, status=v.status, service=v.service, value=v.value,
+                   text=v.text, create_time=v.create_time, timeout=v.timeout, raw_data=v.raw_data,
+                   duplicate_count=v.duplicate_count, repeat=v.repeat, previous_severity=v.previous_severity,
+                   trend_indication=v.trend_indication, receive_time=v.receive_time, last_receive_id=v.last_receive_id,
+                   last_receive_time=v.last_receive_time, tags=ARRAY(SELECT DISTINCT UNNEST(alerts.tags || v.tags)),
+                   attributes=alerts.attributes || v.attributes, update_time=COALESCE(v.update_time, alerts.update_time),
+                   {history}
+              FROM (VALUES %s) AS v(id, event, severity, status, service, value, text, create_time, timeout, raw_data,
+                   duplicate_count, repeat, previous_severity, trend_indication, receive_time, last_receive_id,
+                   last_receive_time, tags, attributes, update_time, history)
+             WHERE alerts.id=v.id
+         RETURNING alerts.*
+        """.format(history=self._history_update('v.history', 'alerts.history'))
+        template = """
+            (%(match_id)s, %(event)s::text, %(severity)s::text, %(status)s::text, %(service)s::text[], %(value)s::text,
+             %(text)s::text, %(create_time)s::timestamp, %(timeout)s::integer, %(raw_data)s::text,
+             %(duplicate_count)s::integer, %(repeat)s::boolean, %(previous_severity)s::text, %(trend_indication)s::text,
+             %(receive_time)s::timestamp, %(last_receive_id)s::text, %(last_receive_time)s::timestamp, %(tags)s::text[],
+             %(attributes)s::jsonb, %(update_time)s::timestamp, %(history)s::history[])
+        """
+        argslist = [{**alert.vars, 'match_id': id, 'history': self._history_column(history)}
+                    for id, alert, history in changes]
+        return self._updatealerts(update, argslist, template, {id: history for id, _, history in changes})
+
+    def create_alerts(self, alerts):
+        """
+        Same as create_alert() for a batch of alerts, using a single statement. Alerts that were
+        created by another request since the lookup are skipped and not returned.
+        """
+        insert = """
+            INSERT INTO alerts (id, resource, event, environment, project, severity, correlate, status, service,
+                "group", value, text, tags, attributes, origin, type, create_time, timeout, raw_data, customer,
+                duplicate_count, repeat, previous_severity, trend_indication, receive_time, last_receive_id,
+                last_receive_time, update_time, history)
+            VALUES %s
+            ON CONFLICT DO NOTHING
+            RETURNING *
+        """
+        template = """
+            (%(id)s, %(resource)s, %(event)s, %(environment)s, %(project)s, %(severity)s, %(correlate)s,
+             %(status)s, %(service)s, %(group)s, %(value)s, %(text)s, %(tags)s, %(attributes)s, %(origin)s,
+             %(event_type)s, %(create_time)s, %(timeout)s, %(raw_data)s, %(customer)s, %(duplicate_count)s,
+             %(repeat)s, %(previous_severity)s, %(trend_indication)s, %(receive_time)s, %(last_receive_id)s,
+             %(last_receive_time)s, %(update_time)s, %(history)s::history[])
+        """
+        argslist = [{**alert.vars, 'history': self._history_column(alert.history)} for alert in alerts]
+        return self._updatealerts(insert, argslist, template, {alert.id: alert.history for alert in alerts})
 
     def set_alert(self, id, severity, status, tags, attributes, timeout, previous_severity, update_time, history=None):
         update = """
             UPDATE alerts
                SET severity=%(severity)s, status=%(status)s, tags=ARRAY(SELECT DISTINCT UNNEST(tags || %(tags)s)),
                    attributes=%(attributes)s, timeout=%(timeout)s, previous_severity=%(previous_severity)s,
-                   update_time=%(update_time)s, history=(%(change)s || history)[1:{limit}]
-             WHERE id=%(id)s OR id LIKE %(like_id)s
+                   update_time=%(update_time)s, {history}
+             WHERE id=%(id)s OR lower(id) LIKE %(like_id)s
          RETURNING *
-        """.format(limit=current_app.config['HISTORY_LIMIT'])
-        return self._updateone(update, {'id': id, 'like_id': id + '%', 'severity': severity, 'status': status,
-                                        'tags': tags, 'attributes': attributes, 'timeout': timeout,
-                                        'previous_severity': previous_severity, 'update_time': update_time,
-                                        'change': history}, returning=True)
+        """.format(history=self._history_update('%(change)s'))
+        return self._updatealert(update, {'id': id, 'like_id': self._id_prefix(id), 'severity': severity, 'status': status,
+                                          'tags': tags, 'attributes': attributes, 'timeout': timeout,
+                                          'previous_severity': previous_severity, 'update_time': update_time,
+                                          'change': history}, history)
+
+    def set_alerts(self, changes):
+        """
+        Same as set_alert() for a batch of dicts of set_alert() arguments, using a single statement.
+        """
+        update = """
+            UPDATE alerts
+               SET severity=v.severity, status=v.status, tags=ARRAY(SELECT DISTINCT UNNEST(alerts.tags || v.tags)),
+                   attributes=v.attributes, timeout=v.timeout, previous_severity=v.previous_severity,
+                   update_time=v.update_time, {history}
+              FROM (VALUES %s) AS v(id, severity, status, tags, attributes, timeout, previous_severity, update_time, history)
+             WHERE alerts.id=v.id
+         RETURNING alerts.*
+        """.format(history=self._history_update('v.history', 'alerts.history'))
+        template = """
+            (%(id)s, %(severity)s::text, %(status)s::text, %(tags)s::text[], %(attributes)s::jsonb, %(timeout)s::integer,
+             %(previous_severity)s::text, %(update_time)s::timestamp, %(history)s::history[])
+        """
+        argslist = [{**c, 'history': self._history_column(c['history'])} for c in changes]
+        return self._updatealerts(update, argslist, template, {c['id']: c['history'] for c in changes})
 
     def get_alert(self, id, customers=None):
         select = """
             SELECT * FROM alerts
-             WHERE (id ~* (%(id)s) OR last_receive_id ~* (%(id)s))
+             WHERE (lower(id) LIKE %(like_id)s OR lower(last_receive_id) LIKE %(like_id)s)
                AND {customer}
         """.format(customer='customer=ANY(%(customers)s)' if customers else '1=1')
-        return self._fetchone(select, {'id': '^' + id, 'customers': customers})
+        return self._with_history(self._fetchone(select, {'like_id': self._id_prefix(id), 'customers': customers}))
 
     # STATUS, TAGS, ATTRIBUTES
 
     def set_status(self, id, status, timeout, update_time, history=None):
         update = """
             UPDATE alerts
-            SET status=%(status)s, timeout=%(timeout)s, update_time=%(update_time)s, history=(%(change)s || history)[1:{limit}]
-            WHERE id=%(id)s OR id LIKE %(like_id)s
+            SET status=%(status)s, timeout=%(timeout)s, update_time=%(update_time)s, {history}
+            WHERE id=%(id)s OR lower(id) LIKE %(like_id)s
             RETURNING *
-        """.format(limit=current_app.config['HISTORY_LIMIT'])
-        return self._updateone(update, {'id': id, 'like_id': id + '%', 'status': status, 'timeout': timeout, 'update_time': update_time, 'change': history}, returning=True)
+        """.format(history=self._history_update('%(change)s'))
+        return self._updatealert(update, {'id': id, 'like_id': self._id_prefix(id), 'status': status, 'timeout': timeout, 'update_time': update_time, 'change': history}, history)
 
     def tag_alert(self, id, tags):
         update = """
             UPDATE alerts
             SET tags=ARRAY(SELECT DISTINCT UNNEST(tags || %(tags)s))
-            WHERE id=%(id)s OR id LIKE %(like_id)s
+            WHERE id=%(id)s OR lower(id) LIKE %(like_id)s
             RETURNING *
         """
-        return self._updateone(update, {'id': id, 'like_id': id + '%', 'tags': tags}, returning=True)
+        return self._with_history(self._updateone(update, {'id': id, 'like_id': self._id_prefix(id), 'tags': tags}, returning=True))
 
     def untag_alert(self, id, tags):
         update = """
             UPDATE alerts
             SET tags=(select array_agg(t) FROM unnest(tags) AS t WHERE NOT t=ANY(%(tags)s) )
-            WHERE id=%(id)s OR id LIKE %(like_id)s
+            WHERE id=%(id)s OR lower(id) LIKE %(like_id)s
             RETURNING *
         """
-        return self._updateone(update, {'id': id, 'like_id': id + '%', 'tags': tags}, returning=True)
+        return self._with_history(self._updateone(update, {'id': id, 'like_id': self._id_prefix(id), 'tags': tags}, returning=True))
 
     def update_attributes(self, id, old_attrs, new_attrs):
         old_attrs.update(new_attrs)
@@ -318,18 +542,18 @@ class Backend(Database):
         update = """
             UPDATE alerts
             SET attributes=%(attrs)s
-            WHERE id=%(id)s OR id LIKE %(like_id)s
+            WHERE id=%(id)s OR lower(id) LIKE %(like_id)s
             RETURNING *
         """
-        return self._updateone(update, {'id': id, 'like_id': id + '%', 'attrs': attrs}, returning=True)
+        return self._with_history(self._updateone(update, {'id': id, 'like_id': self._id_prefix(id), 'attrs': attrs}, returning=True))
 
     def delete_alert(self, id):
         delete = """
             DELETE FROM alerts
-            WHERE id=%(id)s OR id LIKE %(like_id)s
+            WHERE id=%(id)s OR lower(id) LIKE %(like_id)s
             RETURNING id
         """
-        return self._deleteone(delete, {'id': id, 'like_id': id + '%'}, returning=True)
+        return self._deleteone(delete, {'id': id, 'like_id': self._id_prefix(id)}, returning=True)
 
     # BULK
 
@@ -376,14 +600,241 @@ class Backend(Database):
     def add_history(self, id, history):
         update = """
             UPDATE alerts
-               SET history=(%(history)s || history)[1:{limit}]
-             WHERE id=%(id)s OR id LIKE %(like_id)s
+               SET {history}
+             WHERE id=%(id)s OR lower(id) LIKE %(like_id)s
          RETURNING *
-        """.format(limit=current_app.config['HISTORY_LIMIT'])
-        return self._updateone(update, {'id': id, 'like_id': id + '%', 'history': history}, returning=True)
+        """.format(history=self._history_update('%(history)s'))
+        return self._updatealert(update, {'id': id, 'like_id': self._id_prefix(id), 'history': history}, history)
 
-    def get_alerts(self, query=None, page=None, page_size=None):
+    def get_alerts(self, query=None, page=None, page_size=None, fields=None):
         query = query or Query()
+        select = """
+            SELECT {columns}
+              FROM alerts {join}
+             WHERE {where}
+          ORDER BY {order}
+        """.format(
+            columns=self._alert_columns(fields),
+            join=self._sort_join(query),
+            where=query.where,
+            order=query.sort or 'last_receive_time'
+        )
+        alerts = self._fetchall(select, query.vars, limit=page_size, offset=(page - 1) * page_size)
+        return self._with_history(alerts) if fields is None or 'history' in fields else alerts
+
+    def get_alerts_by_ids(self, ids, query=None):
+        query = query or Query()
+        select = """
+            SELECT *
+              FROM alerts
+             WHERE id=ANY(%(changed_ids)s) AND {where}
+        """.format(where=query.where)
+        return self._with_history(self._fetchall(select, dict(query.vars, changed_ids=ids), limit='ALL'))
+
+    def get_alerts_changed_since(self, query=None, changed_since=None, customers=None, page_size=None, fields=None):
+        """
+        Return up to page_size alerts changed after "changed_since" in change order, ids of
+        alerts deleted since then, ids of alerts changed since then that no longer match the
+        query, the watermark to use as "changed_since" next time, and whether there are more
+        changes. Alerts changed at the same time as the last one are always returned together,
+        so that the watermark can move past them.
+
+        Change times are set when a row is written, not when it is committed, so the watermark
+        is never later than CHANGED_SINCE_OVERLAP seconds ago, even when paging. Alerts can be
+        returned again by the next request, so clients must de-duplicate them by id.
+        """
+        query = query or Query()
+        page_size = page_size or current_app.config['DEFAULT_PAGE_SIZE']
+        now = self._fetchone("SELECT timezone('utc', clock_timestamp()) AS now", {}).now
+
+        # pass timestamps as strings because the datetime adapter truncates to milliseconds
+        vars = dict(query.vars, changed_since=changed_since.isoformat())
+        columns = self._alert_columns(fields, required=['change_time'])
+        select = """
+            SELECT {columns}
+              FROM alerts
+             WHERE change_time > %(changed_since)s AND {where}
+          ORDER BY change_time, id
+        """.format(columns=columns, where=query.where)
+        alerts = self._fetchall(select, vars, limit=page_size + 1)
+
+        overlap = now - timedelta(seconds=current_app.config['CHANGED_SINCE_OVERLAP'])
+        more = len(alerts) > page_size
+        if more:
+            last_change = alerts[page_size - 1].change_time
+            vars['last_change'] = last_change.isoformat()
+            changed = 'change_time > %(changed_since)s AND change_time <= %(last_change)s'
+            select = """
+                SELECT {columns}
+                  FROM alerts
+                 WHERE {changed} AND {where}
+              ORDER BY change_time, id
+            """.format(columns=columns, changed=changed, where=query.where)
+            alerts = self._fetchall(select, vars, limit='ALL')
+            watermark = min(last_change, overlap)
+        else:
+            watermark = overlap
+            changed = 'change_time > %(changed_since)s'
+
+        # alerts that stopped matching, eg. acked alerts when polling for open alerts
+        select = """
+            SELECT id
+              FROM alerts
+             WHERE {changed} AND ({where}) IS NOT TRUE AND {customer}
+        """.format(changed=changed, where=query.where, customer='customer=ANY(%(customers)s)' if customers else '1=1')
+        removed = [r.id for r in self._fetchall(select, dict(vars, customers=customers), limit='ALL')]
+
+        select = """
+            SELECT id
+              FROM alert_tombstones
+             WHERE delete_time > %(changed_since)s AND {customer}
+        """.format(customer='customer=ANY(%(customers)s)' if customers else '1=1')
+        deleted = [r.id for r in self._fetchall(select, {'changed_since': vars['changed_since'], 'customers': customers}, limit='ALL')]
+
+        if fields is None or 'history' in fields:
+            alerts = self._with_history(alerts)
+        return alerts, deleted, removed, watermark, more
+
+    def get_alert_changes(self, timeout=None):
+        """
+        Generate lists of alert changes notified by the alerts table trigger, using a
+        dedicated connection outside the pool. Yields an empty list once listening, and
+        after "timeout" seconds without changes.
+        """
+        conn = self.connect()
+        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        conn.cursor().execute('LISTEN alerta_alerts')
+        selector = selectors.DefaultSelector()
+        selector.register(conn, selectors.EVENT_READ)
+        try:
+            yield []
+            while True:
+                if selector.select(timeout):
+                    conn.poll()
+                changes = [json.loads(n.payload) for n in conn.notifies]
+                conn.notifies.clear()
+                yield changes
+        finally:
+            selector.close()
+            conn.close()
+
+    def get_alerts_and_counts(self, query=None, page=1, page_size=0, cursor=None, fields=None):
+        """
+        Return a page of alerts, severity and status counts of all matching alerts, and the
+        sort key of the last alert if there are more, using a single scan of the alerts table.
+        The page starts after the cursor, if given. If page_size is 0 only counts are returned.
+        Alerts only have the columns of the given fields, if any.
+
+        Matching alerts are counted and numbered using only their id and sort keys, and
+        only the alerts on the page are joined back to the alerts table for all columns.
+        """
+        query = query or Query()
+        vars = dict(query.vars)
+        order, keys, seek = self._keyset(query.sort or 'last_receive_time', 'alerts.id', cursor, vars)
+        select = """
+            WITH matched AS (
+                SELECT alerts.id, alerts.severity, alerts.status, {sort_keys} row_number() OVER ({order}) AS rn,
+                       COALESCE({seek}, false) AS after_cursor
+                  FROM alerts {join}
+                 WHERE {where}
+            ), counts AS (
+                SELECT json_agg(c) AS counts
+                  FROM (
+                    SELECT GROUPING(status)=1 AS by_severity, severity, status, COUNT(*) AS count
+                      FROM matched
+                  GROUP BY GROUPING SETS ((severity), (status))
+                  ) c
+            ), page_start AS (
+                SELECT COUNT(*) FILTER (WHERE NOT after_cursor) AS n FROM matched
+            ), page AS (
+                SELECT matched.*
+                  FROM matched, page_start
+                 WHERE matched.rn > page_start.n + {offset} AND matched.rn <= page_start.n + {end}
+            )
+            SELECT {columns}, page.rn, {page_sort_keys} counts.counts
+              FROM counts
+         LEFT JOIN (page JOIN alerts ON alerts.id = page.id) ON true
+          ORDER BY page.rn
+        """.format(
+            columns=self._alert_columns(fields, required=['severity', 'status', 'last_receive_time']),
+            sort_keys=''.join('{} AS sort_key_{}, '.format(expr, i) for i, (expr, _) in enumerate(keys)) if page_size else '',
+            page_sort_keys=''.join('page.sort_key_{}, '.format(i) for i in range(len(keys))) if page_size else '',
+            join=self._sort_join(query) if page_size else '',
+            where=query.where,
+            order='ORDER BY {}'.format(order) if page_size else '',
+            seek=seek if page_size else 'true',
+            offset=int((page - 1) * page_size),
+            end=int(page * page_size)
+        )
+        rows = self._fetchall(select, vars, limit='ALL')
+        counts = rows[0].counts or []
+        alerts = [r for r in rows if r.id is not None]
+        total = sum(c['count'] for c in counts if c['by_severity'])
+        return (
+            self._with_history(alerts) if fields is None or 'history' in fields else alerts,
+            {c['severity']: c['count'] for c in counts if c['by_severity']},
+            {c['status']: c['count'] for c in counts if not c['by_severity']},
+            [getattr(alerts[-1], 'sort_key_{}'.format(i)) for i in range(len(keys))] if alerts and alerts[-1].rn < total else None
+        )
+
+    @staticmethod
+    def _keyset(sort, id_column, cursor, vars):
+        """
+        Return ORDER BY list, sort keys and seek condition for keyset pagination, where cursor
+        is the sort key of the last row of the previous page. Ties are ordered by id.
+        """
+        keys = []
+        for key in filter(None, sort.split(',')):
+            expr, _, direction = key.strip().rpartition(' ')
+            if direction.upper() not in ('ASC', 'DESC'):
+                expr, direction = key.strip(), 'ASC'
+            keys.append((expr, direction.upper()))
+        same_direction = all(d == keys[0][1] for _, d in keys)
+        keys.append((id_column, keys[0][1] if keys and same_direction else 'ASC'))
+        order = ', '.join('{} {}'.format(expr, direction) for expr, direction in keys)
+
+        if not cursor:
+            return order, keys, 'true'
+        if len(cursor) != len(keys):
+            raise ApiError('invalid cursor for sort order', 400)
+
+        params = []
+        for i, ((expr, _), value) in enumerate(zip(keys, cursor)):
+            if isinstance(value, datetime):
+                value = value.isoformat()  # datetime adapter truncates to milliseconds
+            elif '->' in expr:
+                value = Json(value)
+            vars['cursor_{}'.format(i)] = value
+            params.append('%(cursor_{})s'.format(i))
+
+        def op(direction):
+            return '>' if direction == 'ASC' else '<'
+
+        if same_direction:
+            # row comparison can use a multi-column index
+            seek = '({}) {} ({})'.format(', '.join(expr for expr, _ in keys), op(keys[0][1]), ', '.join(params))
+        else:
+            seek = ' OR '.join('({})'.format(' AND '.join(
+                ['{}={}'.format(keys[j][0], params[j]) for j in range(i)] + ['{} {} {}'.format(keys[i][0], op(keys[i][1]), params[i])]
+            )) for i in range(len(keys)))
+        return order, keys, '({})'.format(seek)
+
+    @staticmethod
+    def _alert_columns(fields, required=None):
+        """
+        Return select list of alerts table columns for the given alert fields, and the
+        required columns, with NULL for other columns so that all rows have the same
+        attributes. All columns if fields is None.
+        """
+        if fields is None:
+            return 'alerts.*'
+        wanted = {ALERT_COLUMNS[f] for f in fields} | {'id'} | set(required or [])
+        return ', '.join(
+            'alerts.{}'.format(column) if column in wanted else 'NULL AS {}'.format(column) for column in ALERT_COLUMNS.values()
+        ) + ''.join(', alerts.{}'.format(column) for column in required or [] if column not in ALERT_COLUMNS.values())
+
+    @staticmethod
+    def _sort_join(query):
         join = ''
         if 's.code' in query.sort:
             join += 'JOIN (VALUES {}) AS s(sev, code) ON alerts.severity = s.sev '.format(
@@ -393,25 +844,19 @@ class Backend(Database):
             join += 'JOIN (VALUES {}) AS st(sts, state) ON alerts.status = st.sts '.format(
                 ', '.join(("('{}', '{}')".format(k, v) for k, v in alarm_model.Status.items()))
             )
-        select = """
-            SELECT *
-              FROM alerts {join}
-             WHERE {where}
-          ORDER BY {order}
-        """.format(join=join, where=query.where, order=query.sort or 'last_receive_time')
-        return self._fetchall(select, query.vars, limit=page_size, offset=(page - 1) * page_size)
+        return join
 
     def get_alert_history(self, alert, page=None, page_size=None):
         select = """
             SELECT resource, environment, service, "group", tags, attributes, origin, customer, h.*
-              FROM alerts, unnest(history[1:{limit}]) h
+              FROM {history}
              WHERE environment=%(environment)s AND resource=%(resource)s
                AND (h.event=%(event)s OR %(event)s=ANY(correlate))
                AND {customer}
           ORDER BY update_time DESC
             """.format(
-            customer='customer=%(customer)s' if alert.customer else 'customer IS NULL',
-            limit=current_app.config['HISTORY_LIMIT']
+            history=self._history_from('alerts', 'alerts', capped=True),
+            customer='customer=%(customer)s' if alert.customer else 'customer IS NULL'
         )
         return [
             Record(
@@ -433,25 +878,32 @@ class Backend(Database):
                 timeout=getattr(h, 'timeout', None),
                 type=h.type,
                 customer=h.customer
-            ) for h in self._fetchall(select, vars(alert), limit=page_size, offset=(page - 1) * page_size)
+            ) for h in self._fetchall(select, alert.vars, limit=page_size, offset=(page - 1) * page_size)
         ]
 
-    def get_history(self, query=None, page=None, page_size=None):
+    def get_history(self, query=None, page=None, page_size=None, cursor=None):
         query = query or Query()
+        vars = dict(query.vars)
+        order, _, seek = self._keyset('h.update_time DESC', 'h.id', cursor, vars)
         if 'id' in query.vars:
             select = """
                 SELECT a.id
-                  FROM alerts a, unnest(history[1:{limit}]) h
+                  FROM {history}
                  WHERE h.id LIKE %(id)s
-            """.format(limit=current_app.config['HISTORY_LIMIT'])
-            query.vars['id'] = self._fetchone(select, query.vars)
+            """.format(history=self._history_from('alerts a', 'a', capped=True))
+            vars['id'] = self._fetchone(select, vars)
 
+        # filter alerts before joining history so that query fields are not ambiguous
         select = """
             SELECT resource, environment, service, "group", tags, attributes, origin, customer, history, h.*
-              FROM alerts, unnest(history[1:{limit}]) h
-             WHERE {where}
-          ORDER BY update_time DESC
-        """.format(where=query.where, limit=current_app.config['HISTORY_LIMIT'])
+              FROM {history}
+             WHERE {seek}
+          ORDER BY {order}
+        """.format(
+            history=self._history_from('(SELECT * FROM alerts WHERE {}) a'.format(query.where), 'a', capped=True),
+            seek=seek,
+            order=order
+        )
 
         return [
             Record(
@@ -473,7 +925,7 @@ class Backend(Database):
                 timeout=getattr(h, 'timeout', None),
                 type=h.type,
                 customer=h.customer
-            ) for h in self._fetchall(select, query.vars, limit=page_size, offset=(page - 1) * page_size)
+            ) for h in self._fetchall(select, vars, limit=page_size, offset=(page - 1) * page_size)
         ]
 
     # COUNTS
@@ -544,11 +996,11 @@ class Backend(Database):
             SELECT topn.event, COUNT(1) as count, SUM(duplicate_count) AS duplicate_count,
                    array_agg(DISTINCT environment) AS environments, array_agg(DISTINCT svc) AS services,
                    array_agg(DISTINCT ARRAY[topn.id, resource]) AS resources
-              FROM topn, UNNEST (service) svc, UNNEST (history) hist
+              FROM {history}, UNNEST (service) svc
              WHERE hist.type='severity'
           GROUP BY topn.{group}
           ORDER BY count DESC
-        """.format(where=query.where, group=group)
+        """.format(where=query.where, group=group, history=self._history_from('topn', 'topn', h='hist'))
         return [
             {
                 'count': t.count,
@@ -568,11 +1020,11 @@ class Backend(Database):
                    SUM(last_receive_time - create_time) as life_time,
                    array_agg(DISTINCT environment) AS environments, array_agg(DISTINCT svc) AS services,
                    array_agg(DISTINCT ARRAY[topn.id, resource]) AS resources
-              FROM topn, UNNEST (service) svc, UNNEST (history) hist
+              FROM {history}, UNNEST (service) svc
              WHERE hist.type='severity'
           GROUP BY topn.{group}
           ORDER BY life_time DESC
-        """.format(where=query.where, group=group)
+        """.format(where=query.where, group=group, history=self._history_from('topn', 'topn', h='hist'))
         return [
             {
                 'count': t.count,
@@ -712,6 +1164,27 @@ class Backend(Database):
         """.format(where=query.where)
         return [{'environment': t.environment, 'tag': t.tag, 'count': t.count} for t in self._fetchall(select, query.vars, limit=topn)]
 
+    # ROLLUPS
+
+    def get_rollups(self, dimension, customers=None):
+        """
+        Return (environment, value, severity, status, count) of alerts by environment and
+        one of project, service, group or tag (or nothing), from the alert_rollups table.
+        Rollup keys are never NULL, so alerts missing a value are counted under ''.
+        """
+        select = """
+            SELECT environment, value, severity, status, sum(count)::integer AS count
+              FROM alert_rollups
+             WHERE dimension=%(dimension)s AND {customer}
+          GROUP BY environment, value, severity, status
+            HAVING sum(count) > 0
+          ORDER BY environment, value
+        """.format(customer='customer=ANY(%(customers)s)' if customers else '1=1')
+        return [tuple(r) for r in self._fetchall(select, {'dimension': dimension, 'customers': customers}, limit='ALL')]
+
+    def rebuild_rollups(self):
+        return self._updateone('SELECT rebuild_alert_rollups() AS count', {}, returning=True).count
+
     # BLACKOUTS
 
     def create_blackout(self, blackout):
@@ -732,13 +1205,23 @@ class Backend(Database):
         """.format(customer='customer=ANY(%(customers)s)' if customers else '1=1')
         return self._fetchone(select, {'id': id, 'customers': customers})
 
-    def get_blackouts(self, query=None):
+    def get_blackouts(self, query=None, page=1, page_size=None, cursor=None):
         query = query or Query()
+        vars = dict(query.vars)
+        order, _, seek = self._keyset('', 'id', cursor, vars)
         select = """
             SELECT * FROM blackouts
-            WHERE {where}
-        """.format(where=query.where)
-        return self._fetchall(select, query.vars)
+            WHERE {where} AND {seek}
+            ORDER BY {order}
+        """.format(where=query.where, seek=seek, order=order)
+        return self._fetchall(select, vars, limit=page_size, offset=(page - 1) * (page_size or 0))
+
+    def get_blackouts_ending_after(self, end_time):
+        select = """
+            SELECT * FROM blackouts
+             WHERE end_time > %(end_time)s
+        """
+        return self._fetchall(select, {'end_time': end_time}, limit='ALL')
 
     def is_blackout_period(self, alert):
         select = """
@@ -783,7 +1266,7 @@ class Backend(Database):
         """
         if current_app.config['CUSTOMER_VIEWS']:
             select += ' AND (customer IS NULL OR customer=%(customer)s)'
-        if self._fetchone(select, vars(alert)):
+        if self._fetchone(select, alert.vars):
             return True
         return False
 
@@ -851,13 +1334,16 @@ class Backend(Database):
         """.format(customer='customer=%(customers)s' if customers else '1=1')
         return self._fetchone(select, {'id': id, 'like_id': id + '%', 'customers': customers})
 
-    def get_heartbeats(self, query=None):
+    def get_heartbeats(self, query=None, page=1, page_size=None, cursor=None):
         query = query or Query()
+        vars = dict(query.vars)
+        order, _, seek = self._keyset('', 'id', cursor, vars)
         select = """
             SELECT * FROM heartbeats
-            WHERE {where}
-        """.format(where=query.where)
-        return self._fetchall(select, query.vars)
+            WHERE {where} AND {seek}
+            ORDER BY {order}
+        """.format(where=query.where, seek=seek, order=order)
+        return self._fetchall(select, vars, limit=page_size, offset=(page - 1) * (page_size or 0))
 
     def delete_heartbeat(self, id):
         delete = """
@@ -924,6 +1410,17 @@ class Backend(Database):
         """
         return self._updateone(update, (key, key))
 
+    def update_keys_last_used(self, usage):
+        update = """
+            UPDATE keys
+               SET last_used_time=GREATEST(keys.last_used_time, v.last_used_time), count=keys.count + v.count
+              FROM (VALUES %s) AS v(key, count, last_used_time)
+             WHERE keys.key=v.key
+         RETURNING keys.key
+        """
+        template = '(%s::text, %s::integer, %s::timestamp)'
+        return self._updatemany(update, usage, template)
+
     def delete_key(self, key):
         delete = """
             DELETE FROM keys
@@ -1355,7 +1852,20 @@ class Backend(Database):
 
     # HOUSEKEEPING
 
-    def get_expired(self, expired_threshold, info_threshold):
+    def get_expired(self, after=None, limit=None):
+        # get list of alerts to be newly expired, ordered by id after "after"
+        select = """
+            SELECT *
+              FROM alerts
+             WHERE status NOT IN ('expired') AND COALESCE(timeout, {timeout})!=0
+               AND (last_receive_time + INTERVAL '1 second' * timeout) < NOW() at time zone 'utc'
+               AND id > %(after)s
+          ORDER BY id
+        """.format(timeout=current_app.config['ALERT_TIMEOUT'])
+
+        return self._with_history(self._fetchall(select, {'after': after or ''}, limit=limit))
+
+    def delete_expired(self, expired_threshold, info_threshold):
         # delete 'closed' or 'expired' alerts older than "expired_threshold" hours
         # and 'informational' alerts older than "info_threshold" hours
 
@@ -1375,43 +1885,264 @@ class Backend(Database):
             """
             self._deleteall(delete, {'info_threshold': info_threshold})
 
-        # get list of alerts to be newly expired
-        select = """
-            SELECT *
-              FROM alerts
-             WHERE status NOT IN ('expired') AND COALESCE(timeout, {timeout})!=0
-               AND (last_receive_time + INTERVAL '1 second' * timeout) < NOW() at time zone 'utc'
-        """.format(timeout=current_app.config['ALERT_TIMEOUT'])
-
-        return self._fetchall(select, {})
-
-    def get_unshelve(self):
+    def get_unshelve(self, after=None, limit=None):
         # get list of alerts to be unshelved
         select = """
             SELECT DISTINCT ON (a.id) a.*
-              FROM alerts a, UNNEST(history) h
+              FROM {history}
              WHERE a.status='shelved'
                AND h.type='shelve'
                AND h.status='shelved'
                AND COALESCE(h.timeout, {timeout})!=0
                AND (a.update_time + INTERVAL '1 second' * h.timeout) < NOW() at time zone 'utc'
+               AND a.id > %(after)s
           ORDER BY a.id, a.update_time DESC
-        """.format(timeout=current_app.config['SHELVE_TIMEOUT'])
-        return self._fetchall(select, {})
+        """.format(history=self._history_from('alerts a', 'a'), timeout=current_app.config['SHELVE_TIMEOUT'])
+        return self._with_history(self._fetchall(select, {'after': after or ''}, limit=limit))
 
-    def get_unack(self):
+    def get_unack(self, after=None, limit=None):
         # get list of alerts to be unack'ed
         select = """
             SELECT DISTINCT ON (a.id) a.*
-              FROM alerts a, UNNEST(history) h
+              FROM {history}
              WHERE a.status='ack'
                AND h.type='ack'
                AND h.status='ack'
                AND COALESCE(h.timeout, {timeout})!=0
                AND (a.update_time + INTERVAL '1 second' * h.timeout) < NOW() at time zone 'utc'
+               AND a.id > %(after)s
           ORDER BY a.id, a.update_time DESC
-        """.format(timeout=current_app.config['ACK_TIMEOUT'])
-        return self._fetchall(select, {})
+        """.format(history=self._history_from('alerts a', 'a'), timeout=current_app.config['ACK_TIMEOUT'])
+        return self._with_history(self._fetchall(select, {'after': after or ''}, limit=limit))
+
+    def acquire_lease(self, name, owner, ttl):
+        """
+        Take or renew the named lease for "ttl" seconds, unless it is held by another owner.
+        """
+        upsert = """
+            INSERT INTO leases (name, owner, expire_time)
+            VALUES (%(name)s, %(owner)s, NOW() at time zone 'utc' + INTERVAL '1 second' * %(ttl)s)
+            ON CONFLICT (name) DO UPDATE
+                SET owner=EXCLUDED.owner, expire_time=EXCLUDED.expire_time
+                WHERE leases.owner=EXCLUDED.owner OR leases.expire_time < NOW() at time zone 'utc'
+            RETURNING owner
+        """
+        return self._updateone(upsert, {'name': name, 'owner': owner, 'ttl': ttl}, returning=True) is not None
+
+    def release_lease(self, name, owner):
+        delete = """
+            DELETE FROM leases
+             WHERE name=%(name)s AND owner=%(owner)s
+         RETURNING name
+        """
+        return len(self._deleteall(delete, {'name': name, 'owner': owner}, returning=True)) > 0
+
+    def prune_tombstones(self):
+        # forget deleted alerts older than "max_age" hours
+        max_age = current_app.config['DELETED_ALERTS_MAX_AGE']
+        if not max_age:
+            return 0
+        delete = """
+            DELETE FROM alert_tombstones
+             WHERE delete_time < (NOW() at time zone 'utc' - INTERVAL '%(max_age)s hours')
+         RETURNING id
+        """
+        return len(self._deleteall(delete, {'max_age': max_age}, returning=True))
+
+    def prune_history(self, batch_size=1000):
+        # delete history older than "max_age" days and all but the latest HISTORY_LIMIT entries of each alert
+        if not self.history_table:
+            return 0
+
+        count = 0
+        max_age = current_app.config['HISTORY_MAX_AGE']
+        if max_age:
+            delete = """
+                DELETE FROM alert_history
+                 WHERE update_time < (NOW() at time zone 'utc' - INTERVAL '%(max_age)s days')
+             RETURNING alert_id
+            """
+            count += len(self._deleteall(delete, {'max_age': max_age}, returning=True))
+
+        # only alerts with too much history are ranked, a batch of alerts at a time
+        limit = current_app.config['HISTORY_LIMIT']
+        select = """
+            SELECT alert_id
+              FROM alert_history
+          GROUP BY alert_id
+            HAVING count(*) > %(limit)s
+        """
+        alert_ids = [r.alert_id for r in self._fetchall(select, {'limit': limit}, limit='ALL')]
+
+        delete = """
+            DELETE FROM alert_history
+             WHERE ctid IN (
+                SELECT ctid
+                  FROM (
+                    SELECT ctid, row_number() OVER (PARTITION BY alert_id ORDER BY update_time DESC) AS n
+                      FROM alert_history
+                     WHERE alert_id=ANY(%(alert_ids)s)
+                  ) h
+                 WHERE n > %(limit)s
+             )
+         RETURNING alert_id
+        """
+        for i in range(0, len(alert_ids), batch_size):
+            count += len(self._deleteall(delete, {'alert_ids': alert_ids[i:i + batch_size], 'limit': limit}, returning=True))
+        return count
+
+    def migrate_history(self, batch_size=1000):
+        # move history arrays of a batch of alerts into the history table
+        update = """
+            WITH batch AS (
+                SELECT id, history
+                  FROM alerts
+                 WHERE cardinality(history) > 0
+                 LIMIT %(batch_size)s
+                   FOR UPDATE SKIP LOCKED
+            ), moved AS (
+                INSERT INTO alert_history (alert_id, id, event, severity, status, value, text, type, update_time, "user", timeout)
+                SELECT batch.id, h.*
+                  FROM batch, unnest(batch.history) h
+            )
+            UPDATE alerts
+               SET history='{}'
+              FROM batch
+             WHERE alerts.id=batch.id
+         RETURNING alerts.id
+        """
+        return len(self._updateall(update, {'batch_size': batch_size}, returning=True))
+
+    # INDEXES
+
+    def get_indexes(self):
+        """
+        Return (table, name, state) for every index in the managed index set, and for any
+        other index that is invalid. Indexes created conditionally, eg. if an extension is
+        available, are not included. An index left invalid by a failed or cancelled CREATE
+        INDEX CONCURRENTLY is never used, and is not rebuilt by schema.sql, so it must be
+        dropped and created again.
+        """
+        with current_app.open_resource('sql/schema.sql') as f:
+            managed = re.findall(r'^CREATE (?:UNIQUE )?INDEX IF NOT EXISTS (\w+) ON (\w+)', f.read().decode('utf-8'), re.MULTILINE)
+        select = """
+            SELECT c.relname AS index, t.relname AS table, i.indisvalid AS valid
+              FROM pg_index i
+              JOIN pg_class c ON c.oid=i.indexrelid
+              JOIN pg_class t ON t.oid=i.indrelid
+             WHERE c.relnamespace=current_schema()::regnamespace
+        """
+        existing = {r.index: r for r in self._fetchall(select, {}, limit='ALL')}
+        indexes = []
+        for name, table in managed:
+            index = existing.pop(name, None)
+            indexes.append((table, name, 'ok' if index and index.valid else 'INVALID' if index else 'MISSING'))
+        indexes.extend((r.table, r.index, 'INVALID') for r in existing.values() if not r.valid)
+        return indexes
+
+    @staticmethod
+    def _id_prefix(id):
+        """
+        Return case-insensitive LIKE pattern for an alert id prefix, so lookups can use the lower(id) index.
+        """
+        return id.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+    # HISTORY HELPERS
+
+    def _history_update(self, new, old='history'):
+        """
+        Return SET clause that prepends history to alerts, unless history is stored in its own table.
+        """
+        if self.history_table:
+            return 'history={old}'.format(old=old)
+        return 'history=({new} || {old})[1:{limit}]'.format(new=new, old=old, limit=current_app.config['HISTORY_LIMIT'])
+
+    def _history_column(self, history):
+        """
+        Return history to be stored in the alerts table.
+        """
+        return [] if self.history_table else self._history_list(history)
+
+    @staticmethod
+    def _history_list(history):
+        if history is None:
+            return []
+        return history if isinstance(history, list) else [history]
+
+    def _history_from(self, source, ref, h='h', capped=False):
+        """
+        Return FROM clause that joins alerts with one row per history entry.
+        """
+        if self.history_table:
+            return '{source} JOIN alert_history {h} ON {h}.alert_id={ref}.id'.format(source=source, ref=ref, h=h)
+        if capped:
+            return '{source}, unnest({ref}.history[1:{limit}]) {h}'.format(
+                source=source, ref=ref, h=h, limit=current_app.config['HISTORY_LIMIT'])
+        return '{source}, unnest({ref}.history) {h}'.format(source=source, ref=ref, h=h)
+
+    def _append_history(self, cursor, entries):
+        """
+        Append (alert_id, history) entries to the history table.
+        """
+        if not entries:
+            return
+        insert = """
+            INSERT INTO alert_history (alert_id, id, event, severity, status, value, text, type, update_time, "user", timeout)
+            SELECT * FROM unnest(%(alert_ids)s::text[], %(history)s::history[])
+        """
+        self._execute(cursor, insert, {
+            'alert_ids': [alert_id for alert_id, _ in entries],
+            'history': [h for _, h in entries]
+        })
+
+    def _updatealert(self, query, vars, history):
+        """
+        Insert or update one alert and append its history in the same transaction, with return.
+        """
+        cursor = self.get_db().cursor()
+        self._execute(cursor, query, vars)
+        row = cursor.fetchone()
+        if self.history_table and row:
+            self._append_history(cursor, [(row.id, h) for h in self._history_list(history)])
+        self.get_db().commit()
+        return self._with_history(row)
+
+    def _updatealerts(self, query, argslist, template, history_by_id):
+        """
+        Insert or update multiple alerts and append their history in the same transaction, with return.
+        """
+        cursor = self.get_db().cursor()
+        rows = self._execute(cursor, query, argslist, execute=lambda: execute_values(
+            cursor, query, argslist, template=template, page_size=len(argslist), fetch=True))
+        if self.history_table:
+            self._append_history(cursor, [(r.id, h) for r in rows for h in self._history_list(history_by_id.get(r.id))])
+        self.get_db().commit()
+        return self._with_history(rows)
+
+    def _with_history(self, rows):
+        """
+        Attach the most recent history to alerts read from the alerts table.
+        """
+        if not self.history_table or not rows:
+            return rows
+        many = isinstance(rows, list)
+        ids = list({r.id for r in (rows if many else [rows]) if r})
+        select = """
+            SELECT alert_id, id, event, severity, status, value, text, type, update_time, "user", timeout
+              FROM (
+                SELECT *, row_number() OVER (PARTITION BY alert_id ORDER BY update_time DESC) AS n
+                  FROM alert_history
+                 WHERE alert_id=ANY(%(ids)s)
+              ) h
+             WHERE n <= {limit}
+          ORDER BY alert_id, update_time DESC
+        """.format(limit=current_app.config['HISTORY_LIMIT'])
+        history = defaultdict(list)
+        for h in self._fetchall(select, {'ids': ids}, limit='ALL'):
+            history[h.alert_id].append(h)
+        if many:
+            return [r._replace(history=history[r.id]) if r else r for r in rows]
+        return rows._replace(history=history[rows.id])
 
     # SQL HELPERS
 
@@ -1420,8 +2151,7 @@ class Backend(Database):
         Insert, with return.
         """
         cursor = self.get_db().cursor()
-        self._log(cursor, query, vars)
-        cursor.execute(query, vars)
+        self._execute(cursor, query, vars)
         self.get_db().commit()
         return cursor.fetchone()
 
@@ -1430,8 +2160,7 @@ class Backend(Database):
         Return none or one row.
         """
         cursor = self.get_db().cursor()
-        self._log(cursor, query, vars)
-        cursor.execute(query, vars)
+        self._execute(cursor, query, vars)
         return cursor.fetchone()
 
     def _fetchall(self, query, vars, limit=None, offset=0):
@@ -1442,8 +2171,7 @@ class Backend(Database):
             limit = current_app.config['DEFAULT_PAGE_SIZE']
         query += ' LIMIT %s OFFSET %s''' % (limit, offset)
         cursor = self.get_db().cursor()
-        self._log(cursor, query, vars)
-        cursor.execute(query, vars)
+        self._execute(cursor, query, vars)
         return cursor.fetchall()
 
     def _updateone(self, query, vars, returning=False):
@@ -1451,8 +2179,7 @@ class Backend(Database):
         Update, with optional return.
         """
         cursor = self.get_db().cursor()
-        self._log(cursor, query, vars)
-        cursor.execute(query, vars)
+        self._execute(cursor, query, vars)
         self.get_db().commit()
         return cursor.fetchone() if returning else None
 
@@ -1461,11 +2188,20 @@ class Backend(Database):
         Update, with optional return.
         """
         cursor = self.get_db().cursor()
-        self._log(cursor, query, vars)
-        cursor.execute(query, vars)
+        self._execute(cursor, query, vars)
         self.get_db().commit()
         return cursor.fetchall() if returning else None
 
+    def _updatemany(self, query, argslist, template):
+        """
+        Insert or update multiple rows using a single VALUES list, with return.
+        """
+        cursor = self.get_db().cursor()
+        rows = self._execute(cursor, query, argslist, execute=lambda: execute_values(
+            cursor, query, argslist, template=template, page_size=len(argslist), fetch=True))
+        self.get_db().commit()
+        return rows
+
     def _upsert(self, query, vars):
         """
         Insert or update, with return.
@@ -1477,8 +2213,7 @@ class Backend(Database):
         Delete, with optional return.
         """
         cursor = self.get_db().cursor()
-        self._log(cursor, query, vars)
-        cursor.execute(query, vars)
+        self._execute(cursor, query, vars)
         self.get_db().commit()
         return cursor.fetchone() if returning else None
 
@@ -1487,11 +2222,53 @@ class Backend(Database):
         Delete multiple rows, with optional return.
         """
         cursor = self.get_db().cursor()
-        self._log(cursor, query, vars)
-        cursor.execute(query, vars)
+        self._execute(cursor, query, vars)
         self.get_db().commit()
         return cursor.fetchall() if returning else None
 
+    def _execute(self, cursor, query, vars, execute=None):
+        """
+        Execute query, timing it only if query timing or the slow query log is enabled.
+        """
+        self._log(cursor, query, vars)
+        if not self.query_stats.enabled:
+            try:
+                return execute() if execute else cursor.execute(query, vars)
+            except psycopg2.Error:
+                cursor.connection.rollback()  # so the connection can still be used for this request
+                raise
+
+        start = time.perf_counter()
+        try:
+            return execute() if execute else cursor.execute(query, vars)
+        except psycopg2.Error:
+            cursor.connection.rollback()
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            method = self._caller()
+            self.query_stats.observe(method, duration)
+            if self.query_stats.is_slow(duration):
+                current_app.logger.warning('Slow query in {}() took {:.0f}ms:\n{}'.format(
+                    method, duration * 1000, self._mogrify(cursor, query, vars)))
+
+    @staticmethod
+    def _caller():
+        """
+        Return name of the backend method that issued the query, skipping SQL helpers.
+        """
+        frame = sys._getframe(2)
+        while frame and frame.f_code.co_name.startswith('_'):
+            frame = frame.f_back
+        return frame.f_code.co_name if frame else 'unknown'
+
+    @staticmethod
+    def _mogrify(cursor, query, vars):
+        if isinstance(vars, list):
+            return query  # VALUES list is only interpolated by execute_values()
+        return cursor.mogrify(query, vars).decode('utf-8')
+
     def _log(self, cursor, query, vars):
-        current_app.logger.debug('{stars}\n{query}\n{stars}'.format(
-            stars='*' * 40, query=cursor.mogrify(query, vars).decode('utf-8')))
+        if current_app.logger.isEnabledFor(logging.DEBUG):
+            current_app.logger.debug('{stars}\n{query}\n{stars}'.format(
+                stars='*' * 40, query=self._mogrify(cursor, query, vars)))
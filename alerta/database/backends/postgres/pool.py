@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from collections import deque
+
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.pool import PoolError
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of database connections for a single process.
+
+    New connections are opened using the backend connect() method so that
+    connection failures are retried with the same backoff as before. Callers
+    wait up to "timeout" seconds for a connection when the pool is exhausted.
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=30, pre_ping=True):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+        self.pid = os.getpid()
+
+        self._idle = deque()  # type: deque
+        self._conns = set()  # type: set
+        self._opening = 0
+        self._cond = threading.Condition()
+
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.discarded = 0
+
+        for _ in range(min(min_size, self.max_size)):
+            conn = self._connect()
+            self._conns.add(conn)
+            self._idle.append(conn)
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = self._checkout(deadline)
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    self._release_slot(None)
+                    raise
+                with self._cond:
+                    self._opening -= 1
+                    self._conns.add(conn)
+                return conn
+            if self._is_healthy(conn):
+                return conn
+            self._discard(conn)
+
+    def putconn(self, conn):
+        if conn not in self._conns:
+            # connection was checked out of a pool that has since been replaced
+            conn.close()
+            return
+        if not conn.closed and conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+        if conn.closed or os.getpid() != self.pid:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            while self._idle:
+                conn = self._idle.popleft()
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                self._conns.discard(conn)
+            self._cond.notify_all()
+
+    @property
+    def stats(self):
+        with self._cond:
+            return {
+                'size': len(self._conns) + self._opening,
+                'idle': len(self._idle),
+                'in_use': len(self._conns) - len(self._idle),
+                'max_size': self.max_size,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'discarded': self.discarded
+            }
+
+    def _checkout(self, deadline):
+        """
+        Return an idle connection, or None if the caller should open a new one.
+        """
+        with self._cond:
+            waited = False
+            while not self._idle and len(self._conns) + self._opening >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolError('connection pool exhausted after waiting {}s'.format(self.timeout))
+                waited = True
+                self._cond.wait(remaining)
+            if waited:
+                self.waits += 1
+            self.checkouts += 1
+            if self._idle:
+                return self._idle.pop()
+            self._opening += 1
+            return None
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if not self.pre_ping:
+            return True
+        try:
+            conn.cursor().execute('SELECT 1')
+        except Exception:
+            return False
+        return True
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self.discarded += 1
+        self._release_slot(conn)
+
+    def _release_slot(self, conn):
+        with self._cond:
+            if conn is None:
+                self._opening -= 1
+            else:
+                self._conns.discard(conn)
+            self._cond.notify()
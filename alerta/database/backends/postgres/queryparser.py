@@ -1,3 +1,6 @@
+import json
+import re
+
 from pyparsing import (Forward, Group, Keyword, Literal, Optional,
                        ParseException, ParserElement, QuotedString, Regex,
                        Suppress, Word, infixNotation, opAssoc, printables)
@@ -5,6 +8,72 @@ from pyparsing import (Forward, Group, Keyword, Literal, Optional,
 ParserElement.enablePackrat()
 
 
+# exact match on keyword fields, so that b-tree indexes can be used
+KEYWORD_FIELDS = ['resource', 'event', 'environment', 'project', 'severity', 'status', 'group', 'origin', 'type', 'customer']
+ARRAY_FIELDS = ['correlate', 'service', 'tags']
+
+PREFIX = re.compile(r'^[a-z0-9]+\.\*$')  # wildcard pattern of a trailing "*" only
+INTEGER = re.compile(r'^-?[0-9]+$')
+DECIMAL = re.compile(r'^-?[0-9]+\.[0-9]+$')
+
+
+def bind(params, value):
+    """
+    Add value to bound parameters and return its placeholder.
+    """
+    name = 'q{}'.format(len(params))
+    params[name] = value
+    return '%({})s'.format(name)
+
+
+def json_values(term):
+    """
+    Return values a search term could be stored as in JSON.
+    """
+    if term in ('true', 'false'):
+        return [term, term == 'true']
+    if INTEGER.match(term):
+        return [term, int(term)]
+    if DECIMAL.match(term):
+        return [term, float(term)]
+    return [term]
+
+
+class Field:
+    """column, or key of a jsonb column, that search terms apply to"""
+
+    def __init__(self, name, attr=None):
+        self.name = name
+        self.attr = attr
+
+    @classmethod
+    def from_tokens(cls, tokens, default):
+        if tokens.field[0] == '__default_field__':
+            return default
+        if tokens.attr:
+            return cls(tokens.fieldname, attr='attributes' if tokens.attr == '_' else tokens.attr)
+        return cls(tokens.fieldname)
+
+    @property
+    def column(self):
+        return '"{}"'.format((self.attr or self.name).replace('"', '""'))
+
+    @property
+    def kind(self):
+        if self.attr:
+            return 'attribute'
+        if self.name in KEYWORD_FIELDS:
+            return 'keyword'
+        if self.name in ARRAY_FIELDS:
+            return 'array'
+        return 'text'
+
+    def text(self, params):
+        if self.attr:
+            return '{} ->>{}'.format(self.column, bind(params, self.name))
+        return self.column
+
+
 class UnaryOperation:
     """takes one operand,e.g. not"""
 
@@ -17,34 +86,49 @@ class BinaryOperation:
 
     def __init__(self, tokens):
         self.op = tokens[0][1]
-        self.lhs = tokens[0][0]
-        self.rhs = tokens[0][2]
+        self.operands = tokens[0][0::2]
 
 
 class SearchModifier(UnaryOperation):
 
-    def __repr__(self):
-        return '{} {}'.format(self.op, self.operands)
+    def sql(self, params, field):
+        if self.op == '-':
+            return 'NOT ({})'.format(self.operands.sql(params, field))
+        return self.operands.sql(params, field)
 
 
 class SearchAnd(BinaryOperation):
 
-    def __repr__(self):
-        return '({} AND {})'.format(self.lhs, self.rhs)
+    def sql(self, params, field):
+        where = self.operands[0].sql(params, field)
+        for operand in self.operands[1:]:
+            where = '({} AND {})'.format(where, operand.sql(params, field))
+        return where
 
 
 class SearchOr(BinaryOperation):
 
-    def __repr__(self):
-        if getattr(self.rhs, 'op', None) == 'NOT':
-            return '({} AND {})'.format(self.lhs, self.rhs)
-        return '({} OR {})'.format(self.lhs, self.rhs)
+    def sql(self, params, field):
+        # any of several values of the same keyword or array field
+        matches = [operand.match(field) if isinstance(operand, SearchTerm) else None for operand in self.operands]
+        if all(matches) and len({(kind, column) for kind, column, _ in matches}) == 1:
+            kind, column, _ = matches[0]
+            values = [value for _, _, value in matches]
+            if kind == 'keyword':
+                return '{}=ANY({})'.format(column, bind(params, values))
+            return '{} && {}::text[]'.format(column, bind(params, values))
+
+        where = self.operands[0].sql(params, field)
+        for operand in self.operands[1:]:
+            op = 'AND' if getattr(operand, 'op', None) == 'NOT' else 'OR'
+            where = '({} {} {})'.format(where, op, operand.sql(params, field))
+        return where
 
 
 class SearchNot(UnaryOperation):
 
-    def __repr__(self):
-        return 'NOT ({})'.format(self.operands)
+    def sql(self, params, field):
+        return 'NOT ({})'.format(self.operands.sql(params, field))
 
 
 class SearchTerm:
@@ -52,61 +136,77 @@ class SearchTerm:
     def __init__(self, tokens):
         self.tokens = tokens
 
-    def __repr__(self):
-        # print([t for t in self.tokens.items()])
+    @property
+    def value(self):
         if 'singleterm' in self.tokens:
-            if self.tokens.fieldname == '_exists_':
-                return '"attributes"::jsonb ? \'{}\''.format(self.tokens.singleterm)
-            elif self.tokens.fieldname in ['correlate', 'service', 'tags']:
-                return '\'{}\'=ANY("{}")'.format(self.tokens.singleterm, self.tokens.field[0])
-            elif self.tokens.attr:
-                tokens_attr = self.tokens.attr.replace('_', 'attributes')
-                return '"{}"::jsonb ->>\'{}\' ILIKE \'%%{}%%\''.format(tokens_attr, self.tokens.fieldname, self.tokens.singleterm)
-            else:
-                return '"{}" ILIKE \'%%{}%%\''.format(self.tokens.field[0], self.tokens.singleterm)
+            return self.tokens.singleterm
         if 'phrase' in self.tokens:
-            if self.tokens.field[0] == '__default_field__':
-                return '"{}" ~* \'\\y{}\\y\''.format('__default_field__', self.tokens.phrase)
-            elif self.tokens.field[0] in ['correlate', 'service', 'tags']:
-                return '\'{}\'=ANY("{}")'.format(self.tokens.term, self.tokens.field[0])
+            return self.tokens.phrase
+        return None
+
+    def match(self, field):
+        """
+        Return kind, column and value of an exact match on a keyword or array field.
+        """
+        field = Field.from_tokens(self.tokens, field)
+        if self.value is None or self.tokens.fieldname == '_exists_' or field.kind not in ('keyword', 'array'):
+            return None
+        return field.kind, field.column, self.value
+
+    def sql(self, params, field):
+        field = Field.from_tokens(self.tokens, field)
+        if 'subquery' in self.tokens:
+            return self.tokens.subquery[0].sql(params, field)
+
+        value = self.value
+        if value is not None:
+            if self.tokens.fieldname == '_exists_':
+                return '"attributes" ? {}'.format(bind(params, value))
+            elif field.kind == 'attribute':
+                # containment can use the jsonb index on attributes
+                where = ['{} @> {}::jsonb'.format(field.column, bind(params, json.dumps({field.name: v})))
+                         for v in json_values(value)]
+                return where[0] if len(where) == 1 else '({})'.format(' OR '.join(where))
+            elif field.kind == 'keyword':
+                return '{}={}'.format(field.column, bind(params, value))
+            elif field.kind == 'array':
+                return '{} @> {}::text[]'.format(field.column, bind(params, [value]))
+            elif 'phrase' in self.tokens:
+                return '{} ~* {}'.format(field.column, bind(params, '\\y' + value + '\\y'))
             else:
-                return '"{}" ~* \'\\y{}\\y\''.format(self.tokens.field[0], self.tokens.phrase)
+                return '{} ILIKE {}'.format(field.column, bind(params, '%' + value + '%'))
         if 'wildcard' in self.tokens:
-            return '"{}" ~* \'\\y{}\\y\''.format(self.tokens.field[0], self.tokens.wildcard)
+            if field.kind == 'keyword' and PREFIX.match(self.tokens.wildcard):
+                # case-insensitive like the regex it replaces, using the lower() prefix index
+                return 'lower({}) LIKE lower({})'.format(field.column, bind(params, self.tokens.wildcard[:-2] + '%'))
+            return '{} ~* {}'.format(field.text(params), bind(params, '\\y' + self.tokens.wildcard + '\\y'))
         if 'regex' in self.tokens:
-            return '"{}" ~* \'{}\''.format(self.tokens.field[0], self.tokens.regex)
+            return '{} ~* {}'.format(field.text(params), bind(params, self.tokens.regex))
         if 'range' in self.tokens:
             if self.tokens.range[0].lowerbound == '*':
                 lower_term = '1=1'
             else:
-                lower_term = '"{}" {} \'{}\''.format(
-                    self.tokens.field[0],
+                lower_term = '{} {} {}'.format(
+                    field.text(params),
                     '>=' if 'inclusive' in self.tokens.range[0] else '>',
-                    self.tokens.range[0].lowerbound
+                    bind(params, self.tokens.range[0].lowerbound)
                 )
 
             if self.tokens.range[2].upperbound == '*':
                 upper_term = '1=1'
             else:
-                upper_term = '"{}" {} \'{}\''.format(
-                    self.tokens.field[0],
+                upper_term = '{} {} {}'.format(
+                    field.text(params),
                     '<=' if 'inclusive' in self.tokens.range[2] else '<',
-                    self.tokens.range[2].upperbound
+                    bind(params, self.tokens.range[2].upperbound)
                 )
             return '({} AND {})'.format(lower_term, upper_term)
         if 'onesidedrange' in self.tokens:
-            return '("{}" {} \'{}\')'.format(
-                self.tokens.field[0],
+            return '({} {} {})'.format(
+                field.text(params),
                 self.tokens.onesidedrange.op,
-                self.tokens.onesidedrange.bound
+                bind(params, self.tokens.onesidedrange.bound)
             )
-        if 'subquery' in self.tokens:
-            if self.tokens.attr:
-                tokens_attr = 'attributes' if self.tokens.attr == '_' else self.tokens.attr
-                tokens_fieldname = '"{}"::jsonb ->>\'{}\''.format(tokens_attr, self.tokens.fieldname)
-            else:
-                tokens_fieldname = '"{}"'.format(self.tokens.fieldname or self.tokens.field[0])
-            return '{}'.format(self.tokens.subquery[0]).replace('"__default_field__"', tokens_fieldname)
 
         raise ParseException('Search term did not match query syntax: %s' % self.tokens)
 
@@ -177,5 +277,9 @@ class QueryParser:
     DEFAULT_FIELD = 'text'
 
     def parse(self, query, default_field=None):
-        default_field = default_field or QueryParser.DEFAULT_FIELD
-        return repr(query_expr.parseString(query)[0]).replace('__default_field__', default_field)
+        """
+        Return SQL condition for query, and its bound parameters.
+        """
+        params = dict()
+        where = query_expr.parseString(query)[0].sql(params, Field(default_field or QueryParser.DEFAULT_FIELD))
+        return where, params
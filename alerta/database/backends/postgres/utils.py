@@ -7,6 +7,7 @@ from werkzeug.datastructures import MultiDict
 
 from alerta.database.base import QueryBuilder
 from alerta.exceptions import ApiError
+from alerta.utils.cache import MISSING, TTLCache
 from alerta.utils.format import DateTime
 
 from .queryparser import QueryParser
@@ -14,21 +15,34 @@ from .queryparser import QueryParser
 Query = namedtuple('Query', ['where', 'vars', 'sort', 'group'])
 Query.__new__.__defaults__ = ('1=1', {}, 'last_receive_time', 'status')  # type: ignore
 
+QUERY_CACHE_SIZE = 1024  # most recently used "q" queries kept parsed per process
+
 
 class QueryBuilderImpl(QueryBuilder):
 
+    query_cache = TTLCache(maxsize=QUERY_CACHE_SIZE)
+
+    @staticmethod
+    def parse_query(q, default_field=None):
+        """
+        Return SQL condition and bound parameters for "q", parsed once per distinct query.
+        """
+        key = (q, default_field)
+        parsed = QueryBuilderImpl.query_cache.get(key)
+        if parsed is MISSING:
+            parsed = QueryParser().parse(query=q, default_field=default_field)
+            QueryBuilderImpl.query_cache.set(key, parsed)
+        return parsed
+
     @staticmethod
     def from_params(params: MultiDict, customers=None, query_time=None):
 
         # q
         if params.get('q', None):
             try:
-                parser = QueryParser()
-                query = [parser.parse(
-                    query=params['q'],
-                    default_field=params.get('q.df')
-                )]
-                qvars = dict()  # type: Dict[str, Any]
+                where, qvars = QueryBuilderImpl.parse_query(params['q'], params.get('q.df'))
+                query = [where]
+                qvars = dict(qvars)  # type: Dict[str, Any]
             except ParseException as e:
                 raise ApiError('Failed to parse query string.', 400, [e])
         else:
@@ -107,7 +121,8 @@ class QueryBuilderImpl(QueryBuilder):
 
         EXCLUDE_QUERY = ['_', 'callback', 'token', 'api-key', 'q', 'q.df', 'id',
                          'from-date', 'to-date', 'duplicateCount', 'repeat', 'sort-by',
-                         'reverse', 'group-by', 'page', 'page-size', 'limit']
+                         'reverse', 'group-by', 'page', 'page-size', 'limit', 'cursor',
+                         'changed-since', 'fields']
 
         # fields
         for field in params:
@@ -4,6 +4,8 @@ from urllib.parse import urlparse
 
 from flask import g
 
+from alerta.utils.cache import TTLCache  # noqa
+
 # http://stackoverflow.com/questions/8544983/dynamically-mixin-a-base-class-to-an-instance-in-python
 
 Query = NamedTuple('Query', [('where', str), ('sort', str), ('group', str)])
@@ -71,12 +73,23 @@ class Database(Base):
     def is_alive(self):
         raise NotImplementedError
 
+    @property
+    def pool_stats(self):
+        raise NotImplementedError
+
+    @property
+    def query_histograms(self):
+        raise NotImplementedError
+
     def close(self, db):
         raise NotImplementedError('Database engine has no close() method')
 
     def destroy(self):
         raise NotImplementedError('Database engine has no destroy() method')
 
+    def get_indexes(self):
+        raise NotImplementedError
+
     def get_db(self):
         if 'db' not in g:
             g.db = self.connect()
@@ -101,6 +114,9 @@ class Database(Base):
     def is_correlated(self, alert):
         raise NotImplementedError
 
+    def is_duplicate_or_correlated(self, alert):
+        raise NotImplementedError
+
     def is_flapping(self, alert, window=1800, count=2):
         raise NotImplementedError
 
@@ -113,9 +129,24 @@ class Database(Base):
     def create_alert(self, alert):
         raise NotImplementedError
 
+    def get_duplicates_or_correlated(self, alerts):
+        raise NotImplementedError
+
+    def dedup_alerts(self, changes):
+        raise NotImplementedError
+
+    def correlate_alerts(self, changes):
+        raise NotImplementedError
+
+    def create_alerts(self, alerts):
+        raise NotImplementedError
+
     def set_alert(self, id, severity, status, tags, attributes, timeout, previous_severity, update_time, history=None):
         raise NotImplementedError
 
+    def set_alerts(self, changes):
+        raise NotImplementedError
+
     def get_alert(self, id, customers=None):
         raise NotImplementedError
 
@@ -155,13 +186,25 @@ class Database(Base):
 
     # SEARCH & HISTORY
 
-    def get_alerts(self, query=None, page=None, page_size=None):
+    def get_alerts(self, query=None, page=None, page_size=None, fields=None):
+        raise NotImplementedError
+
+    def get_alerts_by_ids(self, ids, query=None):
+        raise NotImplementedError
+
+    def get_alerts_changed_since(self, query=None, changed_since=None, customers=None, page_size=None, fields=None):
+        raise NotImplementedError
+
+    def get_alert_changes(self, timeout=None):
+        raise NotImplementedError
+
+    def get_alerts_and_counts(self, query=None, page=1, page_size=0, cursor=None, fields=None):
         raise NotImplementedError
 
     def get_alert_history(self, alert, page=None, page_size=None):
         raise NotImplementedError
 
-    def get_history(self, query=None, page=None, page_size=None):
+    def get_history(self, query=None, page=None, page_size=None, cursor=None):
         raise NotImplementedError
 
     # COUNTS
@@ -212,6 +255,14 @@ class Database(Base):
     def get_alert_tags(self, query=None, topn=1000):
         raise NotImplementedError
 
+    # ROLLUPS
+
+    def get_rollups(self, dimension, customers=None):
+        raise NotImplementedError
+
+    def rebuild_rollups(self):
+        raise NotImplementedError
+
     # BLACKOUTS
 
     def create_blackout(self, blackout):
@@ -220,7 +271,10 @@ class Database(Base):
     def get_blackout(self, id, customers=None):
         raise NotImplementedError
 
-    def get_blackouts(self, query=None):
+    def get_blackouts(self, query=None, page=1, page_size=None, cursor=None):
+        raise NotImplementedError
+
+    def get_blackouts_ending_after(self, end_time):
         raise NotImplementedError
 
     def is_blackout_period(self, alert):
@@ -240,7 +294,7 @@ class Database(Base):
     def get_heartbeat(self, id, customers=None):
         raise NotImplementedError
 
-    def get_heartbeats(self, query=None):
+    def get_heartbeats(self, query=None, page=1, page_size=None, cursor=None):
         raise NotImplementedError
 
     def delete_heartbeat(self, id):
@@ -263,6 +317,9 @@ class Database(Base):
     def update_key_last_used(self, key):
         raise NotImplementedError
 
+    def update_keys_last_used(self, usage):
+        raise NotImplementedError
+
     def delete_key(self, key):
         raise NotImplementedError
 
@@ -409,18 +466,38 @@ class Database(Base):
 
     # HOUSEKEEPING
 
-    def get_expired(self, expired_threshold, info_threshold):
+    def get_expired(self, after=None, limit=None):
         raise NotImplementedError
 
-    def get_unshelve(self):
+    def delete_expired(self, expired_threshold, info_threshold):
         raise NotImplementedError
 
-    def get_unack(self):
+    def get_unshelve(self, after=None, limit=None):
+        raise NotImplementedError
+
+    def get_unack(self, after=None, limit=None):
+        raise NotImplementedError
+
+    def acquire_lease(self, name, owner, ttl):
+        raise NotImplementedError
+
+    def release_lease(self, name, owner):
+        raise NotImplementedError
+
+    def prune_tombstones(self):
+        raise NotImplementedError
+
+    def prune_history(self, batch_size=1000):
+        raise NotImplementedError
+
+    def migrate_history(self, batch_size=1000):
         raise NotImplementedError
 
 
 class QueryBuilder(Base):
 
+    query_cache = None  # type: TTLCache
+
     def __init__(self, app=None):
         self.app = None
         if app is not None:
@@ -0,0 +1,50 @@
+import threading
+from bisect import bisect_left
+
+
+class QueryStats:
+    """
+    Per-method query timing histograms for a database backend. Nothing is
+    recorded, and callers should skip timing entirely, unless "enabled".
+    """
+
+    BOUNDS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]  # seconds
+
+    def __init__(self, timing=False, slow_query_threshold=0):
+        self.timing = timing
+        self.slow_query_threshold = slow_query_threshold / 1000.0 if slow_query_threshold else None
+        self.enabled = bool(self.timing or self.slow_query_threshold)
+
+        self._lock = threading.Lock()
+        self._series = {}  # type: dict
+
+    def observe(self, method, duration):
+        if not self.timing:
+            return
+        i = bisect_left(self.BOUNDS, duration)
+        with self._lock:
+            if method not in self._series:
+                self._series[method] = [[0] * len(self.BOUNDS), 0.0, 0]
+            s = self._series[method]
+            if i < len(self.BOUNDS):
+                s[0][i] += 1
+            s[1] += duration
+            s[2] += 1
+
+    def is_slow(self, duration):
+        return self.slow_query_threshold is not None and duration >= self.slow_query_threshold
+
+    @property
+    def histograms(self):
+        """
+        Return cumulative bucket counts, sum and count of query times by method.
+        """
+        with self._lock:
+            series = {}
+            for method, (buckets, total, count) in self._series.items():
+                cumulative, running = [], 0
+                for n in buckets:
+                    running += n
+                    cumulative.append(running)
+                series[method] = {'buckets': cumulative, 'sum': total, 'count': count}
+            return series
@@ -2,20 +2,20 @@ import datetime
 import os
 import time
 
-from flask import (Response, current_app, g, jsonify, render_template, request,
+from flask import (Response, current_app, jsonify, render_template, request,
                    url_for)
 from flask_cors import cross_origin
 
-from alerta.app import db
+from alerta.app import audit, db, plugins, qb
 from alerta.auth.decorators import permission
-from alerta.exceptions import ApiError, RejectException
+from alerta.database.stats import QueryStats
+from alerta.exceptions import ApiError
 from alerta.models.alert import Alert
 from alerta.models.enums import Scope
 from alerta.models.heartbeat import Heartbeat
-from alerta.models.metrics import Counter, Gauge, Timer
+from alerta.models.metrics import Counter, Gauge, Histogram, Timer
 from alerta.models.switch import Switch, SwitchState
-from alerta.utils.api import process_action
-from alerta.utils.audit import write_audit_trail
+from alerta.utils.housekeeping import housekeeper
 from alerta.version import __version__
 
 from . import mgmt
@@ -148,51 +148,23 @@ def housekeeping():
     expired_threshold = request.args.get('expired', default=current_app.config['DEFAULT_EXPIRED_DELETE_HRS'], type=int)
     info_threshold = request.args.get('info', default=current_app.config['DEFAULT_INFO_DELETE_HRS'], type=int)
 
-    has_expired, shelve_timeout, ack_timeout = Alert.housekeeping(expired_threshold, info_threshold)
-
-    errors = []
-    for alert in has_expired:
-        try:
-            alert, _, text, timeout = process_action(alert, action='expired', text='', timeout=None)
-            alert = alert.from_expired(text, timeout)
-        except RejectException as e:
-            write_audit_trail.send(current_app._get_current_object(), event='alert-expire-rejected', message=alert.text,
-                                   user=g.login, customers=g.customers, scopes=g.scopes, resource_id=alert.id, type='alert',
-                                   request=request)
-            errors.append(str(e))
-            continue
-        except Exception as e:
-            raise ApiError(str(e), 500)
-
-        write_audit_trail.send(current_app._get_current_object(), event='alert-expired', message=text, user=g.login,
-                               customers=g.customers, scopes=g.scopes, resource_id=alert.id, type='alert', request=request)
-
-    for alert in shelve_timeout + ack_timeout:
-        print('>>>>>>>>> {}'.format(alert))
-        try:
-            alert, _, text, timeout = process_action(alert, action='timeout', text='', timeout=None)
-            alert = alert.from_timeout(text, timeout)
-        except RejectException as e:
-            write_audit_trail.send(current_app._get_current_object(), event='alert-timeout-rejected', message=alert.text,
-                                   user=g.login, customers=g.customers, scopes=g.scopes, resource_id=alert.id, type='alert',
-                                   request=request)
-            errors.append(str(e))
-            continue
-        except Exception as e:
-            raise ApiError(str(e), 500)
-
-        write_audit_trail.send(current_app._get_current_object(), event='alert-timeout', message=text, user=g.login,
-                               customers=g.customers, scopes=g.scopes, resource_id=alert.id, type='alert', request=request)
-
-    if errors:
-        raise ApiError('housekeeping failed', 500, errors=errors)
+    try:
+        result = housekeeper.run_once(expired_threshold, info_threshold)
+    except ApiError:
+        raise
+    except Exception as e:
+        raise ApiError(str(e), 500)
+
+    if result['errors']:
+        raise ApiError('housekeeping failed', 500, errors=result['errors'])
     else:
         return jsonify(
             status='ok',
-            expired=[a.id for a in has_expired],
-            unshelve=[a.id for a in shelve_timeout],
-            unack=[a.id for a in ack_timeout],
-            count=len(has_expired) + len(shelve_timeout) + len(ack_timeout)
+            expired=result['expired'],
+            unshelve=result['unshelve'],
+            unack=result['unack'],
+            count=len(result['expired']) + len(result['unshelve']) + len(result['unack']),
+            more=result['more']
         )
 
 
@@ -207,6 +179,9 @@ def status():
     metrics = Gauge.find_all()
     metrics.extend(Counter.find_all())
     metrics.extend(Timer.find_all())
+    metrics.extend(pool_metrics())
+    metrics.extend(query_metrics())
+    metrics.extend(query_cache_metrics())
     metrics.extend(Switch.find_all())
 
     return jsonify(application='alerta', version=__version__, time=now, uptime=int(now - started),
@@ -223,8 +198,82 @@ def prometheus_metrics():
     output = Gauge.find_all()
     output += Counter.find_all()
     output += Timer.find_all()
+    output += pool_metrics()
+    output += query_metrics()
+    output += query_cache_metrics()
+    output += plugin_metrics()
+    output += audit_metrics()
 
     return Response(
         [o.serialize(format='prometheus') for o in output],
         content_type='text/plain; version=0.0.4; charset=utf-8'
     )
+
+
+def pool_metrics():
+    gauges = {
+        'size': ('Pool size', 'Number of open database connections'),
+        'idle': ('Idle connections', 'Number of idle database connections'),
+        'in_use': ('Connections in use', 'Number of database connections in use'),
+        'max_size': ('Maximum pool size', 'Maximum number of database connections')
+    }
+    counters = {
+        'checkouts': ('Connection checkouts', 'Number of database connections checked out of the pool'),
+        'waits': ('Connection waits', 'Number of times a request waited for a free database connection'),
+        'timeouts': ('Connection timeouts', 'Number of times a request timed out waiting for a free database connection'),
+        'discarded': ('Discarded connections', 'Number of broken or stale database connections discarded from the pool')
+    }
+    metrics = []
+    for name, value in db.pool_stats.items():
+        if name in gauges:
+            metrics.append(Gauge('pool', name, *gauges[name], value=value))
+        elif name in counters:
+            metrics.append(Counter('pool', name, *counters[name], count=value))
+    return metrics
+
+
+def audit_metrics():
+    if not audit.sender:
+        return []
+    counters = {
+        'sent': ('Audit events sent', 'Number of audit events sent to the audit URL'),
+        'dropped': ('Audit events dropped', 'Number of audit events dropped because the queue was full'),
+        'spilled': ('Audit events spilled', 'Number of audit events written to the spill file because the queue was full'),
+        'errors': ('Audit send errors', 'Number of failed attempts to send audit events')
+    }
+    metrics = [Gauge('audit', 'queue_depth', 'Audit queue depth', 'Number of audit events waiting to be sent',
+                     value=audit.sender.queue_depth)]
+    for name, value in audit.sender.stats.items():
+        metrics.append(Counter('audit', name, *counters[name], count=value))
+    return metrics
+
+
+def plugin_metrics():
+    histograms = plugins.stats.histograms
+    if not histograms:
+        return []
+    return [Histogram('plugins', 'hook_seconds', 'Plugin hooks',
+                      'Time spent running plugin hooks by plugin and hook',
+                      label=('plugin', 'hook'), bounds=QueryStats.BOUNDS, series=histograms)]
+
+
+def query_cache_metrics():
+    cache = qb.query_cache
+    if cache is None:
+        return []
+    return [
+        Counter('query_cache', 'hits', 'Query cache hits', 'Number of "q" queries found already parsed', count=cache.hits),
+        Counter('query_cache', 'misses', 'Query cache misses', 'Number of "q" queries that were parsed', count=cache.misses),
+        Gauge('query_cache', 'hit_ratio', 'Query cache hit ratio', 'Ratio of "q" queries found already parsed',
+              value=round(cache.hit_ratio, 4)),
+        Gauge('query_cache', 'size', 'Query cache size', 'Number of parsed "q" queries in the cache', value=len(cache))
+    ]
+
+
+def query_metrics():
+    histograms = db.query_histograms
+    if not histograms:
+        return []
+    return [Histogram('database', 'query_seconds', 'Database queries',
+                      'Time spent executing database queries by backend method',
+                      label='method', bounds=QueryStats.BOUNDS, series=histograms)]
@@ -1,21 +1,26 @@
 import os
 import platform
 import sys
+from copy import copy
 from datetime import datetime
+from operator import attrgetter
 from typing import Optional  # noqa
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Dict, List, Set, Tuple, Union
 from uuid import uuid4
 
 from flask import current_app, g
+from werkzeug.datastructures import MultiDict
 
 from alerta.app import alarm_model, db
 from alerta.database.base import Query
+from alerta.exceptions import ApiError
+from alerta.models.blackout import blackout_index
 from alerta.models.enums import ChangeType
 from alerta.models.history import History, RichHistory
 from alerta.models.note import Note
 from alerta.utils.format import DateTime
 from alerta.utils.hooks import status_change_hook
-from alerta.utils.response import absolute_url
+from alerta.utils.response import absolute_url_prefix
 
 JSON = Dict[str, Any]
 NoneType = type(None)
@@ -23,6 +28,21 @@ NoneType = type(None)
 
 class Alert:
 
+    __slots__ = (
+        'id', 'resource', 'event', 'environment', 'project', 'severity', 'correlate', 'status', 'service', 'group',
+        'value', 'text', 'tags', 'attributes', 'origin', 'event_type', 'create_time', 'timeout', 'raw_data', 'customer',
+        'duplicate_count', 'repeat', 'previous_severity', 'trend_indication', 'receive_time', 'last_receive_id',
+        'last_receive_time', 'update_time', '_history', '_history_rows'
+    )
+
+    # fields that can be selected with "fields", as named in the alert body
+    FIELDS = (
+        'id', 'resource', 'event', 'environment', 'project', 'severity', 'correlate', 'status', 'service', 'group',
+        'value', 'text', 'tags', 'attributes', 'origin', 'type', 'createTime', 'timeout', 'rawData', 'customer',
+        'duplicateCount', 'repeat', 'previousSeverity', 'trendIndication', 'receiveTime', 'lastReceiveId',
+        'lastReceiveTime', 'updateTime', 'history'
+    )
+
     def __init__(self, resource: str, event: str, **kwargs) -> None:
 
         if not resource:
@@ -79,6 +99,27 @@ class Alert:
         self.update_time = kwargs.get('update_time', None)
         self.history = kwargs.get('history', None) or list()
 
+    @property
+    def history(self) -> List[History]:
+        if self._history is None:
+            self._history = [History.from_db(h) for h in self._history_rows]
+            self._history_rows = ()
+        return self._history
+
+    @history.setter
+    def history(self, history: List[History]) -> None:
+        self._history = history
+        self._history_rows = ()
+
+    @property
+    def vars(self) -> Dict[str, Any]:
+        """
+        Alert attributes by name, eg. as query parameters.
+        """
+        attrs = {name: getattr(self, name) for name in self.__slots__ if not name.startswith('_')}
+        attrs['history'] = self.history
+        return attrs
+
     @classmethod
     def parse(cls, json: JSON) -> 'Alert':
         if not isinstance(json.get('correlate', []), list):
@@ -119,9 +160,10 @@ class Alert:
 
     @property
     def serialize(self) -> Dict[str, Any]:
+        href_prefix = absolute_url_prefix('/alert/')
         return {
             'id': self.id,
-            'href': absolute_url('/alert/' + self.id),
+            'href': href_prefix + self.id,
             'resource': self.resource,
             'event': self.event,
             'environment': self.environment,
@@ -149,9 +191,30 @@ class Alert:
             'lastReceiveId': self.last_receive_id,
             'lastReceiveTime': self.last_receive_time,
             'updateTime': self.update_time,
-            'history': [h.serialize for h in sorted(self.history, key=lambda x: x.update_time)]
+            'history': [h.serialize_with_prefix(href_prefix) for h in sorted(self.history, key=attrgetter('update_time'))]
         }
 
+    def serialize_fields(self, fields: Optional[Set[str]]) -> Dict[str, Any]:
+        body = self.serialize
+        if fields is None:
+            return body
+        return {k: v for k, v in body.items() if k in fields or k == 'href'}
+
+    @staticmethod
+    def fields_from_params(params: MultiDict) -> Optional[Set[str]]:
+        """
+        Return alert fields named by "fields" (comma-separated or repeated), or all
+        fields except ALERTS_EXCLUDE_FIELDS if not given. None means all fields.
+        """
+        fields = {f.strip() for p in params.getlist('fields') for f in p.split(',') if f.strip()} - {'href'}
+        if not fields:
+            exclude = current_app.config['ALERTS_EXCLUDE_FIELDS']
+            return set(Alert.FIELDS) - set(exclude) if exclude else None
+        unknown = fields - set(Alert.FIELDS)
+        if unknown:
+            raise ApiError('unknown alert fields: {}'.format(', '.join(sorted(unknown))), 400)
+        return fields | {'id'}
+
     def get_id(self, short: bool = False) -> str:
         return self.id[:8] if short else self.id
 
@@ -171,72 +234,114 @@ class Alert:
 
     @classmethod
     def from_document(cls, doc: Dict[str, Any]) -> 'Alert':
-        return Alert(
-            id=doc.get('id', None) or doc.get('_id'),
-            resource=doc.get('resource', None),
-            event=doc.get('event', None),
-            environment=doc.get('environment', None),
-            project=doc.get('project', None),
-            severity=doc.get('severity', None),
-            correlate=doc.get('correlate', list()),
-            status=doc.get('status', None),
-            service=doc.get('service', list()),
-            group=doc.get('group', None),
-            value=doc.get('value', None),
-            text=doc.get('text', None),
-            tags=doc.get('tags', list()),
-            attributes=doc.get('attributes', dict()),
-            origin=doc.get('origin', None),
-            event_type=doc.get('type', None),
-            create_time=doc.get('createTime', None),
-            timeout=doc.get('timeout', None),
-            raw_data=doc.get('rawData', None),
-            customer=doc.get('customer', None),
-            duplicate_count=doc.get('duplicateCount', None),
-            repeat=doc.get('repeat', None),
-            previous_severity=doc.get('previousSeverity', None),
-            trend_indication=doc.get('trendIndication', None),
-            receive_time=doc.get('receiveTime', None),
-            last_receive_id=doc.get('lastReceiveId', None),
-            last_receive_time=doc.get('lastReceiveTime', None),
-            update_time=doc.get('updateTime', None),
-            history=[History.from_db(h) for h in doc.get('history', list())]
+        return cls._from_trusted(
+            doc.get('id', None) or doc.get('_id'),
+            doc.get('resource', None),
+            doc.get('event', None),
+            doc.get('environment', None),
+            doc.get('project', None),
+            doc.get('severity', None),
+            doc.get('correlate', None),
+            doc.get('status', None),
+            doc.get('service', None),
+            doc.get('group', None),
+            doc.get('value', None),
+            doc.get('text', None),
+            doc.get('tags', None),
+            doc.get('attributes', None),
+            doc.get('origin', None),
+            doc.get('type', None),
+            doc.get('createTime', None),
+            doc.get('timeout', None),
+            doc.get('rawData', None),
+            doc.get('customer', None),
+            doc.get('duplicateCount', None),
+            doc.get('repeat', None),
+            doc.get('previousSeverity', None),
+            doc.get('trendIndication', None),
+            doc.get('receiveTime', None),
+            doc.get('lastReceiveId', None),
+            doc.get('lastReceiveTime', None),
+            doc.get('updateTime', None),
+            doc.get('history', None)
         )
 
     @classmethod
     def from_record(cls, rec) -> 'Alert':
-        return Alert(
-            id=rec.id,
-            resource=rec.resource,
-            event=rec.event,
-            environment=rec.environment,
-            project=rec.project,
-            severity=rec.severity,
-            correlate=rec.correlate,
-            status=rec.status,
-            service=rec.service,
-            group=rec.group,
-            value=rec.value,
-            text=rec.text,
-            tags=rec.tags,
-            attributes=dict(rec.attributes),
-            origin=rec.origin,
-            event_type=rec.type,
-            create_time=rec.create_time,
-            timeout=rec.timeout,
-            raw_data=rec.raw_data,
-            customer=rec.customer,
-            duplicate_count=rec.duplicate_count,
-            repeat=rec.repeat,
-            previous_severity=rec.previous_severity,
-            trend_indication=rec.trend_indication,
-            receive_time=rec.receive_time,
-            last_receive_id=rec.last_receive_id,
-            last_receive_time=rec.last_receive_time,
-            update_time=getattr(rec, 'update_time'),
-            history=[History.from_db(h) for h in rec.history]
+        return cls._from_trusted(
+            rec.id,
+            rec.resource,
+            rec.event,
+            rec.environment,
+            rec.project,
+            rec.severity,
+            rec.correlate,
+            rec.status,
+            rec.service,
+            rec.group,
+            rec.value,
+            rec.text,
+            rec.tags,
+            dict(rec.attributes or {}),
+            rec.origin,
+            rec.type,
+            rec.create_time,
+            rec.timeout,
+            rec.raw_data,
+            rec.customer,
+            rec.duplicate_count,
+            rec.repeat,
+            rec.previous_severity,
+            rec.trend_indication,
+            rec.receive_time,
+            rec.last_receive_id,
+            rec.last_receive_time,
+            getattr(rec, 'update_time'),
+            rec.history
         )
 
+    @classmethod
+    def _from_trusted(cls, id, resource, event, environment, project, severity, correlate, status, service, group,
+                      value, text, tags, attributes, origin, event_type, create_time, timeout, raw_data, customer,
+                      duplicate_count, repeat, previous_severity, trend_indication, receive_time, last_receive_id,
+                      last_receive_time, update_time, history) -> 'Alert':
+        """
+        Same as Alert() for values read from the database, which were validated when they
+        were saved, so only defaults are applied. History entries are decoded on first use.
+        """
+        alert = cls.__new__(cls)
+        alert.id = id
+        alert.resource = resource
+        alert.event = event
+        alert.environment = environment or ''
+        alert.project = project or ''
+        alert.severity = severity or alarm_model.DEFAULT_NORMAL_SEVERITY
+        alert.correlate = correlate or list()
+        alert.status = status or alarm_model.DEFAULT_STATUS
+        alert.service = service or list()
+        alert.group = group or 'Misc'
+        alert.value = value
+        alert.text = text or ''
+        alert.tags = tags or list()
+        alert.attributes = attributes or dict()
+        alert.origin = origin
+        alert.event_type = event_type or 'exceptionAlert'
+        alert.create_time = create_time
+        alert.timeout = timeout if timeout is not None else current_app.config['ALERT_TIMEOUT']
+        alert.raw_data = raw_data
+        alert.customer = customer
+        alert.duplicate_count = duplicate_count
+        alert.repeat = repeat
+        alert.previous_severity = previous_severity
+        alert.trend_indication = trend_indication
+        alert.receive_time = receive_time
+        alert.last_receive_id = last_receive_id
+        alert.last_receive_time = last_receive_time
+        alert.update_time = update_time
+        alert._history = None
+        alert._history_rows = history or ()
+        return alert
+
     @classmethod
     def from_db(cls, r: Union[Dict, Tuple]) -> 'Alert':
         if isinstance(r, dict):
@@ -252,6 +357,10 @@ class Alert:
         """Return correlated alert or None"""
         return Alert.from_db(db.is_correlated(self))
 
+    def is_duplicate_or_correlated(self) -> Optional['Alert']:
+        """Return duplicate alert, or correlated alert if no duplicate, or None"""
+        return Alert.from_db(db.is_duplicate_or_correlated(self))
+
     def is_flapping(self, window: int = 1800, count: int = 2) -> bool:
         return db.is_flapping(self, window, count)
 
@@ -259,7 +368,19 @@ class Alert:
         return [(h.status, h.value) for h in self.get_alert_history(self, page=1, page_size=10) if h.status]
 
     def _get_hist_info(self, action=None):
-        h_loop = self.get_alert_history(alert=self)
+        return self._hist_info(self.get_alert_history(alert=self), action)
+
+    def _get_hist_info_from(self, existing: 'Alert', action=None):
+        """Same as _get_hist_info() but uses the history of an alert already fetched from the database."""
+        h_loop = sorted(
+            [h for h in existing.history if h.event == self.event or self.event in (existing.correlate or [])],
+            key=lambda h: h.update_time,
+            reverse=True
+        )
+        return self._hist_info(h_loop, action)
+
+    @staticmethod
+    def _hist_info(h_loop, action=None):
         if len(h_loop) == 1:
             return h_loop[0].status, h_loop[0].value, None, None
         if action == ChangeType.unack:
@@ -275,9 +396,13 @@ class Alert:
 
     # de-duplicate an alert
     def deduplicate(self, duplicate_of) -> 'Alert':
+        history = self._deduplicate(duplicate_of)
+        return Alert.from_db(db.dedup_alert(self, history))
+
+    def _deduplicate(self, duplicate_of: 'Alert') -> Optional[History]:
         now = datetime.utcnow()
 
-        status, previous_value, previous_status, _ = self._get_hist_info()
+        status, previous_value, previous_status, _ = self._get_hist_info_from(duplicate_of)
 
         _, new_status = alarm_model.transition(
             alert=self,
@@ -324,16 +449,20 @@ class Alert:
             history = None
 
         self.status = new_status
-        return Alert.from_db(db.dedup_alert(self, history))
+        return history
 
     # correlate an alert
     def update(self, correlate_with) -> 'Alert':
+        history = self._update(correlate_with)
+        return Alert.from_db(db.correlate_alert(self, history))
+
+    def _update(self, correlate_with: 'Alert') -> List[History]:
         now = datetime.utcnow()
 
-        self.previous_severity = db.get_severity(self)
+        self.previous_severity = correlate_with.severity
         self.trend_indication = alarm_model.trend(self.previous_severity, self.severity)
 
-        status, _, previous_status, _ = self._get_hist_info()
+        status, _, previous_status, _ = self._get_hist_info_from(correlate_with)
 
         _, new_status = alarm_model.transition(
             alert=self,
@@ -368,10 +497,14 @@ class Alert:
         )]
 
         self.status = new_status
-        return Alert.from_db(db.correlate_alert(self, history))
+        return history
 
     # create an alert
     def create(self) -> 'Alert':
+        self._create()
+        return Alert.from_db(db.create_alert(self))
+
+    def _create(self) -> None:
         now = datetime.utcnow()
 
         trend_indication = alarm_model.trend(alarm_model.DEFAULT_PREVIOUS_SEVERITY, self.severity)
@@ -402,7 +535,84 @@ class Alert:
             timeout=self.timeout
         )]
 
-        return Alert.from_db(db.create_alert(self))
+    # de-duplicate, correlate or create a batch of alerts
+    @staticmethod
+    def ingest_all(alerts: List['Alert']) -> List[Union['Alert', Exception]]:
+        """
+        Process a batch of received alerts using one lookup and at most one write
+        per change type for every round. Alerts that share an environment, resource
+        and customer are deferred to a later round so they are applied in order.
+        Alerts that another request created first are looked up again once, so they
+        are de-duplicated or correlated instead.
+        """
+        results = [None] * len(alerts)  # type: List[Union[Alert, Exception]]
+        retried = set()  # type: Set[int]
+        pending = list(enumerate(alerts))
+        while pending:
+            batch, deferred, seen = [], [], set()
+            for i, alert in pending:
+                key = (alert.environment, alert.resource, alert.customer)
+                if key in seen:
+                    deferred.append((i, alert))
+                else:
+                    seen.add(key)
+                    batch.append((i, alert))
+            conflicts = [(i, alert) for i, alert in Alert._ingest_batch(batch, results) if i not in retried]
+            retried.update(i for i, _ in conflicts)
+            pending = conflicts + deferred  # before later alerts with the same key
+        return results
+
+    @staticmethod
+    def _ingest_batch(batch: List[Tuple[int, 'Alert']], results: List[Union['Alert', Exception]]) -> List[Tuple[int, 'Alert']]:
+        """
+        Process one round of alerts, and return alerts as received that could not be
+        created because an alert with the same key was created since the lookup.
+        """
+        try:
+            existing = db.get_duplicates_or_correlated([alert for _, alert in batch])
+        except Exception as e:
+            for i, _ in batch:
+                results[i] = e
+            return []
+
+        created, deduplicated, correlated = [], [], []
+        received, conflicts = dict(), []  # type: Dict[int, Alert], List[Tuple[int, Alert]]
+        for (i, alert), match in zip(batch, existing):
+            try:
+                match = Alert.from_db(match) if match else None
+                if not match:
+                    received[i] = copy(alert)
+                    alert._create()
+                    created.append((i, alert.id, alert, None))
+                elif match.event == alert.event and match.severity == alert.severity:
+                    history = alert._deduplicate(match)
+                    deduplicated.append((i, match.id, alert, history))
+                else:
+                    history = alert._update(match)
+                    correlated.append((i, match.id, alert, history))
+            except Exception as e:
+                results[i] = e
+
+        for write, changes in [
+            (lambda c: db.create_alerts([alert for _, _, alert, _ in c]), created),
+            (lambda c: db.dedup_alerts([(id, alert, history) for _, id, alert, history in c]), deduplicated),
+            (lambda c: db.correlate_alerts([(id, alert, history) for _, id, alert, history in c]), correlated)
+        ]:
+            if not changes:
+                continue
+            try:
+                rows = write(changes)
+            except Exception as e:
+                for i, *_ in changes:
+                    results[i] = e
+                continue
+            by_id = {a.id: a for a in [Alert.from_db(r) for r in rows]}
+            for i, id, _, _ in changes:
+                results[i] = by_id.get(id) or ApiError('insert or update of received alert failed', 500)
+                if i in received and id not in by_id:
+                    conflicts.append((i, received[i]))
+
+        return conflicts
 
     # retrieve an alert
     @staticmethod
@@ -414,7 +624,7 @@ class Alert:
         if not current_app.config['NOTIFICATION_BLACKOUT']:
             if self.severity in current_app.config['BLACKOUT_ACCEPT']:
                 return False
-        return db.is_blackout_period(self)
+        return blackout_index.is_blackout(self)
 
     @property
     def is_suppressed(self) -> bool:
@@ -478,8 +688,27 @@ class Alert:
 
     # search alerts
     @staticmethod
-    def find_all(query: Query = None, page: int = 1, page_size: int = 1000) -> List['Alert']:
-        return [Alert.from_db(alert) for alert in db.get_alerts(query, page, page_size)]
+    def find_all(query: Query = None, page: int = 1, page_size: int = 1000, fields: Set[str] = None) -> List['Alert']:
+        return [Alert.from_db(alert) for alert in db.get_alerts(query, page, page_size, fields)]
+
+    # list alerts changed since watermark, with ids of deleted alerts and of alerts that no longer match
+    @staticmethod
+    def find_changed_since(query: Query = None, changed_since: datetime = None, customers: List[str] = None,
+                           page_size: int = 1000, fields: Set[str] = None) -> Tuple[List['Alert'], List[str], List[str], datetime, bool]:
+        alerts, deleted, removed, watermark, more = db.get_alerts_changed_since(query, changed_since, customers, page_size, fields)
+        return [Alert.from_db(alert) for alert in alerts], deleted, removed, watermark, more
+
+    # find alerts by ids, that also match query
+    @staticmethod
+    def find_by_ids(ids: List[str], query: Query = None) -> List['Alert']:
+        return [Alert.from_db(alert) for alert in db.get_alerts_by_ids(ids, query)]
+
+    # list alerts with severity and status counts
+    @staticmethod
+    def find_all_with_counts(query: Query = None, page: int = 1, page_size: int = 1000, cursor: List[Any] = None,
+                             fields: Set[str] = None) -> Tuple[List['Alert'], Dict[str, int], Dict[str, int], Optional[List[Any]]]:
+        alerts, severity_count, status_count, next_key = db.get_alerts_and_counts(query, page, page_size, cursor, fields)
+        return [Alert.from_db(alert) for alert in alerts], severity_count, status_count, next_key
 
     @staticmethod
     def get_alert_history(alert, page=1, page_size=100):
@@ -487,8 +716,8 @@ class Alert:
 
     # list alert history
     @staticmethod
-    def get_history(query: Query = None, page=1, page_size=1000) -> List[RichHistory]:
-        return [RichHistory.from_db(hist) for hist in db.get_history(query, page, page_size)]
+    def get_history(query: Query = None, page=1, page_size=1000, cursor: List[Any] = None) -> List[RichHistory]:
+        return [RichHistory.from_db(hist) for hist in db.get_history(query, page, page_size, cursor)]
 
     # get total count
     @staticmethod
@@ -500,6 +729,12 @@ class Alert:
     def get_counts_by_severity(query: Query = None) -> Dict[str, Any]:
         return db.get_counts_by_severity(query)
 
+    # get severity and status counts
+    @staticmethod
+    def get_counts_by_severity_and_status(query: Query = None) -> Tuple[Dict[str, int], Dict[str, int]]:
+        _, severity_count, status_count, _ = db.get_alerts_and_counts(query, page_size=0)
+        return severity_count, status_count
+
     # get status counts
     @staticmethod
     def get_counts_by_status(query: Query = None) -> Dict[str, Any]:
@@ -545,6 +780,26 @@ class Alert:
     def get_tags(query: Query = None) -> List[str]:
         return db.get_alert_tags(query)
 
+    # get alert counts by environment and dimension from rollups (unfiltered only)
+    @staticmethod
+    def get_rollup(dimension: str, customers: List[str] = None) -> List[Dict[str, Any]]:
+        key = {'environment': None, 'tag': 'tag'}.get(dimension, dimension)
+        counts = dict()  # type: Dict[Tuple[str, str], Dict[str, Any]]
+        for environment, value, severity, status, count in db.get_rollups(dimension, customers):
+            entry = counts.get((environment, value))
+            if entry is None:
+                entry = counts[(environment, value)] = {'environment': environment}
+                if key:
+                    entry[key] = value
+                if dimension not in ['group', 'tag']:
+                    entry.update(severityCounts=dict(), statusCounts=dict())
+                entry['count'] = 0
+            if dimension not in ['group', 'tag']:
+                entry['severityCounts'][severity] = entry['severityCounts'].get(severity, 0) + count
+                entry['statusCounts'][status] = entry['statusCounts'].get(status, 0) + count
+            entry['count'] += count
+        return list(counts.values())
+
     # add note
     def add_note(self, text: str) -> Note:
         return Note.from_alert(self, text)
@@ -555,12 +810,21 @@ class Alert:
         return [Note.from_db(note) for note in notes]
 
     @staticmethod
-    def housekeeping(expired_threshold: int = 2, info_threshold: int = 12) -> Tuple[List['Alert'], List['Alert'], List['Alert']]:
-        return (
-            [Alert.from_db(alert) for alert in db.get_expired(expired_threshold, info_threshold)],
-            [Alert.from_db(alert) for alert in db.get_unshelve()],
-            [Alert.from_db(alert) for alert in db.get_unack()]
-        )
+    def delete_expired(expired_threshold: int = 2, info_threshold: int = 12) -> None:
+        db.delete_expired(expired_threshold, info_threshold)
+
+    # alerts to expire or time out, in id order after "after"
+    @staticmethod
+    def find_expired(after: str = None, limit: int = None) -> List['Alert']:
+        return [Alert.from_db(alert) for alert in db.get_expired(after=after, limit=limit)]
+
+    @staticmethod
+    def find_unshelve(after: str = None, limit: int = None) -> List['Alert']:
+        return [Alert.from_db(alert) for alert in db.get_unshelve(after=after, limit=limit)]
+
+    @staticmethod
+    def find_unack(after: str = None, limit: int = None) -> List['Alert']:
+        return [Alert.from_db(alert) for alert in db.get_unack(after=after, limit=limit)]
 
     def from_status(self, status: str, text: str = '', timeout: int = None) -> 'Alert':
         now = datetime.utcnow()
@@ -591,9 +855,24 @@ class Alert:
         )
 
     def from_action(self, action: str, text: str = '', timeout: int = None) -> 'Alert':
+        change = self._action_change(self._get_hist_info(action), action, text, timeout, now=datetime.utcnow())
+        return Alert.from_db(db.set_alert(**change))
+
+    @staticmethod
+    def from_actions(actions: List[Tuple['Alert', str, str, Optional[int]]]) -> List['Alert']:
+        """
+        Same as from_action() for a batch of (alert, action, text, timeout), using the
+        history of each alert as fetched and a single database update.
+        """
         now = datetime.utcnow()
+        changes = [
+            alert._action_change(alert._get_hist_info_from(alert, action), action, text, timeout, now)
+            for alert, action, text, timeout in actions
+        ]
+        return [Alert.from_db(alert) for alert in db.set_alerts(changes)] if changes else []
 
-        status, _, previous_status, previous_timeout = self._get_hist_info(action)
+    def _action_change(self, hist_info, action: str, text: str, timeout: Optional[int], now: datetime) -> Dict[str, Any]:
+        status, _, previous_status, previous_timeout = hist_info
 
         if action in ['unack', 'unshelve', 'timeout']:
             timeout = timeout or previous_timeout
@@ -633,7 +912,7 @@ class Alert:
             timeout=timeout
         )]
 
-        return Alert.from_db(db.set_alert(
+        return dict(
             id=self.id,
             severity=new_severity,
             status=new_status,
@@ -642,7 +921,7 @@ class Alert:
             timeout=self.timeout,
             previous_severity=self.severity if new_severity != self.severity else self.previous_severity,
             update_time=now,
-            history=history)
+            history=history
         )
 
     def from_expired(self, text: str = '', timeout: int = None):
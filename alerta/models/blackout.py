@@ -1,3 +1,4 @@
+import time
 from datetime import datetime, timedelta
 from typing import Any, Dict, List, Optional, Tuple, Union
 from uuid import uuid4
@@ -189,7 +190,9 @@ class Blackout:
 
     # create a blackout
     def create(self) -> 'Blackout':
-        return Blackout.from_db(db.create_blackout(self))
+        blackout = Blackout.from_db(db.create_blackout(self))
+        blackout_index.invalidate()  # after the write, so a rebuild in between can't miss it
+        return blackout
 
     # get a blackout
     @staticmethod
@@ -197,15 +200,84 @@ class Blackout:
         return Blackout.from_db(db.get_blackout(id, customers))
 
     @staticmethod
-    def find_all(query: Query = None) -> List['Blackout']:
-        return [Blackout.from_db(blackout) for blackout in db.get_blackouts(query)]
+    def find_all(query: Query = None, page: int = 1, page_size: int = None, cursor: List[Any] = None) -> List['Blackout']:
+        return [Blackout.from_db(blackout) for blackout in db.get_blackouts(query, page, page_size, cursor)]
 
     def update(self, **kwargs) -> 'Blackout':
         if kwargs.get('startTime'):
             kwargs['startTime'] = DateTime.parse(kwargs['startTime'])
         if kwargs.get('endTime'):
             kwargs['endTime'] = DateTime.parse(kwargs['endTime'])
-        return Blackout.from_db(db.update_blackout(self.id, **kwargs))
+        blackout = Blackout.from_db(db.update_blackout(self.id, **kwargs))
+        blackout_index.invalidate()
+        return blackout
 
     def delete(self) -> bool:
-        return db.delete_blackout(self.id)
+        deleted = db.delete_blackout(self.id)
+        blackout_index.invalidate()
+        return deleted
+
+
+class BlackoutIndex:
+    """
+    In-memory index of current and pending blackouts, bucketed by environment, so
+    that checking an alert against blackout periods does not query the database.
+
+    The index is rebuilt after BLACKOUT_CACHE_TTL seconds, or immediately after a
+    blackout is created, updated or deleted by this process. Alerts created before
+    the index lookback window are checked against the database instead.
+    """
+
+    LOOKBACK = timedelta(hours=1)
+
+    def __init__(self) -> None:
+        self._index = {}  # type: Dict[str, List[Tuple]]
+        self._window_start = None  # type: Optional[datetime]
+        self._expires = 0.0
+        self._app = None
+
+    def invalidate(self) -> None:
+        self._expires = 0.0
+
+    def is_blackout(self, alert) -> bool:
+        ttl = current_app.config['BLACKOUT_CACHE_TTL']
+        if not ttl:
+            return db.is_blackout_period(alert)
+        if time.monotonic() >= self._expires or self._app is not current_app._get_current_object():
+            self._refresh(ttl)
+        if alert.create_time < self._window_start:
+            return db.is_blackout_period(alert)
+
+        blackouts = self._index.get(alert.environment)
+        if not blackouts:
+            return False
+
+        create_time = alert.create_time
+        service = set(alert.service or [])
+        tags = set(alert.tags or [])
+        check_customer = current_app.config['CUSTOMER_VIEWS']
+        for start_time, end_time, b_resource, b_event, b_group, b_service, b_tags, b_customer in blackouts:
+            if (start_time <= create_time < end_time
+                    and (b_resource is None or b_resource == alert.resource)
+                    and (b_event is None or b_event == alert.event)
+                    and (b_group is None or b_group == alert.group)
+                    and b_service <= service
+                    and b_tags <= tags
+                    and (not check_customer or b_customer is None or b_customer == alert.customer)):
+                return True
+        return False
+
+    def _refresh(self, ttl: int) -> None:
+        window_start = datetime.utcnow() - self.LOOKBACK
+        index = {}  # type: Dict[str, List[Tuple]]
+        for b in [Blackout.from_db(r) for r in db.get_blackouts_ending_after(window_start)]:
+            index.setdefault(b.environment, []).append((
+                b.start_time, b.end_time, b.resource, b.event, b.group,
+                frozenset(b.service or []), frozenset(b.tags or []), b.customer
+            ))
+        self._index, self._window_start = index, window_start
+        self._app = current_app._get_current_object()
+        self._expires = time.monotonic() + ttl
+
+
+blackout_index = BlackoutIndex()
@@ -1,8 +1,11 @@
 from typing import Any, Dict, List, Optional, Tuple, Union
 from uuid import uuid4
 
+from flask import current_app
+
 from alerta.app import db
 from alerta.database.base import Query
+from alerta.utils.cache import MISSING, app_cache
 from alerta.utils.response import absolute_url
 
 JSON = Dict[str, Any]
@@ -61,6 +64,7 @@ class Customer:
             return cls.from_record(r)
 
     def create(self) -> 'Customer':
+        app_cache('customers').clear()
         return Customer.from_db(db.create_customer(self))
 
     @staticmethod
@@ -72,12 +76,19 @@ class Customer:
         return [Customer.from_db(customer) for customer in db.get_customers(query)]
 
     def update(self, **kwargs) -> 'Customer':
+        app_cache('customers').clear()
         return Customer.from_db(db.update_customer(self.id, **kwargs))
 
     def delete(self) -> bool:
+        app_cache('customers').clear()
         return db.delete_customer(self.id)
 
     @classmethod
     def lookup(cls, login: str, groups: List[str]) -> List[str]:
-        customers = db.get_customers_by_match(login, matches=groups)
-        return customers if customers != '*' else []
+        cache_key = (login, tuple(groups))
+        customers = app_cache('customers').get(cache_key)
+        if customers is MISSING:
+            customers = db.get_customers_by_match(login, matches=groups)
+            if current_app.config['AUTH_CACHE_TTL']:
+                app_cache('customers').set(cache_key, customers, current_app.config['AUTH_CACHE_TTL'])
+        return list(customers) if customers != '*' else []
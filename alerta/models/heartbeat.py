@@ -159,8 +159,8 @@ class Heartbeat:
 
     # search heartbeats
     @staticmethod
-    def find_all(query: Query = None) -> List['Heartbeat']:
-        return [Heartbeat.from_db(heartbeat) for heartbeat in db.get_heartbeats(query)]
+    def find_all(query: Query = None, page: int = 1, page_size: int = None, cursor: List[Any] = None) -> List['Heartbeat']:
+        return [Heartbeat.from_db(heartbeat) for heartbeat in db.get_heartbeats(query, page, page_size, cursor)]
 
     # delete a heartbeat
     def delete(self) -> bool:
@@ -1,10 +1,12 @@
 from datetime import datetime
 
-from alerta.utils.response import absolute_url
+from alerta.utils.response import absolute_url_prefix
 
 
 class History:
 
+    __slots__ = ('id', 'event', 'severity', 'status', 'value', 'text', 'change_type', 'update_time', 'user', 'timeout')
+
     def __init__(self, id, event, **kwargs):
         self.id = id
         self.event = event
@@ -19,9 +21,12 @@ class History:
 
     @property
     def serialize(self):
+        return self.serialize_with_prefix(absolute_url_prefix('/alert/'))
+
+    def serialize_with_prefix(self, href_prefix):
         return {
             'id': self.id,
-            'href': absolute_url('/alert/' + self.id),
+            'href': href_prefix + self.id,
             'event': self.event,
             'severity': self.severity,
             'status': self.status,
@@ -102,7 +107,7 @@ class RichHistory:
     def serialize(self):
         data = {
             'id': self.id,
-            'href': absolute_url('/alert/' + self.id),
+            'href': absolute_url_prefix('/alert/') + self.id,
             'resource': self.resource,
             'event': self.event,
             'environment': self.environment,
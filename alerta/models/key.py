@@ -1,15 +1,23 @@
+import logging
+import threading
 from datetime import datetime, timedelta
 from typing import Any, Dict, List, Optional, Tuple, Union
 from uuid import uuid4
 
+from flask import current_app
+
 from alerta.app import db, key_helper, qb
 from alerta.database.base import Query
 from alerta.models.enums import Scope
+from alerta.utils.background import BackgroundFlusher
+from alerta.utils.cache import MISSING, app_cache
 from alerta.utils.format import DateTime
 from alerta.utils.response import absolute_url
 
 JSON = Dict[str, Any]
 
+KEY_CACHE_SIZE = 4096  # most recently used keys kept per app
+
 
 class ApiKey:
 
@@ -107,7 +115,9 @@ class ApiKey:
         """
         Create a new API key.
         """
-        return ApiKey.from_db(db.create_key(self))
+        key = ApiKey.from_db(db.create_key(self))
+        app_cache('keys', KEY_CACHE_SIZE).clear()  # drop any negative lookups for this key
+        return key
 
     @staticmethod
     def find_by_id(key: str, user: str = None) -> Optional['ApiKey']:
@@ -132,18 +142,79 @@ class ApiKey:
 
     def update(self, **kwargs) -> 'ApiKey':
         kwargs['expireTime'] = DateTime.parse(kwargs['expireTime']) if 'expireTime' in kwargs else None
-        return ApiKey.from_db(db.update_key(self.key, **kwargs))
+        key = ApiKey.from_db(db.update_key(self.key, **kwargs))
+        app_cache('keys', KEY_CACHE_SIZE).clear()
+        return key
 
     def delete(self) -> bool:
         """
         Delete an API key.
         """
-        return db.delete_key(self.key)
+        deleted = db.delete_key(self.key)
+        app_cache('keys', KEY_CACHE_SIZE).clear()
+        return deleted
 
     @staticmethod
     def verify_key(key: str) -> Optional['ApiKey']:
-        key_info = ApiKey.from_db(db.get_key(key))
+        """
+        Verify an API key and record that it was used. Lookups are cached for
+        API_KEY_CACHE_TTL seconds, and unknown keys for API_KEY_CACHE_NEGATIVE_TTL.
+        """
+        key_cache = app_cache('keys', KEY_CACHE_SIZE)
+        key_info = key_cache.get(key)
+        if key_info is MISSING:
+            key_info = ApiKey.from_db(db.get_key(key))
+            ttl = current_app.config['API_KEY_CACHE_TTL' if key_info else 'API_KEY_CACHE_NEGATIVE_TTL']
+            if ttl:
+                key_cache.set(key, key_info, ttl)
         if key_info and key_info.expire_time > datetime.utcnow():
-            db.update_key_last_used(key)
+            key_usage.record(key_info.key)
             return key_info
         return None
+
+
+class KeyUsage(BackgroundFlusher):
+    """
+    Coalesce API key last-used time and count updates in memory and write them
+    to the database in one batch every API_KEY_USAGE_FLUSH_INTERVAL seconds.
+    """
+
+    name = 'key-usage-flush'
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._pending = {}  # type: Dict[str, Tuple[int, datetime]]
+
+    def record(self, key, count=1, last_used_time=None):
+        interval = current_app.config['API_KEY_USAGE_FLUSH_INTERVAL']
+        if not interval:
+            db.update_key_last_used(key)
+            return
+        if self.start(current_app._get_current_object(), interval):
+            with self._lock:
+                self._pending = {}  # discard any usage inherited from a parent process
+        self._merge(key, count, last_used_time or datetime.utcnow())
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            db.update_keys_last_used([(key, count, last_used_time) for key, (count, last_used_time) in pending.items()])
+        except Exception as e:
+            logging.warning('Failed to write API key usage, will retry: {}'.format(e))
+            for key, (count, last_used_time) in pending.items():
+                self._merge(key, count, last_used_time)
+
+    def _merge(self, key, count, last_used_time):
+        with self._lock:
+            if key in self._pending:
+                pending_count, pending_time = self._pending[key]
+                self._pending[key] = (pending_count + count, max(pending_time, last_used_time))
+            else:
+                self._pending[key] = (count, last_used_time)
+
+
+key_usage = KeyUsage()
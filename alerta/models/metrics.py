@@ -1,7 +1,17 @@
+import logging
+import threading
 import time
+from collections import deque
 from functools import wraps
+from typing import Dict, Tuple, Union  # noqa
+
+from flask import current_app
 
 from alerta.app import db
+from alerta.utils.background import BackgroundFlusher
+
+PERCENTILES = [0.5, 0.95, 0.99]
+RESERVOIR_SIZE = 1024  # most recent timings kept per timer for percentiles
 
 
 class Gauge:
@@ -142,17 +152,18 @@ class Counter:
             return
 
     def inc(self, count=1):
-        c = Counter.from_db(db.inc_counter(Counter(
+        aggregator.add(Counter(
             group=self.group,
             name=self.name,
             title=self.title,
             description=self.description,
             count=count
-        )))
-        self.count = c.count
+        ))
+        self.count += count
 
     @classmethod
     def find_all(cls):
+        aggregator.flush()
         return [Counter.from_db(counter) for counter in db.get_metrics(type='counter')]
 
 
@@ -169,19 +180,23 @@ class Timer:
         self.start = None
         self.count = count
         self.total_time = total_time
+        self.percentiles = {}  # type: Dict[float, float]
 
     def serialize(self, format='json'):
         if format == 'prometheus':
             return (
                 '# HELP alerta_{group}_{name} {description}\n'
                 '# TYPE alerta_{group}_{name} summary\n'
+                '{quantiles}'
                 'alerta_{group}_{name}_count {count}\n'
                 'alerta_{group}_{name}_sum {total_time}\n'.format(
-                    group=self.group, name=self.name, description=self.description, count=self.count, total_time=self.total_time
+                    group=self.group, name=self.name, description=self.description, count=self.count, total_time=self.total_time,
+                    quantiles=''.join('alerta_{}_{}{{quantile="{}"}} {}\n'.format(self.group, self.name, q, v)
+                                      for q, v in sorted(self.percentiles.items()))
                 )
             )
         else:
-            return {
+            timer = {
                 'group': self.group,
                 'name': self.name,
                 'title': self.title,
@@ -190,6 +205,9 @@ class Timer:
                 'count': self.count,
                 'totalTime': self.total_time
             }
+            for q, v in self.percentiles.items():
+                timer['p{}'.format(int(round(q * 100)))] = v
+            return timer
 
     def __repr__(self):
         return 'Timer(group={!r}, name={!r}, title={!r}, count={!r}, total_time={!r})'.format(
@@ -234,20 +252,157 @@ class Timer:
         return self._time_in_millis()
 
     def stop_timer(self, start, count=1):
-        t = Timer.from_db(db.update_timer(Timer(
+        total_time = self._time_in_millis() - start
+        aggregator.add(Timer(
             group=self.group,
             name=self.name,
             title=self.title,
             description=self.description,
             count=count,
-            total_time=(self._time_in_millis() - start)
-        )))
-        self.count = t.count
-        self.total_time = t.total_time
+            total_time=total_time
+        ))
+        aggregator.observe(self, total_time / count if count else total_time)
+        self.count += count
+        self.total_time += total_time
 
     @classmethod
     def find_all(cls):
-        return [Timer.from_db(timer) for timer in db.get_metrics(type='timer')]
+        aggregator.flush()
+        timers = [Timer.from_db(timer) for timer in db.get_metrics(type='timer')]
+        for t in timers:
+            t.percentiles = aggregator.percentiles(t)
+        return timers
+
+
+class Histogram:
+    """
+    In-process histogram with one series per label value. Each series is a dict
+    with cumulative 'buckets' counts (one per upper bound), 'sum' and 'count'.
+    For more than one label, "label" is a tuple of names and values are tuples.
+    """
+
+    def __init__(self, group, name, title=None, description=None, label=None, bounds=None, series=None):
+
+        self.group = group
+        self.name = name
+        self.title = title
+        self.description = description
+        self.type = 'histogram'
+
+        self.label = label
+        self.bounds = bounds or []
+        self.series = series or {}
+
+    def serialize(self, format='json'):
+        if format == 'prometheus':
+            metric = 'alerta_{group}_{name}'.format(group=self.group, name=self.name)
+            lines = [
+                '# HELP {metric} {description}'.format(metric=metric, description=self.description),
+                '# TYPE {metric} histogram'.format(metric=metric)
+            ]
+            for value, s in sorted(self.series.items()):
+                labels = self._labels(value)
+                for le, count in zip(self.bounds + ['+Inf'], s['buckets'] + [s['count']]):
+                    lines.append('{metric}_bucket{{{labels},le="{le}"}} {count}'.format(
+                        metric=metric, labels=labels, le=le, count=count))
+                lines.append('{metric}_sum{{{labels}}} {sum}'.format(metric=metric, labels=labels, sum=s['sum']))
+                lines.append('{metric}_count{{{labels}}} {count}'.format(metric=metric, labels=labels, count=s['count']))
+            return '\n'.join(lines) + '\n'
+        else:
+            return {
+                'group': self.group,
+                'name': self.name,
+                'title': self.title,
+                'description': self.description,
+                'type': self.type,
+                'label': self.label,
+                'bounds': self.bounds,
+                'series': {','.join(v) if isinstance(v, tuple) else v: s for v, s in self.series.items()}
+            }
+
+    def _labels(self, value):
+        if isinstance(self.label, tuple):
+            return ','.join('{}="{}"'.format(label, v) for label, v in zip(self.label, value))
+        return '{}="{}"'.format(self.label, value)
+
+    def __repr__(self):
+        return 'Histogram(group={!r}, name={!r}, title={!r}, label={!r})'.format(
+            self.group, self.name, self.title, self.label
+        )
+
+
+class MetricsAggregator(BackgroundFlusher):
+    """
+    Aggregate counter and timer updates in memory and write them to the database
+    in the background every METRICS_FLUSH_INTERVAL seconds, instead of once per update.
+    Timings are also kept in memory to report latency percentiles for this process.
+    """
+
+    name = 'metrics-flush'
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._pending = {}  # type: Dict[Tuple[str, str, str], Union[Counter, Timer]]
+        self._samples = {}  # type: Dict[Tuple[str, str], deque]
+
+    def add(self, metric):
+        interval = current_app.config['METRICS_FLUSH_INTERVAL']
+        if not interval:
+            self._write(metric)
+            return
+        if self.start(current_app._get_current_object(), interval):
+            with self._lock:
+                self._pending = {}  # discard any updates inherited from a parent process
+        self._merge(metric)
+
+    def observe(self, timer, millis):
+        key = (timer.group, timer.name)
+        with self._lock:
+            if key not in self._samples:
+                self._samples[key] = deque(maxlen=RESERVOIR_SIZE)
+            self._samples[key].append(millis)
+
+    def percentiles(self, timer):
+        with self._lock:
+            samples = sorted(self._samples.get((timer.group, timer.name), []))
+        if not samples:
+            return {}
+        return {q: samples[min(int(q * len(samples)), len(samples) - 1)] for q in PERCENTILES}
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        metrics = list(pending.values())
+        for i, metric in enumerate(metrics):
+            try:
+                self._write(metric)
+            except Exception as e:
+                logging.warning('Failed to write metrics, will retry: {}'.format(e))
+                for m in metrics[i:]:
+                    self._merge(m)
+                break
+
+    def _merge(self, metric):
+        key = (metric.type, metric.group, metric.name)
+        with self._lock:
+            if key in self._pending:
+                pending = self._pending[key]
+                pending.count += metric.count
+                if metric.type == 'timer':
+                    pending.total_time += metric.total_time
+            else:
+                self._pending[key] = metric
+
+    @staticmethod
+    def _write(metric):
+        if metric.type == 'timer':
+            db.update_timer(metric)
+        else:
+            db.inc_counter(metric)
+
+
+aggregator = MetricsAggregator()
 
 
 def timer(metric):
@@ -1,9 +1,12 @@
 from typing import Any, Dict, List, Optional, Tuple, Union
 from uuid import uuid4
 
+from flask import current_app
+
 from alerta.app import db
 from alerta.database.base import Query
 from alerta.models.enums import Scope
+from alerta.utils.cache import MISSING, app_cache
 from alerta.utils.response import absolute_url
 
 JSON = Dict[str, Any]
@@ -65,6 +68,7 @@ class Permission:
             return cls.from_record(r)
 
     def create(self) -> 'Permission':
+        app_cache('scopes').clear()
         return Permission.from_db(db.create_perm(self))
 
     @staticmethod
@@ -76,9 +80,11 @@ class Permission:
         return [Permission.from_db(perm) for perm in db.get_perms(query)]
 
     def update(self, **kwargs) -> 'Permission':
+        app_cache('scopes').clear()
         return Permission.from_db(db.update_perm(self.id, **kwargs))
 
     def delete(self) -> bool:
+        app_cache('scopes').clear()
         return db.delete_perm(self.id)
 
     @classmethod
@@ -101,4 +107,10 @@ class Permission:
 
     @classmethod
     def lookup(cls, login: str, roles: List[str]) -> List[Scope]:
-        return [Scope(s) for s in db.get_scopes_by_match(login, matches=roles)]
+        cache_key = (login, tuple(roles))
+        scopes = app_cache('scopes').get(cache_key)
+        if scopes is MISSING:
+            scopes = [Scope(s) for s in db.get_scopes_by_match(login, matches=roles)]
+            if current_app.config['AUTH_CACHE_TTL']:
+                app_cache('scopes').set(cache_key, scopes, current_app.config['AUTH_CACHE_TTL'])
+        return list(scopes)
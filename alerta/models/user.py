@@ -1,3 +1,6 @@
+import hashlib
+import hmac
+import os
 from datetime import datetime
 from typing import Any, Dict, List, Optional, Tuple, Union
 from uuid import uuid4
@@ -9,10 +12,13 @@ from alerta.auth import utils
 from alerta.database.base import Query
 from alerta.models.group import Group
 from alerta.settings import DEFAULT_ADMIN_ROLE
+from alerta.utils.cache import MISSING, app_cache
 from alerta.utils.response import absolute_url
 
 JSON = Dict[str, Any]
 
+FINGERPRINT_KEY = os.urandom(32)  # per-process secret so cached passwords are never kept in the clear
+
 
 class User:
     """
@@ -137,6 +143,7 @@ class User:
             return cls.from_record(r)
 
     def create(self) -> 'User':
+        app_cache('credentials').clear()
         return User.from_db(db.create_user(self))
 
     @staticmethod
@@ -168,6 +175,7 @@ class User:
             kwargs['password'] = utils.generate_password_hash(kwargs['password'])
         if 'role' in kwargs:
             kwargs['roles'] = [kwargs['role']]  # backwards compat
+        app_cache('credentials').clear()
         return User.from_db(db.update_user(self.id, **kwargs))
 
     # update user attributes
@@ -175,6 +183,7 @@ class User:
         return db.update_user_attributes(self.id, self.attributes, attributes)
 
     def delete(self) -> bool:
+        app_cache('credentials').clear()
         return db.delete_user(self.id)
 
     def get_groups(self):
@@ -182,8 +191,21 @@ class User:
 
     @staticmethod
     def check_credentials(username: str, password: str) -> Optional['User']:
+        """
+        Verify username and password. Successful checks are cached for AUTH_CACHE_TTL
+        seconds keyed by username and a password fingerprint, to avoid a bcrypt per request.
+        """
+        ttl = current_app.config['AUTH_CACHE_TTL']
+        if ttl:
+            cache_key = (username, hmac.new(FINGERPRINT_KEY, password.encode('utf-8'), hashlib.sha256).digest())
+            user = app_cache('credentials').get(cache_key)
+            if user is not MISSING:
+                return user
+
         user = User.find_by_username(username)
         if user and user.verify_password(password):
+            if ttl:
+                app_cache('credentials').set(cache_key, user, ttl)
             return user
         return None
 
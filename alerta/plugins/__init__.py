@@ -1,7 +1,7 @@
 import abc
 import logging
 import os
-from typing import TYPE_CHECKING, Any, Optional
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple  # noqa
 
 if TYPE_CHECKING:
     from alerta.models.alert import Alert  # noqa
@@ -11,6 +11,10 @@ LOG = logging.getLogger('alerta.plugins')
 
 class PluginBase(metaclass=abc.ABCMeta):
 
+    # hooks that only notify other systems and can run after the response is sent,
+    # any of 'post_receive', 'status_change' and 'take_action' (return values are ignored)
+    async_hooks = ()  # type: Tuple[str, ...]
+
     def __init__(self, name=None):
         self.name = name or self.__module__
         if self.__doc__:
@@ -38,6 +42,21 @@ class PluginBase(metaclass=abc.ABCMeta):
         """Trigger integrations based on external actions. (optional)"""
         raise NotImplementedError
 
+    def take_actions(self, actions: 'List[Tuple[Alert, str, str, Optional[int]]]', **kwargs) -> 'List[Any]':
+        """
+        Same as take_action() for a batch of (alert, action, text, timeout), eg. during
+        housekeeping. Returns the result, or the exception raised, for each alert. (optional)
+        """
+        results = []  # type: List[Any]
+        for alert, action, text, timeout in actions:
+            try:
+                results.append(self.take_action(alert, action, text, timeout=timeout, **kwargs))
+            except NotImplementedError:
+                raise
+            except Exception as e:
+                results.append(e)
+        return results
+
     def delete(self, alert: 'Alert', **kwargs) -> bool:
         """Trigger integrations when an alert is deleted. (optional)"""
         raise NotImplementedError
@@ -1,11 +1,19 @@
+import json
 import logging
-from typing import TYPE_CHECKING, Any, Optional
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple  # noqa
 
-from flask import request
+from flask import Flask, current_app, request
 
 from alerta.exceptions import ForwardingLoop
 from alerta.plugins import PluginBase
-from alerta.utils.client import Client
+from alerta.utils.background import BackgroundFlusher
+from alerta.utils.client import Client, CustomJsonEncoder
 from alerta.utils.response import base_url
 
 if TYPE_CHECKING:
@@ -16,6 +24,8 @@ LOG = logging.getLogger('alerta.plugins.forwarder')
 
 X_LOOP_HEADER = 'X-Alerta-Loop'
 
+MAX_BACKOFF = 300  # seconds
+
 
 def append_to_header(origin):
     x_loop = request.headers.get(X_LOOP_HEADER)
@@ -27,6 +37,207 @@ def is_in_xloop(server):
     return server in x_loop if server and x_loop else False
 
 
+class Delivery(BackgroundFlusher):
+    """
+    Send forwarded requests to remotes, using one persistent session per remote.
+
+    Requests for several remotes are sent concurrently (FWD_CONCURRENCY) and alerts can be
+    collected per remote and sent in batches (FWD_BATCH_WINDOW). Failed requests are retried
+    with exponential backoff from a bounded queue that spills to disk (FWD_RETRY_SPILL_DIR)
+    when full. While a remote is failing, new requests for it are queued without trying,
+    so an unreachable remote does not slow down the processing of alerts.
+
+    A request is a dict of remote, method, path, data and headers, so that it can be spilled
+    to disk as JSON without any credentials.
+    """
+
+    name = 'forwarder'
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._lock = threading.Lock()
+        self._clients = dict()  # type: Dict[str, Tuple[Dict[str, Any], Client]]
+        self._executor = None  # type: ThreadPoolExecutor
+        self._executor_pid = None  # type: int
+        self._batches = OrderedDict()  # type: OrderedDict
+        self._retries = deque()  # type: deque
+        self._failing = dict()  # type: Dict[str, float]
+
+    def client(self, remote: str, auth: Dict[str, Any] = None) -> Client:
+        with self._lock:
+            if remote not in self._clients or auth is not None and self._clients[remote][0] != auth:
+                if auth is None:
+                    auth = next((a for r, a, _ in current_app.config['FWD_DESTINATIONS'] if r == remote), {})
+                self._clients[remote] = (auth, Client(endpoint=remote, **auth))
+            return self._clients[remote][1]
+
+    def send(self, requests: List[Dict[str, Any]]) -> None:
+        if not requests:
+            return
+        config = current_app.config
+        if config['FWD_BATCH_WINDOW'] and all(r['path'] == '/alert' for r in requests):
+            self._start()
+            with self._lock:
+                for r in requests:
+                    self._batches.setdefault((r['remote'], r['headers'].get(X_LOOP_HEADER)), []).append(r['data'])
+            return
+
+        now = time.time()
+        requests = [r for r in requests if not self._is_failing(r, now)]
+        if config['FWD_CONCURRENCY'] > 1 and len(requests) > 1:
+            app = current_app._get_current_object()
+            for future in [self._pool().submit(self._try_in_app_context, app, r) for r in requests]:
+                future.result()
+        else:
+            for r in requests:
+                self._try(r)
+
+    def flush(self) -> None:
+        with self._lock:
+            batches, self._batches = self._batches, OrderedDict()
+        for (remote, x_loop), alerts in batches.items():
+            headers = {X_LOOP_HEADER: x_loop} if x_loop else {}
+            self._try(dict(remote=remote, method='POST', path='/alerts/_batch', data={'alerts': alerts}, headers=headers))
+        self.retry(time.time())
+
+    def retry(self, now: float) -> None:
+        """
+        Resend queued requests that are due, and reload spilled requests while there is room.
+        """
+        self._unspill()
+        with self._lock:
+            due = [r for r in self._retries if r['due'] <= now]
+            self._retries = deque(r for r in self._retries if r['due'] > now)
+        for r in due:
+            self._try(r)
+
+    def queued(self) -> int:
+        with self._lock:
+            return len(self._retries)
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(current_app.config['FWD_CONCURRENCY'], thread_name_prefix='forwarder')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _start(self) -> None:
+        self.start(current_app._get_current_object(), current_app.config['FWD_BATCH_WINDOW'] or 1)
+
+    def _is_failing(self, r: Dict[str, Any], now: float) -> bool:
+        with self._lock:
+            failing = self._failing.get(r['remote'], 0) > now
+        if failing:
+            self._queue(r, error='remote is failing')
+        return failing
+
+    def _try_in_app_context(self, app: Flask, r: Dict[str, Any]) -> None:
+        with app.app_context():
+            self._try(r)
+
+    def _try(self, r: Dict[str, Any]) -> None:
+        client = self.client(r['remote'], r.pop('auth', None))
+        headers = dict(r['headers'], **{'X-Request-ID': str(uuid.uuid4())})
+        try:
+            if r['method'] == 'POST':
+                response = client.http.post(r['path'], r['data'], headers=headers)
+            elif r['method'] == 'PUT':
+                response = client.http.put(r['path'], r['data'], headers=headers)
+            else:
+                response = client.http.delete(r['path'], headers=headers)
+        except Exception as e:
+            self._queue(r, error=str(e))
+            return
+        if response.status_code >= 500 or response.status_code == 429:
+            self._queue(r, error='[{}] {}'.format(response.status_code, response.text))
+            return
+        with self._lock:
+            self._failing.pop(r['remote'], None)
+        if r['path'] == '/alerts/_batch' and response.status_code in (404, 405):
+            # remote does not support batches, eg. an older version
+            LOG.warning('Forward [{} {}]: Remote {} does not accept batches, sending alerts one at a time'.format(
+                r['method'], r['path'], r['remote']))
+            for alert in r['data']['alerts']:
+                self._try(dict(r, path='/alert', data=alert, attempts=0))
+        elif response.status_code >= 400:
+            LOG.warning('Forward [{} {}]: Remote {} rejected request, dropped - [{}] {}'.format(
+                r['method'], r['path'], r['remote'], response.status_code, response.text))
+        else:
+            LOG.debug('Forward [{} {}]: Remote {} ; [{}] {}'.format(
+                r['method'], r['path'], r['remote'], response.status_code, response.text))
+
+    def _queue(self, r: Dict[str, Any], error: str) -> None:
+        config = current_app.config
+        attempts = r.get('attempts', 0) + 1
+        if attempts > config['FWD_RETRY_MAX_ATTEMPTS']:
+            LOG.warning('Forward [{} {}]: Failed to forward to {} after {} attempts, dropped - {}'.format(
+                r['method'], r['path'], r['remote'], attempts - 1, error))
+            return
+        LOG.warning('Forward [{} {}]: Failed to forward to {}, will retry - {}'.format(r['method'], r['path'], r['remote'], error))
+
+        backoff = min(config['FWD_RETRY_BACKOFF'] * 2 ** (attempts - 1), MAX_BACKOFF)
+        r = dict(r, attempts=attempts, due=time.time() + backoff)
+        r.pop('auth', None)
+        self._start()
+        with self._lock:
+            if error != 'remote is failing':
+                self._failing[r['remote']] = r['due']
+            if len(self._retries) < config['FWD_RETRY_QUEUE_SIZE']:
+                self._retries.append(r)
+                return
+            if not config['FWD_RETRY_SPILL_DIR']:
+                dropped = self._retries.popleft()
+                self._retries.append(r)
+                LOG.warning('Forward [{} {}]: Retry queue full, dropped request to {}'.format(
+                    dropped['method'], dropped['path'], dropped['remote']))
+                return
+            with open(self._spill_file(config['FWD_RETRY_SPILL_DIR']), 'a') as f:
+                f.write(json.dumps(r, cls=CustomJsonEncoder) + '\n')
+
+    @staticmethod
+    def _spill_file(directory: str, pid: int = None) -> str:
+        return os.path.join(directory, 'forwarder-{}.jsonl'.format(pid or os.getpid()))
+
+    def _unspill(self) -> None:
+        directory = current_app.config['FWD_RETRY_SPILL_DIR']
+        if not directory or not os.path.isdir(directory):
+            return
+        with self._lock:
+            room = current_app.config['FWD_RETRY_QUEUE_SIZE'] - len(self._retries)
+            if room <= 0:
+                return
+            for name in os.listdir(directory):
+                if not (name.startswith('forwarder-') and name.endswith('.jsonl')):
+                    continue
+                path = os.path.join(directory, name)
+                if path != self._spill_file(directory) and self._is_alive(name[len('forwarder-'):-len('.jsonl')]):
+                    continue  # spilled by another process that is still running
+                with open(path) as f:
+                    requests = [json.loads(line) for line in f if line.strip()]
+                os.unlink(path)
+                self._retries.extend(requests[:room])
+                if requests[room:]:
+                    with open(self._spill_file(directory), 'a') as f:
+                        f.writelines(json.dumps(r, cls=CustomJsonEncoder) + '\n' for r in requests[room:])
+                room -= len(requests)
+                if room <= 0:
+                    return
+
+    @staticmethod
+    def _is_alive(pid: str) -> bool:
+        try:
+            os.kill(int(pid), 0)
+        except (ValueError, ProcessLookupError):
+            return False
+        except PermissionError:
+            pass
+        return True
+
+
+delivery = Delivery()
+
+
 class Forwarder(PluginBase):
     """
     Alert and action forwarder for federated Alerta deployments
@@ -42,6 +253,7 @@ class Forwarder(PluginBase):
 
     def post_receive(self, alert: 'Alert', **kwargs) -> Optional['Alert']:
 
+        requests = []
         for remote, auth, actions in self.get_config('FWD_DESTINATIONS', default=[], type=list, **kwargs):
             if is_in_xloop(remote):
                 LOG.debug('Forward [action=alerts]: {} ; Remote {} already processed alert. Skip.'.format(alert.id, remote))
@@ -50,16 +262,10 @@ class Forwarder(PluginBase):
                 LOG.debug('Forward [action=alerts]: {} ; Remote {} not configured for alerts. Skip.'.format(alert.id, remote))
                 continue
 
-            headers = {X_LOOP_HEADER: append_to_header(base_url())}
-            client = Client(endpoint=remote, headers=headers, **auth)
-
             LOG.info('Forward [action=alerts]: {} ; {} -> {}'.format(alert.id, base_url(), remote))
-            try:
-                r = client.send_alert(**alert.get_body())
-            except Exception as e:
-                LOG.warning('Forward [action=alerts]: {} ; Failed to forward alert to {} - {}'.format(alert.id, remote, str(e)))
-                continue
-            LOG.debug('Forward [action=alerts]: {} ; [{}] {}'.format(alert.id, r.status_code, r.text))
+            requests.append(dict(remote=remote, auth=auth, method='POST', path='/alert', data=Client.alert_body(**alert.get_body()),
+                                 headers={X_LOOP_HEADER: append_to_header(base_url())}))
+        delivery.send(requests)
 
         return alert
 
@@ -74,6 +280,7 @@ class Forwarder(PluginBase):
                 action, http_origin, base_url())
             )
 
+        requests = []
         for remote, auth, actions in self.get_config('FWD_DESTINATIONS', default=[], type=list, **kwargs):
             if is_in_xloop(remote):
                 LOG.debug('Forward [action={}]: {} ; Remote {} already processed action. Skip.'.format(action, alert.id, remote))
@@ -82,16 +289,11 @@ class Forwarder(PluginBase):
                 LOG.debug('Forward [action={}]: {} ; Remote {} not configured for action. Skip.'.format(action, alert.id, remote))
                 continue
 
-            headers = {X_LOOP_HEADER: append_to_header(base_url())}
-            client = Client(endpoint=remote, headers=headers, **auth)
-
             LOG.info('Forward [action={}]: {} ; {} -> {}'.format(action, alert.id, base_url(), remote))
-            try:
-                r = client.action(alert.id, action, text)
-            except Exception as e:
-                LOG.warning('Forward [action={}]: {} ; Failed to action alert on {} - {}'.format(action, alert.id, remote, str(e)))
-                continue
-            LOG.debug('Forward [action={}]: {} ; [{}] {}'.format(action, alert.id, r.status_code, r.text))
+            requests.append(dict(remote=remote, auth=auth, method='PUT', path='/alert/{}/action'.format(alert.id),
+                                 data={'action': action, 'text': text, 'timeout': None},
+                                 headers={X_LOOP_HEADER: append_to_header(base_url())}))
+        delivery.send(requests)
 
         return alert
 
@@ -101,6 +303,7 @@ class Forwarder(PluginBase):
             http_origin = request.origin or '(unknown)'  # type: ignore
             raise ForwardingLoop('Delete forwarded by {} already processed by {}'.format(http_origin, base_url()))
 
+        requests = []
         for remote, auth, actions in self.get_config('FWD_DESTINATIONS', default=[], type=list, **kwargs):
             if is_in_xloop(remote):
                 LOG.debug('Forward [action=delete]: {} ; Remote {} already processed delete. Skip.'.format(alert.id, remote))
@@ -109,15 +312,9 @@ class Forwarder(PluginBase):
                 LOG.debug('Forward [action=delete]: {} ; Remote {} not configured for deletes. Skip.'.format(alert.id, remote))
                 continue
 
-            headers = {X_LOOP_HEADER: append_to_header(base_url())}
-            client = Client(endpoint=remote, headers=headers, **auth)
-
             LOG.info('Forward [action=delete]: {} ; {} -> {}'.format(alert.id, base_url(), remote))
-            try:
-                r = client.delete_alert(alert.id)
-            except Exception as e:
-                LOG.warning('Forward [action=delete]: {} ; Failed to delete alert on {} - {}'.format(alert.id, remote, str(e)))
-                continue
-            LOG.debug('Forward [action=delete]: {} ; [{}] {}'.format(alert.id, r.status_code, r.text))
+            requests.append(dict(remote=remote, auth=auth, method='DELETE', path='/alert/{}'.format(alert.id), data=None,
+                                 headers={X_LOOP_HEADER: append_to_header(base_url())}))
+        delivery.send(requests)
 
         return True  # always continue with local delete even if remote delete(s) fail
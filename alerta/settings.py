@@ -28,8 +28,13 @@ LOG_METHODS = ['GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'CONNECT', 'OPTIONS', 'TR
 ALARM_MODEL = 'ALERTA'  # 'ALERTA' (default) or 'ISA_18_2'
 QUERY_LIMIT = 50
 DEFAULT_PAGE_SIZE = QUERY_LIMIT  # maximum number of alerts returned by a single query
+ALERTS_EXCLUDE_FIELDS = ['history', 'rawData']  # left out of /alerts unless asked for with "fields", [] = all fields
+JSON_ENCODER = 'auto'  # 'auto' or 'orjson' to encode alert lists with orjson if installed, 'json' for the standard encoder
+JSON_STREAM_CHUNK_SIZE = 100  # alerts or history entries encoded at a time while /alerts and /alerts/history are sent, 0 = do not stream
 HISTORY_LIMIT = 100  # cap the number of alert history entries
 HISTORY_ON_VALUE_CHANGE = True  # history entry for duplicate alerts if value changes
+HISTORY_TABLE = False  # store history in a separate alert_history table (Postgres) or history collection (MongoDB)
+HISTORY_MAX_AGE = 0  # days to keep history entries, 0 = forever (history table only)
 
 # MongoDB (deprecated, use DATABASE_URL setting)
 MONGO_URI = 'mongodb://localhost:27017/monitoring'
@@ -44,10 +49,27 @@ POSTGRES_DB = None
 DATABASE_URL = MONGO_URI  # default: MongoDB
 DATABASE_NAME = MONGO_DATABASE or POSTGRES_DB
 DATABASE_RAISE_ON_ERROR = MONGO_RAISE_ON_ERROR  # True - terminate, False - ignore and continue
+DATABASE_POOL_MIN_SIZE = 1  # connections opened when the pool is created (per process)
+DATABASE_POOL_MAX_SIZE = 10  # maximum connections in the pool (per process)
+DATABASE_POOL_TIMEOUT = 30  # seconds to wait for a free connection before giving up
+DATABASE_POOL_PRE_PING = True  # check connection is alive before it is checked out of the pool (Postgres only)
+DATABASE_QUERY_TIMING = False  # record query timing histograms by backend method (Postgres only)
+DATABASE_SLOW_QUERY_THRESHOLD = 0  # log queries that take longer than this in milliseconds, 0 to disable (Postgres only)
 
 # Search
 DEFAULT_FIELD = 'text'  # default field if no search prefix specified (Postgres only)
 
+# Metrics
+METRICS_FLUSH_INTERVAL = 10  # seconds between writes of aggregated metrics to the database, 0 to write on every update
+
+# Delta sync
+CHANGED_SINCE_OVERLAP = 2  # seconds the changed-since watermark is set back to include writes that commit late, clients de-duplicate by id
+DELETED_ALERTS_MAX_AGE = 24  # hours to keep ids of deleted alerts for changed-since queries, 0 = forever
+
+# Alert stream
+STREAM_KEEPALIVE = 15  # seconds between keepalive comments sent to idle /alerts/stream clients
+STREAM_QUEUE_SIZE = 1000  # events buffered per /alerts/stream client before it is disconnected to resync
+
 # Bulk API
 BULK_QUERY_LIMIT = 100000  # max number of alerts for bulk endpoints
 CELERY_BROKER_URL = None
@@ -67,6 +89,7 @@ GUEST_DEFAULT_SCOPES = ['read:alerts']
 CUSTOMER_VIEWS = False
 
 BASIC_AUTH_REALM = 'Alerta'
+AUTH_CACHE_TTL = 30  # seconds Basic auth credentials, customers and scopes are cached, 0 to check the database on every request
 SIGNUP_ENABLED = True
 
 HMAC_AUTH_CREDENTIALS = [
@@ -128,6 +151,9 @@ ALLOWED_SAML2_GROUPS = ['*']
 
 TOKEN_EXPIRE_DAYS = 14
 API_KEY_EXPIRE_DAYS = 365  # 1 year
+API_KEY_CACHE_TTL = 60  # seconds a verified API key is cached, 0 to look up the key on every request
+API_KEY_CACHE_NEGATIVE_TTL = 5  # seconds an unknown API key is cached
+API_KEY_USAGE_FLUSH_INTERVAL = 10  # seconds between writes of API key last-used time and count, 0 to write on every request
 
 # Audit Log
 AUDIT_TRAIL = ['admin']  # possible categories are 'admin', 'write', and 'auth'
@@ -135,6 +161,10 @@ AUDIT_LOG = None  # set to True to log to application logger
 AUDIT_LOG_REDACT = True  # redact sensitive data before logging
 AUDIT_LOG_JSON = False  # log alert data as JSON object
 AUDIT_URL = None  # send audit log events via webhook URL
+AUDIT_QUEUE_SIZE = 10000  # audit events waiting to be sent before further events are spilled or dropped
+AUDIT_BATCH_SIZE = 100  # audit events sent per request, as newline-delimited JSON
+AUDIT_FLUSH_INTERVAL = 1  # seconds between sends of queued audit events
+AUDIT_SPILL_FILE = None  # file for audit events that do not fit in the queue, None to drop them
 
 # CORS settings
 CORS_ALLOW_HEADERS = ['Content-Type', 'Authorization', 'Access-Control-Allow-Origin']
@@ -181,6 +211,9 @@ SHELVE_TIMEOUT = 7200  # auto-unshelve alerts after x seconds (0 seconds = do no
 # Housekeeping settings
 DEFAULT_EXPIRED_DELETE_HRS = 2  # hours (0 hours = do not delete)
 DEFAULT_INFO_DELETE_HRS = 12  # hours (0 hours = do not delete)
+HOUSEKEEPING_INTERVAL = 0  # seconds between background housekeeping runs (one node at a time), 0 = use /management/housekeeping
+HOUSEKEEPING_CHUNK_SIZE = 500  # alerts read, updated and passed to plugins at a time
+HOUSEKEEPING_TIME_BUDGET = 50  # seconds per run, remaining alerts are left for the next run
 
 # Send verification emails to new BasicAuth users
 EMAIL_VERIFICATION = False
@@ -235,6 +268,13 @@ AUTO_REFRESH_INTERVAL = 5000  # ms
 # Plugins
 PLUGINS = ['remote_ip', 'reject', 'heartbeat', 'blackout', 'forwarder']
 PLUGINS_RAISE_ON_ERROR = True  # raise RuntimeError exception on first failure
+PLUGINS_HOOK_TIMING = True  # record plugin hook timing histograms by plugin and hook
+PLUGINS_ASYNC_BACKEND = 'thread'  # run async plugin hooks in a 'thread' pool, as 'celery' tasks, or None to run all hooks inline
+PLUGINS_ASYNC_HOOKS = {}  # type: Dict[str, List[str]]
+# PLUGINS_ASYNC_HOOKS = {'forwarder': ['post_receive']}  # run hooks async in addition to those declared by the plugin
+PLUGINS_ASYNC_CONCURRENCY = 4  # async hooks run at the same time, per plugin
+PLUGINS_ASYNC_QUEUE_SIZE = 1000  # async hooks queued per plugin before further hooks are dead-lettered
+PLUGINS_ASYNC_TIMEOUT = 30  # seconds before an async hook is dead-lettered, it keeps its worker until it returns
 
 # reject plugin settings
 ORIGIN_BLACKLIST = []  # type: List[str]
@@ -246,6 +286,7 @@ BLACKOUT_DURATION = 3600  # default period = 1 hour
 NOTIFICATION_BLACKOUT = False  # True - set alert status=blackout, False - do not process alert (default)
 BLACKOUT_ACCEPT = []  # type: List[str]
 # BLACKOUT_ACCEPT = ['normal', 'ok', 'cleared']  # list of severities accepted during blackout period
+BLACKOUT_CACHE_TTL = 10  # seconds before blackouts are reloaded from the database, 0 to query the database for every alert
 
 # northbound interface
 FWD_DESTINATIONS = [
@@ -258,6 +299,13 @@ FWD_DESTINATIONS = [
 
 # valid actions=['*', 'alerts', 'actions', 'open', 'assign', 'ack', 'unack', 'shelve', 'unshelve', 'close', 'delete']
 
+FWD_CONCURRENCY = 1  # destinations forwarded to at the same time, 1 to forward to one destination after another
+FWD_BATCH_WINDOW = 0  # seconds to collect alerts for each destination before forwarding them in one batch, 0 to forward immediately
+FWD_RETRY_QUEUE_SIZE = 1000  # failed requests kept in memory for retry
+FWD_RETRY_SPILL_DIR = None  # directory for failed requests that do not fit in memory, None to drop oldest
+FWD_RETRY_BACKOFF = 5  # seconds before first retry, doubled after every failure (max 5 minutes)
+FWD_RETRY_MAX_ATTEMPTS = 10  # attempts before a failed request is dropped
+
 # resource field mapping
 # for hsdp,
 # resource from application, use 'application';
@@ -56,17 +56,52 @@ CREATE TABLE IF NOT EXISTS alerts (
     receive_time timestamp without time zone,
     last_receive_id text,
     last_receive_time timestamp without time zone,
+    update_time timestamp without time zone,
     history history[]
 );
 
 DO $$
 BEGIN
     ALTER TABLE alerts ADD COLUMN update_time timestamp without time zone;
+EXCEPTION
+    WHEN duplicate_column THEN RAISE NOTICE 'column "update_time" already exists in alerts.';
+END$$;
+
+DO $$
+BEGIN
     ALTER TABLE alerts ADD COLUMN project text NOT NULL;
 EXCEPTION
-    WHEN duplicate_column THEN RAISE NOTICE 'adding column already exists in alerts.';
+    WHEN duplicate_column THEN RAISE NOTICE 'column "project" already exists in alerts.';
+END$$;
+
+DO $$
+BEGIN
+    ALTER TABLE alerts ADD COLUMN change_time timestamp without time zone;
+    UPDATE alerts SET change_time = last_receive_time;
+EXCEPTION
+    WHEN duplicate_column THEN RAISE NOTICE 'column "change_time" already exists in alerts.';
 END$$;
 
+CREATE TABLE IF NOT EXISTS alert_tombstones (
+    id text PRIMARY KEY,
+    customer text,
+    delete_time timestamp without time zone NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS alert_history (
+    alert_id text NOT NULL REFERENCES alerts (id) ON DELETE CASCADE,
+    id text,
+    event text,
+    severity text,
+    status text,
+    value text,
+    text text,
+    type text,
+    update_time timestamp without time zone,
+    "user" text,
+    timeout integer
+);
+
 CREATE TABLE IF NOT EXISTS notes (
     id text PRIMARY KEY,
     text text,
@@ -178,6 +213,13 @@ CREATE TABLE IF NOT EXISTS metrics (
 ALTER TABLE metrics ALTER COLUMN total_time TYPE BIGINT;
 
 
+CREATE TABLE IF NOT EXISTS leases (
+    name text PRIMARY KEY,
+    owner text NOT NULL,
+    expire_time timestamp without time zone NOT NULL
+);
+
+
 CREATE TABLE IF NOT EXISTS perms (
     id text PRIMARY KEY,
     match text UNIQUE NOT NULL,
@@ -221,8 +263,227 @@ CREATE TABLE IF NOT EXISTS groups (
     update_time timestamp without time zone
 );
 
+CREATE OR REPLACE FUNCTION track_alert_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO alert_tombstones (id, customer, delete_time)
+             VALUES (OLD.id, OLD.customer, timezone('utc', clock_timestamp()))
+        ON CONFLICT (id) DO UPDATE SET delete_time = EXCLUDED.delete_time;
+        RETURN OLD;
+    END IF;
+    IF TG_OP = 'INSERT' OR NEW IS DISTINCT FROM OLD THEN
+        NEW.change_time := timezone('utc', clock_timestamp());
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DO $$
+BEGIN
+    CREATE TRIGGER alerts_track_change BEFORE INSERT OR UPDATE OR DELETE ON alerts
+        FOR EACH ROW EXECUTE PROCEDURE track_alert_change();
+EXCEPTION
+    WHEN duplicate_object THEN RAISE NOTICE 'trigger "alerts_track_change" already exists on alerts.';
+END$$;
+
+CREATE OR REPLACE FUNCTION rollup_dimensions(project text, "group" text, service text[], tags text[])
+RETURNS TABLE (dimension text, value text) AS $$
+    SELECT * FROM unnest(
+        ARRAY['environment', 'project', 'group']
+            || array_fill('service'::text, ARRAY[COALESCE(cardinality(service), 0)])
+            || array_fill('tag'::text, ARRAY[COALESCE(cardinality(tags), 0)]),
+        ARRAY['', project, COALESCE("group", '')] || COALESCE(service, '{}') || COALESCE(tags, '{}')
+    )
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION rebuild_alert_rollups() RETURNS integer AS $$
+DECLARE
+    n integer;
+BEGIN
+    LOCK TABLE alert_rollups IN EXCLUSIVE MODE;
+    DELETE FROM alert_rollups;
+    INSERT INTO alert_rollups (customer, environment, dimension, value, severity, status, count)
+    SELECT COALESCE(a.customer, ''), COALESCE(a.environment, ''), d.dimension, COALESCE(d.value, ''),
+           COALESCE(a.severity, ''), COALESCE(a.status, ''), count(*)
+      FROM alerts a, rollup_dimensions(a.project, a."group", a.service, a.tags) d
+  GROUP BY 1, 2, 3, 4, 5, 6;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    RETURN n;
+END
+$$ LANGUAGE plpgsql;
+
+DO $$
+BEGIN
+    CREATE TABLE alert_rollups (
+        customer text NOT NULL,
+        environment text NOT NULL,
+        dimension text NOT NULL,
+        value text NOT NULL,
+        severity text NOT NULL,
+        status text NOT NULL,
+        count integer NOT NULL,
+        PRIMARY KEY (customer, environment, dimension, value, severity, status)
+    );
+    PERFORM rebuild_alert_rollups();
+EXCEPTION
+    WHEN duplicate_table THEN RAISE NOTICE 'relation "alert_rollups" already exists.';
+END$$;
+
+CREATE OR REPLACE FUNCTION rollup_alert_changes() RETURNS trigger AS $$
+BEGIN
+    -- one aggregated upsert per statement, in key order, so concurrent writers take row locks in the same order
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO alert_rollups AS r (customer, environment, dimension, value, severity, status, count)
+        SELECT COALESCE(a.customer, ''), COALESCE(a.environment, ''), d.dimension, COALESCE(d.value, ''),
+               COALESCE(a.severity, ''), COALESCE(a.status, ''), count(*)
+          FROM new_alerts a, rollup_dimensions(a.project, a."group", a.service, a.tags) d
+      GROUP BY 1, 2, 3, 4, 5, 6
+      ORDER BY 1, 2, 3, 4, 5, 6
+        ON CONFLICT (customer, environment, dimension, value, severity, status) DO UPDATE SET count = r.count + EXCLUDED.count;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE alert_rollups r
+           SET count = r.count - c.n
+          FROM (
+            SELECT COALESCE(a.customer, '') AS customer, COALESCE(a.environment, '') AS environment, d.dimension,
+                   COALESCE(d.value, '') AS value, COALESCE(a.severity, '') AS severity, COALESCE(a.status, '') AS status, count(*) AS n
+              FROM old_alerts a, rollup_dimensions(a.project, a."group", a.service, a.tags) d
+          GROUP BY 1, 2, 3, 4, 5, 6
+          ORDER BY 1, 2, 3, 4, 5, 6
+          ) c
+         WHERE (r.customer, r.environment, r.dimension, r.value, r.severity, r.status)
+             = (c.customer, c.environment, c.dimension, c.value, c.severity, c.status);
+    ELSE
+        -- dedups and other updates that don't change any rollup key cancel out and write nothing
+        INSERT INTO alert_rollups AS r (customer, environment, dimension, value, severity, status, count)
+        SELECT COALESCE((c.a).customer, ''), COALESCE((c.a).environment, ''), d.dimension, COALESCE(d.value, ''),
+               COALESCE((c.a).severity, ''), COALESCE((c.a).status, ''), sum(c.n)
+          FROM (
+            SELECT a, -1 AS n FROM old_alerts a
+            UNION ALL
+            SELECT a, 1 AS n FROM new_alerts a
+          ) c, rollup_dimensions((c.a).project, (c.a)."group", (c.a).service, (c.a).tags) d
+      GROUP BY 1, 2, 3, 4, 5, 6
+        HAVING sum(c.n) <> 0
+      ORDER BY 1, 2, 3, 4, 5, 6
+        ON CONFLICT (customer, environment, dimension, value, severity, status) DO UPDATE SET count = r.count + EXCLUDED.count;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DO $$
+BEGIN
+    CREATE TRIGGER alerts_rollup_insert AFTER INSERT ON alerts
+        REFERENCING NEW TABLE AS new_alerts
+        FOR EACH STATEMENT EXECUTE PROCEDURE rollup_alert_changes();
+    CREATE TRIGGER alerts_rollup_update AFTER UPDATE ON alerts
+        REFERENCING OLD TABLE AS old_alerts NEW TABLE AS new_alerts
+        FOR EACH STATEMENT EXECUTE PROCEDURE rollup_alert_changes();
+    CREATE TRIGGER alerts_rollup_delete AFTER DELETE ON alerts
+        REFERENCING OLD TABLE AS old_alerts
+        FOR EACH STATEMENT EXECUTE PROCEDURE rollup_alert_changes();
+EXCEPTION
+    WHEN duplicate_object THEN RAISE NOTICE 'rollup triggers already exist on alerts.';
+END$$;
+
+CREATE OR REPLACE FUNCTION notify_alert_change() RETURNS trigger AS $$
+DECLARE
+    change text;
+    payload text;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('alerta_alerts', json_build_object('id', OLD.id, 'change', 'delete', 'customer', OLD.customer)::text);
+        RETURN OLD;
+    END IF;
+    IF TG_OP = 'INSERT' THEN
+        change := 'create';
+    ELSIF NEW IS NOT DISTINCT FROM OLD THEN
+        RETURN NEW;
+    ELSIF NEW.duplicate_count > OLD.duplicate_count THEN
+        change := 'dedup';
+    ELSIF NEW.last_receive_id IS DISTINCT FROM OLD.last_receive_id THEN
+        change := 'correlate';
+    ELSIF NEW.status IS DISTINCT FROM OLD.status THEN
+        change := 'status';
+    ELSIF NEW.tags IS DISTINCT FROM OLD.tags THEN
+        change := 'tag';
+    ELSE
+        change := 'update';
+    END IF;
+    -- state of the alert as of this change, because it may change again before it is sent
+    payload := json_build_object('id', NEW.id, 'change', change, 'customer', NEW.customer, 'alert', json_build_object(
+        'severity', NEW.severity,
+        'status', NEW.status,
+        'previousSeverity', NEW.previous_severity,
+        'trendIndication', NEW.trend_indication,
+        'duplicateCount', NEW.duplicate_count,
+        'repeat', NEW.repeat,
+        'value', NEW.value,
+        'text', NEW.text,
+        'tags', NEW.tags,
+        'timeout', NEW.timeout,
+        'lastReceiveId', NEW.last_receive_id,
+        'lastReceiveTime', to_char(NEW.last_receive_time, 'YYYY-MM-DD"T"HH24:MI:SS.MS"Z"'),
+        'updateTime', to_char(NEW.update_time, 'YYYY-MM-DD"T"HH24:MI:SS.MS"Z"')
+    ))::text;
+    IF octet_length(payload) >= 8000 THEN
+        -- too big to notify, the alert is sent as it is when the change is received
+        payload := json_build_object('id', NEW.id, 'change', change, 'customer', NEW.customer)::text;
+    END IF;
+    PERFORM pg_notify('alerta_alerts', payload);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DO $$
+BEGIN
+    CREATE TRIGGER alerts_notify_change AFTER INSERT OR UPDATE OR DELETE ON alerts
+        FOR EACH ROW EXECUTE PROCEDURE notify_alert_change();
+EXCEPTION
+    WHEN duplicate_object THEN RAISE NOTICE 'trigger "alerts_notify_change" already exists on alerts.';
+END$$;
+
 
 CREATE UNIQUE INDEX IF NOT EXISTS env_res_evt_cust_key ON alerts USING btree (environment, resource, event, (COALESCE(customer, ''::text)));
+CREATE INDEX IF NOT EXISTS alerts_id_prefix_idx ON alerts USING btree (lower(id) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS alerts_last_receive_id_prefix_idx ON alerts USING btree (lower(last_receive_id) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS alerts_last_receive_time_id_idx ON alerts USING btree (last_receive_time, id);
+CREATE INDEX IF NOT EXISTS alerts_status_idx ON alerts USING btree (status);
+CREATE INDEX IF NOT EXISTS alerts_severity_idx ON alerts USING btree (severity);
+CREATE INDEX IF NOT EXISTS alerts_customer_idx ON alerts USING btree (customer);
+CREATE INDEX IF NOT EXISTS alerts_service_idx ON alerts USING gin (service);
+CREATE INDEX IF NOT EXISTS alerts_tags_idx ON alerts USING gin (tags);
+CREATE INDEX IF NOT EXISTS alerts_attributes_idx ON alerts USING gin (attributes jsonb_path_ops);
+CREATE INDEX IF NOT EXISTS alerts_change_time_idx ON alerts USING btree (change_time);
+CREATE INDEX IF NOT EXISTS alert_tombstones_delete_time_idx ON alert_tombstones USING btree (delete_time);
+
+-- exact and case-insensitive prefix matches on keyword fields in "q" queries
+CREATE INDEX IF NOT EXISTS alerts_resource_idx ON alerts USING btree (resource);
+CREATE INDEX IF NOT EXISTS alerts_event_idx ON alerts USING btree (event);
+CREATE INDEX IF NOT EXISTS alerts_group_idx ON alerts USING btree ("group");
+CREATE INDEX IF NOT EXISTS alerts_resource_prefix_idx ON alerts USING btree (lower(resource) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS alerts_event_prefix_idx ON alerts USING btree (lower(event) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS alerts_group_prefix_idx ON alerts USING btree (lower("group") text_pattern_ops);
+
+-- substring and regex matches on free text in "q" queries, if pg_trgm is available
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+EXCEPTION
+    WHEN OTHERS THEN RAISE NOTICE 'extension "pg_trgm" is not available, text searches will not use an index.';
+END$$;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        CREATE INDEX IF NOT EXISTS alerts_text_trgm_idx ON alerts USING gin (text gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS alerts_value_trgm_idx ON alerts USING gin (value gin_trgm_ops);
+    END IF;
+END$$;
 
 
 CREATE UNIQUE INDEX IF NOT EXISTS org_cust_key ON heartbeats USING btree (origin, (COALESCE(customer, ''::text)));
+
+
+CREATE INDEX IF NOT EXISTS alert_history_alert_id_idx ON alert_history USING btree (alert_id, update_time DESC);
+CREATE INDEX IF NOT EXISTS alert_history_update_time_id_idx ON alert_history USING btree (update_time, id);
@@ -1,9 +1,10 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
-from alerta.app import create_celery_app
+from alerta.app import create_celery_app, plugins
 from alerta.exceptions import InvalidAction, RejectException
 from alerta.models.alert import Alert
 from alerta.utils.api import process_action, process_status
+from alerta.utils.plugin import dead_letter
 
 celery = create_celery_app()
 
@@ -41,3 +42,15 @@ def action_alerts(alerts: List[str], action: str, text: str, timeout: Optional[i
                 continue
 
         updated.append(alert.id)
+
+
+@celery.task
+def plugin_hook(name: str, hook: str, alert_id: str, args: List[Any], kwargs: Dict[str, Any]) -> None:
+    alert = Alert.find_by_id(alert_id)
+    plugin = plugins.plugins.get(name)
+    if not alert or not plugin or not plugins.implements(plugin, hook):
+        return
+    try:
+        plugins.call(plugin, hook, alert, *args, config=plugins.routing(alert)[1], **kwargs)
+    except Exception as e:
+        dead_letter(name, hook, alert, args, str(e))
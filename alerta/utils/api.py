@@ -1,7 +1,8 @@
 import logging
-from typing import Optional, Tuple
+from functools import partial
+from typing import Callable, List, Optional, Tuple, Union
 
-from flask import current_app, g
+from flask import after_this_request, current_app, g, has_request_context
 
 from alerta.app import plugins
 from alerta.exceptions import (ApiError, BlackoutPeriod, ForwardingLoop,
@@ -31,15 +32,65 @@ def process_alert(alert: Alert) -> Alert:
 
     wanted_plugins, wanted_config = plugins.routing(alert)
 
+    alert, skip_plugins = _pre_receive(alert, wanted_plugins, wanted_config)
+
+    try:
+        existing = alert.is_duplicate_or_correlated()
+        if not existing:
+            alert = alert.create()
+        elif existing.event == alert.event and existing.severity == alert.severity:
+            alert = alert.deduplicate(existing)
+        else:
+            alert = alert.update(existing)
+    except Exception as e:
+        raise ApiError(str(e))
+
+    return _post_receive(alert, wanted_plugins, wanted_config, skip_plugins)
+
+
+def process_alerts(alerts: List[Alert]) -> List[Union[Alert, Exception]]:
+    """
+    Same as process_alert() for a batch of alerts, except that the database writes
+    are batched. Returns the processed alert, or the exception raised while processing
+    it, for every alert in the same order as received.
+    """
+    results = [None] * len(alerts)  # type: List[Union[Alert, Exception]]
+
+    received = []
+    for i, alert in enumerate(alerts):
+        try:
+            wanted_plugins, wanted_config = plugins.routing(alert)
+            alert, skip_plugins = _pre_receive(alert, wanted_plugins, wanted_config)
+        except Exception as e:
+            results[i] = e
+            continue
+        received.append((i, alert, wanted_plugins, wanted_config, skip_plugins))
+
+    ingested = Alert.ingest_all([alert for _, alert, _, _, _ in received])
+
+    for (i, _, wanted_plugins, wanted_config, skip_plugins), alert in zip(received, ingested):
+        if isinstance(alert, Exception):
+            results[i] = ApiError(str(alert))
+            continue
+        try:
+            results[i] = _post_receive(alert, wanted_plugins, wanted_config, skip_plugins)
+        except Exception as e:
+            results[i] = e
+
+    return results
+
+
+def _pre_receive(alert: Alert, wanted_plugins, wanted_config) -> Tuple[Alert, bool]:
+
     skip_plugins = False
     for plugin in wanted_plugins:
         if alert.is_suppressed:
             skip_plugins = True
             break
+        if not plugins.implements(plugin, 'pre_receive'):
+            continue
         try:
-            alert = plugin.pre_receive(alert, config=wanted_config)
-        except TypeError:
-            alert = plugin.pre_receive(alert)  # for backward compatibility
+            alert = plugins.call(plugin, 'pre_receive', alert, config=wanted_config)
         except (RejectException, HeartbeatReceived, BlackoutPeriod, RateLimit, ForwardingLoop):
             raise
         except Exception as e:
@@ -50,28 +101,24 @@ def process_alert(alert: Alert) -> Alert:
         if not alert:
             raise SyntaxError("Plugin '%s' pre-receive hook did not return modified alert" % plugin.name)
 
-    # TODO(RylandCai)
-    try:
-        is_duplicate = alert.is_duplicate()
-        if is_duplicate:
-            alert = alert.deduplicate(is_duplicate)
-        else:
-            is_correlated = alert.is_correlated()
-            if is_correlated:
-                alert = alert.update(is_correlated)
-            else:
-                alert = alert.create()
-    except Exception as e:
-        raise ApiError(str(e))
+    return alert, skip_plugins
+
+
+def _post_receive(alert: Alert, wanted_plugins, wanted_config, skip_plugins: bool) -> Alert:
 
     updated = None
+    run_async = []
     for plugin in wanted_plugins:
         if skip_plugins:
             break
+        if not plugins.implements(plugin, 'post_receive'):
+            updated = None  # same as calling a hook that returns nothing
+            continue
+        if plugins.is_async(plugin, 'post_receive'):
+            run_async.append(plugin)
+            continue
         try:
-            updated = plugin.post_receive(alert, config=wanted_config)
-        except TypeError:
-            updated = plugin.post_receive(alert)  # for backward compatibility
+            updated = plugins.call(plugin, 'post_receive', alert, config=wanted_config)
         except Exception as e:
             if current_app.config['PLUGINS_RAISE_ON_ERROR']:
                 raise ApiError("Error while running post-receive plugin '{}': {}".format(plugin.name, str(e)))
@@ -84,20 +131,44 @@ def process_alert(alert: Alert) -> Alert:
         alert.tag(alert.tags)
         alert.update_attributes(alert.attributes)
 
+    for plugin in run_async:
+        _after_commit(partial(plugins.run_async, plugin, 'post_receive', alert, config=wanted_config))
+
     return alert
 
 
+def _after_commit(f: Callable[[], None]) -> None:
+    """
+    Run when the response is sent, so that only changes that were saved are notified.
+    """
+    if not has_request_context():
+        f()
+        return
+
+    @after_this_request
+    def run(response):
+        if response.status_code < 400:
+            f()
+        return response
+
+
 def process_action(alert: Alert, action: str, text: str, timeout: int = None) -> Tuple[Alert, str, str, Optional[int]]:
     wanted_plugins, wanted_config = plugins.routing(alert)
 
     updated = None
+    run_async = []
     for plugin in wanted_plugins:
         if alert.is_suppressed:
             break
+        if not plugins.implements(plugin, 'take_action'):
+            continue
+        if plugins.is_async(plugin, 'take_action'):
+            run_async.append(plugin)
+            continue
         try:
-            updated = plugin.take_action(alert, action, text, timeout=timeout, config=wanted_config)
+            updated = plugins.call(plugin, 'take_action', alert, action, text, timeout=timeout, config=wanted_config)
         except NotImplementedError:
-            pass  # plugin does not support action() method
+            pass  # plugin does not support this action
         except (RejectException, ForwardingLoop):
             raise
         except Exception as e:
@@ -118,21 +189,104 @@ def process_action(alert: Alert, action: str, text: str, timeout: int = None) ->
     new_attrs = {k: v for k, v in alert.attributes.items() if v is not None}
     alert.attributes = new_attrs
 
+    for plugin in run_async:
+        _after_commit(partial(plugins.run_async, plugin, 'take_action', alert, action, text, timeout=timeout, config=wanted_config))
+
     return alert, action, text, timeout
 
 
+def process_actions(alerts: List[Alert], action: str, text: str = '',
+                    timeout: int = None) -> Tuple[List[Tuple[Alert, str, str, Optional[int]]], List[Tuple[Alert, Exception]]]:
+    """
+    Same as process_action() for a batch of alerts, calling take_actions() once per plugin
+    instead of take_action() once per alert. Returns the (alert, action, text, timeout) of
+    accepted alerts, and the rejected alerts with the exception that rejected them.
+    """
+    accepted = []  # type: List[Tuple[Alert, str, str, Optional[int]]]
+    rejected = []  # type: List[Tuple[Alert, Exception]]
+
+    if plugins.rules:  # plugins are routed per alert
+        for alert in alerts:
+            try:
+                accepted.append(process_action(alert, action, text, timeout))
+            except (RejectException, ForwardingLoop) as e:
+                rejected.append((alert, e))
+        return accepted, rejected
+
+    wanted_plugins, wanted_config = plugins.plugins.values(), plugins.config
+    accepted = [(alert, action, text, timeout) for alert in alerts]
+
+    run_async = []
+    for plugin in wanted_plugins:
+        if not plugins.implements(plugin, 'take_actions'):
+            continue
+        if plugins.is_async(plugin, 'take_action'):
+            run_async.append(plugin)
+            continue
+        batch = [a for a in accepted if not a[0].is_suppressed]
+        if not batch:
+            break
+        try:
+            results = plugins.call(plugin, 'take_actions', batch, config=wanted_config)
+        except NotImplementedError:
+            continue  # plugin does not support this action
+        except Exception as e:
+            results = [e] * len(batch)
+
+        updated_by_id = dict()
+        for (alert, _, _, _), updated in zip(batch, results):
+            if isinstance(updated, (RejectException, ForwardingLoop)):
+                rejected.append((alert, updated))
+            elif isinstance(updated, Exception):
+                if current_app.config['PLUGINS_RAISE_ON_ERROR']:
+                    raise ApiError("Error while running action plugin '{}': {}".format(plugin.name, str(updated)))
+                else:
+                    logging.error("Error while running action plugin '{}': {}".format(plugin.name, str(updated)))
+            updated_by_id[alert.id] = updated
+
+        processed = []
+        for alert, action, text, timeout in accepted:
+            updated = updated_by_id.get(alert.id)
+            if isinstance(updated, Exception):
+                if isinstance(updated, (RejectException, ForwardingLoop)):
+                    continue
+                updated = None
+            if isinstance(updated, Alert):
+                updated = updated, action, text, timeout
+            if isinstance(updated, tuple):
+                if len(updated) == 4:
+                    alert, action, text, timeout = updated
+                elif len(updated) == 3:
+                    alert, action, text = updated
+            processed.append((alert, action, text, timeout))
+        accepted = processed
+
+    for alert, action, text, timeout in accepted:
+        # remove keys from attributes with None values
+        alert.attributes = {k: v for k, v in alert.attributes.items() if v is not None}
+
+        for plugin in run_async:
+            _after_commit(partial(plugins.run_async, plugin, 'take_action', alert, action, text, timeout=timeout, config=wanted_config))
+
+    return accepted, rejected
+
+
 def process_status(alert: Alert, status: str, text: str) -> Tuple[Alert, str, str]:
 
     wanted_plugins, wanted_config = plugins.routing(alert)
 
     updated = None
+    run_async = []
     for plugin in wanted_plugins:
         if alert.is_suppressed:
             break
+        if not plugins.implements(plugin, 'status_change'):
+            continue
+        if plugins.is_async(plugin, 'status_change'):
+            run_async.append(plugin)
+            continue
         try:
-            updated = plugin.status_change(alert, status, text, config=wanted_config)
-        except TypeError:
-            updated = plugin.status_change(alert, status, text)  # for backward compatibility
+            updated = plugins.call(plugin, 'status_change', alert, status, text, config=wanted_config)
         except RejectException:
             raise
         except Exception as e:
@@ -150,6 +304,9 @@ def process_status(alert: Alert, status: str, text: str) -> Tuple[Alert, str, st
     new_attrs = {k: v for k, v in alert.attributes.items() if v is not None}
     alert.attributes = new_attrs
 
+    for plugin in run_async:
+        _after_commit(partial(plugins.run_async, plugin, 'status_change', alert, status, text, config=wanted_config))
+
     return alert, status, text
 
 
@@ -159,8 +316,10 @@ def process_delete(alert: Alert) -> bool:
 
     delete = True
     for plugin in wanted_plugins:
+        if not plugins.implements(plugin, 'delete'):
+            continue
         try:
-            delete = delete and plugin.delete(alert, config=wanted_config)
+            delete = delete and plugins.call(plugin, 'delete', alert, config=wanted_config)
         except NotImplementedError:
             pass  # plugin does not support delete() method
         except RejectException:
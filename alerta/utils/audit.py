@@ -1,14 +1,26 @@
+import glob
 import json
+import logging
+import os
+import threading
+import time
 import uuid
+from collections import deque
 from datetime import datetime
-from typing import Any, List
+from typing import Any, Dict, List  # noqa
 
 import blinker
 import requests
 from flask import Flask, g
 
+from alerta.utils.background import BackgroundFlusher
 from alerta.utils.format import CustomJSONEncoder
 
+LOG = logging.getLogger('alerta.audit')
+
+SEND_TIMEOUT = 2  # seconds
+MAX_BACKOFF = 60  # seconds
+
 audit_signals = blinker.Namespace()
 
 admin_audit_trail = audit_signals.signal('admin')
@@ -17,16 +29,129 @@ read_audit_trail = audit_signals.signal('read')  # not used
 auth_audit_trail = audit_signals.signal('auth')
 
 
+class AuditSender(BackgroundFlusher):
+    """
+    Send audit events to the audit URL in the background, in batches of newline-delimited
+    JSON over one persistent session. While the URL is failing, sends are retried with
+    exponential backoff and events that do not fit in the queue are appended to the spill
+    file (one per process), which is sent once the queue has drained.
+    """
+
+    name = 'audit-sender'
+
+    def __init__(self, url: str, queue_size: int, batch_size: int, interval: float, spill_file: str = None) -> None:
+        super().__init__()
+        self.url = url
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.interval = interval
+        self.spill_file = spill_file
+
+        self._lock = threading.Lock()
+        self._queue = deque()  # type: deque
+        self._session = requests.Session()
+        self._failures = 0
+        self._retry_at = 0.0
+
+        self.stats = {'sent': 0, 'dropped': 0, 'spilled': 0, 'errors': 0}  # type: Dict[str, int]
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def send(self, app: Flask, event: str) -> None:
+        self.start(app, self.interval)
+        with self._lock:
+            if len(self._queue) < self.queue_size:
+                self._queue.append(event)
+            elif self.spill_file:
+                with open(self._spill_path(), 'a') as f:
+                    f.write(event + '\n')
+                self.stats['spilled'] += 1
+            else:
+                self.stats['dropped'] += 1
+
+    def flush(self) -> None:
+        # only called from the background thread (or at exit), so events are only removed here
+        if time.monotonic() < self._retry_at:
+            return
+        while True:
+            if not self._queue:
+                self._unspill()
+            batch = [self._queue[i] for i in range(min(len(self._queue), self.batch_size))]
+            if not batch:
+                return
+            try:
+                response = self._session.post(self.url, data=''.join(e + '\n' for e in batch),
+                                              headers={'Content-Type': 'application/x-ndjson'}, timeout=SEND_TIMEOUT)
+                response.raise_for_status()
+            except Exception as e:
+                self.stats['errors'] += 1
+                self._failures += 1
+                self._retry_at = time.monotonic() + min(self.interval * 2 ** self._failures, MAX_BACKOFF)
+                LOG.warning('Failed to send {} audit log entries to "{}", will retry - {}'.format(len(batch), self.url, str(e)))
+                return
+            with self._lock:
+                for _ in batch:
+                    self._queue.popleft()
+            self.stats['sent'] += len(batch)
+            self._failures = 0
+
+    def _spill_path(self, pid: int = None) -> str:
+        return '{}.{}'.format(self.spill_file, pid or os.getpid())
+
+    def _unspill(self) -> None:
+        if not self.spill_file:
+            return
+        with self._lock:
+            for path in glob.glob(self._spill_path(pid='*')):
+                pid = path.rsplit('.', 1)[-1]
+                if path != self._spill_path() and self._is_alive(pid):
+                    continue  # spilled by another process that is still running
+                with open(path) as f:
+                    events = [line.rstrip('\n') for line in f if line.strip()]
+                os.unlink(path)
+                room = self.queue_size - len(self._queue)
+                self._queue.extend(events[:room])
+                if events[room:]:
+                    with open(self._spill_path(), 'a') as f:
+                        f.writelines(e + '\n' for e in events[room:])
+                    return
+
+    @staticmethod
+    def _is_alive(pid: str) -> bool:
+        try:
+            os.kill(int(pid), 0)
+        except (ValueError, ProcessLookupError):
+            return False
+        except PermissionError:
+            pass
+        return True
+
+
 class AuditTrail:
 
     def __init__(self, app: Flask = None) -> None:
         self.app = app
+        self.sender = None  # type: AuditSender
         if app is not None:
             self.init_app(app)
 
     def init_app(self, app: Flask) -> None:
         self.audit_url = app.config['AUDIT_URL']
 
+        if self.sender:
+            self.sender.stop()
+            self.sender = None
+        if self.audit_url:
+            self.sender = AuditSender(
+                url=self.audit_url,
+                queue_size=app.config['AUDIT_QUEUE_SIZE'],
+                batch_size=app.config['AUDIT_BATCH_SIZE'],
+                interval=app.config['AUDIT_FLUSH_INTERVAL'],
+                spill_file=app.config['AUDIT_SPILL_FILE']
+            )
+
         if 'admin' in app.config['AUDIT_TRAIL']:
             if app.config['AUDIT_LOG']:
                 admin_audit_trail.connect(self.admin_log_response, app)
@@ -53,10 +178,7 @@ class AuditTrail:
     def _webhook_response(self, app: Flask, category: str, event: str, message: str, user: str, customers: List[str],
                           scopes: List[str], resource_id: str, type: str, request: Any, **extra: Any) -> None:
         payload = self._fmt(app, category, event, message, user, customers, scopes, resource_id, type, request, **extra)
-        try:
-            requests.post(self.audit_url, data=payload, timeout=2)
-        except Exception as e:
-            app.logger.warning('Failed to send audit log entry to "{}" - {}'.format(self.audit_url, str(e)))
+        self.sender.send(app, payload)
 
     def admin_log_response(self, app: Flask, **kwargs):
         self._log_response(app, 'admin', **kwargs)
@@ -0,0 +1,65 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+from flask import Flask
+
+LOG = logging.getLogger('alerta')
+
+
+class BackgroundFlusher:
+    """
+    Base class for process-local buffers that are written to the database by a
+    daemon thread every "interval" seconds, and once more when the process exits.
+
+    Sub-classes implement flush(), which is always called inside an app context.
+    The thread is started on first use in each process so that it survives a fork.
+    """
+
+    name = 'flush'
+
+    def __init__(self) -> None:
+        self._app = None  # type: Flask
+        self._pid = None  # type: int
+        self._start_lock = threading.Lock()
+
+    def flush(self) -> None:
+        raise NotImplementedError
+
+    def start(self, app: Flask, interval: float) -> bool:
+        """
+        Start background thread if not already running in this process. Returns True
+        the first time it is called in a new process.
+        """
+        if self._pid == os.getpid():
+            return False
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return False
+            self._app = app
+            self._pid = os.getpid()
+        thread = threading.Thread(target=self._run, args=(interval,), name=self.name, daemon=True)
+        thread.start()
+        atexit.register(self._flush_in_app_context)
+        return True
+
+    def stop(self) -> None:
+        """
+        Stop background thread after the next flush.
+        """
+        self._pid = None
+
+    def _run(self, interval: float) -> None:
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(interval)
+            self._flush_in_app_context()
+
+    def _flush_in_app_context(self) -> None:
+        try:
+            with self._app.app_context():
+                self.flush()
+        except Exception as e:
+            LOG.error('Background {} failed: {}'.format(self.name, e))
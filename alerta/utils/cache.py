@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple  # noqa
+from typing import Any, Hashable
+
+from flask import current_app
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache where entries expire after a TTL, if given.
+
+    Values of None are cached like any other value, so callers can cache
+    negative lookups, usually with a shorter TTL.
+    """
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # type: OrderedDict
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)  # type: Optional[Tuple[float, Any]]
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float = None) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl if ttl is not None else float('inf'), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def app_cache(name: str, maxsize: int = 1024) -> TTLCache:
+    """
+    Return the named cache of the current app, so that cached database lookups
+    never outlive the app (and database connection) they were made with.
+    """
+    caches = current_app.extensions.setdefault('alerta.caches', {})
+    if name not in caches:
+        caches.setdefault(name, TTLCache(maxsize))
+    return caches[name]
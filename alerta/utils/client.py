@@ -25,8 +25,12 @@ class Client:
         key = key or os.environ.get('ALERTA_API_KEY', '')
         self.http = HTTPClient(self.endpoint, key, secret, token, username, password, timeout, ssl_verify, headers, debug)
 
-    def send_alert(self, resource, event, **kwargs):
-        data = {
+    def send_alert(self, resource, event, headers=None, **kwargs):
+        return self.http.post('/alert', self.alert_body(resource, event, **kwargs), headers=headers)
+
+    @staticmethod
+    def alert_body(resource, event, **kwargs):
+        return {
             'id': kwargs.get('id'),
             'resource': resource,
             'event': event,
@@ -46,18 +50,17 @@ class Client:
             'rawData': kwargs.get('raw_data'),
             'customer': kwargs.get('customer')
         }
-        return self.http.post('/alert', data)
 
-    def action(self, id, action, text='', timeout=None):
+    def action(self, id, action, text='', timeout=None, headers=None):
         data = {
             'action': action,
             'text': text,
             'timeout': timeout
         }
-        return self.http.put('/alert/%s/action' % id, data)
+        return self.http.put('/alert/%s/action' % id, data, headers=headers)
 
-    def delete_alert(self, id):
-        return self.http.delete('/alert/%s' % id)
+    def delete_alert(self, id, headers=None):
+        return self.http.delete('/alert/%s' % id, headers=headers)
 
 
 class ApiKeyAuth(AuthBase):
@@ -127,28 +130,28 @@ class HTTPClient:
             raise
         return response
 
-    def post(self, path, data=None):
+    def post(self, path, data=None, headers=None):
         url = self.endpoint + path
         try:
             response = self.session.post(url, data=json.dumps(data, cls=CustomJsonEncoder),
-                                         headers=self.headers, auth=self.auth, timeout=self.timeout)
+                                         headers={**self.headers, **(headers or {})}, auth=self.auth, timeout=self.timeout)
         except requests.exceptions.RequestException:
             raise
         return response
 
-    def put(self, path, data=None):
+    def put(self, path, data=None, headers=None):
         url = self.endpoint + path
         try:
             response = self.session.put(url, data=json.dumps(data, cls=CustomJsonEncoder),
-                                        headers=self.headers, auth=self.auth, timeout=self.timeout)
+                                        headers={**self.headers, **(headers or {})}, auth=self.auth, timeout=self.timeout)
         except requests.exceptions.RequestException:
             raise
         return response
 
-    def delete(self, path):
+    def delete(self, path, headers=None):
         url = self.endpoint + path
         try:
-            response = self.session.delete(url, headers=self.headers, auth=self.auth, timeout=self.timeout)
+            response = self.session.delete(url, headers={**self.headers, **(headers or {})}, auth=self.auth, timeout=self.timeout)
         except requests.exceptions.RequestException:
             raise
         return response
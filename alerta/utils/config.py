@@ -49,6 +49,12 @@ class Config:
         if 'DATABASE_NAME' in os.environ:
             config['DATABASE_NAME'] = os.environ['DATABASE_NAME']
 
+        if 'DATABASE_POOL_MIN_SIZE' in os.environ:
+            config['DATABASE_POOL_MIN_SIZE'] = int(os.environ['DATABASE_POOL_MIN_SIZE'])
+
+        if 'DATABASE_POOL_MAX_SIZE' in os.environ:
+            config['DATABASE_POOL_MAX_SIZE'] = int(os.environ['DATABASE_POOL_MAX_SIZE'])
+
         if 'AUTH_REQUIRED' in os.environ:
             config['AUTH_REQUIRED'] = True if os.environ['AUTH_REQUIRED'] == 'True' else False
 
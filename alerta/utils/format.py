@@ -1,27 +1,63 @@
 import datetime
 import traceback
-from typing import Any, Optional
+from operator import attrgetter
+from typing import Any, Callable, Dict, Optional, Union  # noqa
 
 from bson import ObjectId
-from flask import json
+from flask import current_app, json
+
+try:
+    import orjson  # optional, compiled JSON encoder
+except ImportError:
+    orjson = None
 
 dt = datetime.datetime
 
+# encoder for each type seen by default(), so that the isinstance() checks are done once per type
+_encoders = dict()  # type: Dict[type, Optional[Callable[[Any], Any]]]
+
+
+def _encoder_for(o: Any) -> Optional[Callable[[Any], Any]]:
+    from alerta.models.alert import Alert, History
+    if isinstance(o, datetime.datetime):
+        encoder = DateTime.iso8601  # type: Optional[Callable[[Any], Any]]
+    elif isinstance(o, datetime.timedelta):
+        encoder = _total_seconds
+    elif isinstance(o, (Alert, History)):
+        encoder = attrgetter('serialize')
+    elif isinstance(o, ObjectId):
+        encoder = str
+    elif isinstance(o, Exception):
+        encoder = _format_exception
+    else:
+        encoder = None
+    _encoders[type(o)] = encoder
+    return encoder
+
+
+def _total_seconds(o: datetime.timedelta) -> int:
+    return int(o.total_seconds())
+
+
+def _format_exception(o: Exception) -> Any:
+    return traceback.format_exception_only(o.__class__, o)
+
+
+def _default(o: Any) -> Any:
+    try:
+        encoder = _encoders[type(o)]
+    except KeyError:
+        encoder = _encoder_for(o)
+    if encoder is None:
+        raise TypeError('Object of type {} is not JSON serializable'.format(type(o).__name__))
+    return encoder(o)
+
 
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, o: Any) -> Any:  # pylint: disable=method-hidden
-        from alerta.models.alert import Alert, History
-        if isinstance(o, datetime.datetime):
-            return DateTime.iso8601(o)
-        elif isinstance(o, datetime.timedelta):
-            return int(o.total_seconds())
-        elif isinstance(o, (Alert, History)):
-            return o.serialize
-        elif isinstance(o, ObjectId):
-            return str(o)
-        elif isinstance(o, Exception):
-            return traceback.format_exception_only(o.__class__, o)
-        else:
+        try:
+            return _default(o)
+        except TypeError:
             return json.JSONEncoder.default(self, o)
 
 
@@ -37,13 +73,35 @@ class DateTime:
 
     @staticmethod
     def iso8601(dt: dt) -> str:
-        return dt.replace(microsecond=0).strftime('%Y-%m-%dT%H:%M:%S') + '.%03dZ' % (dt.microsecond // 1000)
+        return '%04d-%02d-%02dT%02d:%02d:%02d.%03dZ' % (
+            dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second, dt.microsecond // 1000
+        )
 
 
 def custom_json_dumps(obj: object) -> str:
     return json.dumps(obj, cls=CustomJSONEncoder)
 
 
+def use_orjson() -> bool:
+    return orjson is not None and current_app.config['JSON_ENCODER'] in ['auto', 'orjson']
+
+
+def fast_json_dumps(obj: object) -> Union[bytes, str]:
+    """
+    Same as custom_json_dumps() with sorted keys but using orjson, if installed, which
+    returns bytes. Falls back to the standard encoder for anything orjson cannot encode.
+    """
+    if use_orjson():
+        try:
+            return orjson.dumps(
+                obj, default=_default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+            )
+        except TypeError:
+            pass  # eg. integers larger than 64-bit
+    return json.dumps(obj, cls=CustomJSONEncoder, sort_keys=True)
+
+
 def register_custom_serializer() -> None:
     # Use kombu
     from kombu.serialization import register  # pylint: disable=import-error
@@ -0,0 +1,159 @@
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, List  # noqa
+
+from flask import Flask, current_app, g, request
+
+from alerta.app import db
+from alerta.exceptions import ApiError
+from alerta.models.alert import Alert
+from alerta.utils.api import process_actions
+from alerta.utils.audit import write_audit_trail
+
+LOG = logging.getLogger('alerta')
+
+
+class Housekeeper:
+    """
+    Expire, unshelve and unack alerts in chunks of HOUSEKEEPING_CHUNK_SIZE, where each chunk
+    is read with one query, passed to plugins at once and written with one update, until done
+    or HOUSEKEEPING_TIME_BUDGET seconds have passed. When HOUSEKEEPING_INTERVAL is set, every
+    process runs it in the background but only the holder of the housekeeping lease does any
+    work, so that it runs on one node at a time.
+    """
+
+    name = 'housekeeping'
+
+    def __init__(self) -> None:
+        self._app = None  # type: Flask
+        self._pid = None  # type: int
+        self._start_lock = threading.Lock()
+        self._run_lock = threading.Lock()
+
+    @property
+    def owner(self) -> str:
+        return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+    def init_app(self, app: Flask) -> None:
+        if app.config['HOUSEKEEPING_INTERVAL']:
+            # start on first request so that the thread is started after a fork
+            app.before_first_request(lambda: self.start(app))
+
+    def start(self, app: Flask) -> bool:
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return False
+            self._app = app
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, args=(app.config['HOUSEKEEPING_INTERVAL'],), name=self.name, daemon=True).start()
+        return True
+
+    def stop(self) -> None:
+        self._pid = None
+
+    def _run(self, interval: float) -> None:
+        pid = os.getpid()
+        lease_ttl = 2 * (interval + self._app.config['HOUSEKEEPING_TIME_BUDGET'])
+        while self._pid == pid:
+            time.sleep(interval)
+            if not self._run_lock.acquire(blocking=False):
+                continue  # already running from /management/housekeeping
+            try:
+                # plugins and audit trail expect a request, so run as if it was a request
+                with self._app.test_request_context('/management/housekeeping'):
+                    g.login = None
+                    g.customers = []
+                    g.scopes = []
+                    if db.acquire_lease(self.name, self.owner, ttl=lease_ttl):
+                        self.run(
+                            expired_threshold=self._app.config['DEFAULT_EXPIRED_DELETE_HRS'],
+                            info_threshold=self._app.config['DEFAULT_INFO_DELETE_HRS']
+                        )
+                    self._app.process_response(self._app.response_class())
+            except Exception as e:
+                LOG.error('Background {} failed: {}'.format(self.name, e))
+            finally:
+                self._run_lock.release()
+
+    def run_once(self, expired_threshold: int, info_threshold: int) -> Dict[str, Any]:
+        """
+        Run housekeeping now, unless it is already running in this or another process.
+        """
+        if not self._run_lock.acquire(blocking=False):
+            raise ApiError('housekeeping is already running', 409)
+        try:
+            ttl = current_app.config['HOUSEKEEPING_TIME_BUDGET'] + current_app.config['HOUSEKEEPING_INTERVAL']
+            if not db.acquire_lease(self.name, self.owner, ttl=2 * ttl):
+                raise ApiError('housekeeping is already running on another node', 409)
+            try:
+                return self.run(expired_threshold, info_threshold)
+            finally:
+                if self._pid != os.getpid():
+                    db.release_lease(self.name, self.owner)
+        finally:
+            self._run_lock.release()
+
+    def run(self, expired_threshold: int, info_threshold: int) -> Dict[str, Any]:
+        chunk_size = current_app.config['HOUSEKEEPING_CHUNK_SIZE']
+        deadline = time.monotonic() + current_app.config['HOUSEKEEPING_TIME_BUDGET']
+
+        db.prune_history()
+        db.prune_tombstones()
+        Alert.delete_expired(expired_threshold, info_threshold)
+
+        result = {
+            'expired': [],
+            'unshelve': [],
+            'unack': [],
+            'errors': [],
+            'more': False
+        }  # type: Dict[str, Any]
+
+        for key, find, action in [
+            ('expired', Alert.find_expired, 'expired'),
+            ('unshelve', Alert.find_unshelve, 'timeout'),
+            ('unack', Alert.find_unack, 'timeout')
+        ]:
+            after = None
+            while not result['more']:
+                found = find(after=after, limit=chunk_size)
+                if not found:
+                    break
+                after = found[-1].id
+                if action == 'timeout':
+                    alerts = Alert.find_by_ids([a.id for a in found])  # with complete history
+                else:
+                    alerts = found
+                result[key].extend(self._process(alerts, action, result['errors']))
+                if len(found) < chunk_size:
+                    break
+                result['more'] = time.monotonic() > deadline
+
+        if result['more']:
+            LOG.warning('Housekeeping stopped after {} seconds, remaining alerts are left for the next run'.format(
+                current_app.config['HOUSEKEEPING_TIME_BUDGET']))
+        return result
+
+    @staticmethod
+    def _process(alerts: List[Alert], action: str, errors: List[str]) -> List[str]:
+        event = 'alert-expired' if action == 'expired' else 'alert-timeout'
+        rejected_event = 'alert-expire-rejected' if action == 'expired' else 'alert-timeout-rejected'
+
+        accepted, rejected = process_actions(alerts, action, text='', timeout=None)
+        for alert, e in rejected:
+            write_audit_trail.send(current_app._get_current_object(), event=rejected_event, message=alert.text,
+                                   user=g.login, customers=g.customers, scopes=g.scopes, resource_id=alert.id, type='alert',
+                                   request=request)
+            errors.append(str(e))
+
+        Alert.from_actions(accepted)
+        for alert, _, text, _ in accepted:
+            write_audit_trail.send(current_app._get_current_object(), event=event, message=text, user=g.login,
+                                   customers=g.customers, scopes=g.scopes, resource_id=alert.id, type='alert', request=request)
+        return [alert.id for alert, _, _, _ in accepted]
+
+
+housekeeper = Housekeeper()
@@ -1,28 +1,37 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional
+
 from flask import current_app
 from werkzeug.datastructures import MultiDict
 
 from alerta.exceptions import ApiError
 
+CURSOR_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
 
 class Page:
 
-    def __init__(self, page: int = 1, page_size: int = None, items: int = 0) -> None:
+    def __init__(self, page: int = 1, page_size: int = None, items: int = 0, cursor: List[Any] = None) -> None:
 
         self.page = page
         self.page_size = page_size or current_app.config['DEFAULT_PAGE_SIZE']
         self.items = items
+        self.cursor = cursor  # sort key values of last item on previous page, used instead of page
 
         if items and self.page > self.pages or self.page < 1:
             raise ApiError('page out of range: 1-%s' % self.pages, 416)
 
     @staticmethod
     def from_params(params: MultiDict, items: int) -> 'Page':
-        # page, page-size, limit (deprecated)
-        page = params.get('page', 1, int)
+        # page, page-size, limit (deprecated), cursor
+        cursor = params.get('cursor', None)
+        page = params.get('page', 1, int) if not cursor else 1
         limit = params.get('limit', 0, int)
         page_size = params.get('page-size', limit, int)
 
-        return Page(page, page_size, items)
+        return Page(page, page_size, items, decode_cursor(cursor) if cursor else None)
 
     @property
     def pages(self) -> int:
@@ -31,3 +40,34 @@ class Page:
     @property
     def has_more(self) -> bool:
         return self.page < self.pages
+
+
+def encode_cursor(values: Optional[List[Any]]) -> Optional[str]:
+    """
+    Encode sort key values of the last item on a page as an opaque cursor for the next page.
+    """
+    if values is None:
+        return None
+
+    def default(o):
+        if isinstance(o, datetime):
+            return {'$dt': o.strftime(CURSOR_DATETIME_FORMAT)}
+        return str(o)
+
+    return base64.urlsafe_b64encode(json.dumps(values, default=default).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+
+    def object_hook(o):
+        if '$dt' in o:
+            return datetime.strptime(o['$dt'], CURSOR_DATETIME_FORMAT)
+        return o
+
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'), object_hook=object_hook)
+    except Exception:
+        raise ApiError('invalid cursor', 400)
+    if not isinstance(values, list) or not values:
+        raise ApiError('invalid cursor', 400)
+    return values
@@ -1,19 +1,33 @@
+import ast
+import inspect
 import logging
+import os
+import textwrap
+import threading
+import time
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
 from typing import TYPE_CHECKING
 
-from flask import Config, Flask
+from flask import (Config, Flask, copy_current_request_context, current_app,
+                   has_request_context)
 from pkg_resources import (DistributionNotFound, iter_entry_points,
                            load_entry_point)
 
-from alerta.plugins import app
+from alerta.database.stats import QueryStats
+from alerta.plugins import PluginBase, app
+from alerta.utils.format import custom_json_dumps
 
 LOG = logging.getLogger('alerta.plugins')
+DEAD_LETTER = logging.getLogger('alerta.plugins.deadletter')
+
+HOOKS = ['pre_receive', 'post_receive', 'status_change', 'take_action', 'take_actions', 'delete']
 
 if TYPE_CHECKING:
-    from typing import Iterable, Tuple  # noqa
+    from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple  # noqa
     from alerta.models.alert import Alert  # noqa
-    from alerta.plugins import PluginBase  # noqa
 
 
 class Plugins:
@@ -23,11 +37,15 @@ class Plugins:
         self.rules = None  # entry point
 
         self.config = Config('/')
+        self.executor = PluginExecutor()
+        self.stats = QueryStats(timing=True)  # hook timing by (plugin, hook)
+        self._hooks = dict()  # type: Dict[PluginBase, Dict[str, Optional[FrozenSet[str]]]]
 
         app.init_app()  # fake app for plugin config (deprecated)
 
     def register(self, app: Flask) -> None:
         self.config = app.config
+        self.stats = QueryStats(timing=app.config['PLUGINS_HOOK_TIMING'])
 
         entry_points = {}
         for ep in iter_entry_points('alerta.plugins'):
@@ -40,6 +58,7 @@ class Plugins:
                 if plugin:
                     self.plugins[name] = plugin()
                     LOG.info("Server plugin '{}' loaded.".format(name))
+                    LOG.debug("Server plugin '{}' hooks: {}".format(name, ', '.join(self.hooks(self.plugins[name]))))
             except Exception as e:
                 LOG.error("Failed to load plugin '{}': {}".format(name, str(e)))
         LOG.info('All server plugins enabled: {}'.format(', '.join(self.plugins.keys())))
@@ -67,3 +86,206 @@ class Plugins:
 
         # default when no routing rules defined
         return self.plugins.values(), self.config
+
+    def name_of(self, plugin: 'PluginBase') -> str:
+        for name, p in self.plugins.items():
+            if p is plugin:
+                return name
+        return plugin.name
+
+    def hooks(self, plugin: 'PluginBase') -> 'Dict[str, Optional[FrozenSet[str]]]':
+        """
+        Return the hooks a plugin implements, with the keyword arguments each one accepts
+        (or None for any). Plugins are inspected once, on first use.
+        """
+        try:
+            return self._hooks[plugin]
+        except KeyError:
+            return self._hooks.setdefault(plugin, plugin_hooks(plugin))
+
+    def implements(self, plugin: 'PluginBase', hook: str) -> bool:
+        return hook in self.hooks(plugin)
+
+    def call(self, plugin: 'PluginBase', hook: str, *args, **kwargs) -> 'Any':
+        """
+        Call an implemented plugin hook with the keyword arguments it accepts, and record
+        how long it took.
+        """
+        accepts = self.hooks(plugin)[hook]
+        if accepts is not None:
+            kwargs = {k: v for k, v in kwargs.items() if k in accepts}
+        if not self.stats.timing:
+            return getattr(plugin, hook)(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return getattr(plugin, hook)(*args, **kwargs)
+        finally:
+            self.stats.observe((self.name_of(plugin), hook), time.perf_counter() - start)
+
+    def is_async(self, plugin: 'PluginBase', hook: str) -> bool:
+        if not current_app.config['PLUGINS_ASYNC_BACKEND']:
+            return False
+        return hook in plugin.async_hooks or hook in current_app.config['PLUGINS_ASYNC_HOOKS'].get(self.name_of(plugin), [])
+
+    def run_async(self, plugin: 'PluginBase', hook: str, alert: 'Alert', *args, **kwargs) -> None:
+        """
+        Run plugin hook in the background. Hooks that fail, time out or cannot be queued
+        are dead-lettered. The return value of the hook is ignored.
+        """
+        name = self.name_of(plugin)
+        if current_app.config['PLUGINS_ASYNC_BACKEND'] == 'celery':
+            from alerta.tasks import plugin_hook
+            kwargs.pop('config', None)
+            plugin_hook.apply_async(
+                args=[name, hook, alert.id, list(args), kwargs],
+                soft_time_limit=current_app.config['PLUGINS_ASYNC_TIMEOUT']
+            )
+        else:
+            self.executor.submit(name, hook, alert, partial(self.call, plugin, hook, alert, *args, **kwargs), args)
+
+
+def plugin_hooks(plugin: 'PluginBase') -> 'Dict[str, Optional[FrozenSet[str]]]':
+    hooks = dict()  # type: Dict[str, Optional[FrozenSet[str]]]
+    for hook in HOOKS:
+        method = getattr(plugin, hook, None)
+        if method is None or _is_noop(method, hook):
+            continue
+        if hook == 'take_actions' and getattr(type(plugin), hook) is PluginBase.take_actions and 'take_action' not in hooks:
+            continue  # default take_actions() only calls take_action()
+        params = inspect.signature(method).parameters.values()
+        if any(p.kind == p.VAR_KEYWORD for p in params):
+            hooks[hook] = None
+        else:
+            hooks[hook] = frozenset(p.name for p in params if p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY))
+    return hooks
+
+
+def _is_noop(method: 'Callable', hook: str) -> bool:
+    """
+    Return True if a hook only raises NotImplementedError, or does nothing that calling it
+    could make a difference to, ie. a pre-receive hook that returns the alert unchanged or
+    a post-receive or status change hook that returns nothing.
+    """
+    try:
+        func = ast.parse(textwrap.dedent(inspect.getsource(method))).body[0]
+    except (OSError, TypeError, SyntaxError, IndexError):
+        return False  # source not available, assume it does something
+    if not isinstance(func, ast.FunctionDef):
+        return False
+    body = func.body[1:] if ast.get_docstring(func) is not None else func.body
+    if len(body) != 1:
+        return False
+    stmt = body[0]
+
+    def is_none(node):
+        return node is None or type(node).__name__ in ('Constant', 'NameConstant') and node.value is None
+
+    if isinstance(stmt, ast.Raise) and stmt.exc is not None:
+        exc = stmt.exc.func if isinstance(stmt.exc, ast.Call) else stmt.exc
+        return isinstance(exc, ast.Name) and exc.id == 'NotImplementedError'
+    if hook == 'pre_receive':
+        alert = func.args.args[1].arg if len(func.args.args) > 1 else None
+        return isinstance(stmt, ast.Return) and isinstance(stmt.value, ast.Name) and stmt.value.id == alert
+    if hook in ['post_receive', 'status_change']:
+        return isinstance(stmt, ast.Pass) or isinstance(stmt, ast.Return) and is_none(stmt.value)
+    return False
+
+
+def dead_letter(name: str, hook: str, alert: 'Alert', args: 'Tuple', reason: str) -> None:
+    DEAD_LETTER.error(custom_json_dumps({
+        'plugin': name,
+        'hook': hook,
+        'alert': alert.get_body(history=False),
+        'args': list(args),
+        'reason': reason,
+        'time': datetime.utcnow()
+    }))
+
+
+class PluginExecutor:
+    """
+    Bounded thread pool per plugin for async plugin hooks, so that a slow or failing
+    destination only delays its own notifications and never the request that caused them.
+    Hooks that time out are dead-lettered by a watchdog thread, but keep their worker and
+    queue slot until they return, so hung hooks can never use more than the pool.
+    """
+
+    def __init__(self) -> None:
+        self._pid = None  # type: int
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pools = dict()  # type: Dict[str, Tuple[ThreadPoolExecutor, threading.BoundedSemaphore]]
+        self._running = dict()  # type: Dict[object, Tuple[float, str, str, Alert, Tuple, float]]
+
+        self.dead_letters = 0
+
+    def _pool(self, name: str) -> 'Tuple[ThreadPoolExecutor, threading.BoundedSemaphore]':
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._pools = dict()  # threads do not survive a fork
+                self._running = dict()
+                threading.Thread(target=self._watch, args=(self._pid,), name='plugin-watchdog', daemon=True).start()
+            if name not in self._pools:
+                self._pools[name] = (
+                    ThreadPoolExecutor(current_app.config['PLUGINS_ASYNC_CONCURRENCY'], thread_name_prefix='plugin-{}'.format(name)),
+                    threading.BoundedSemaphore(current_app.config['PLUGINS_ASYNC_QUEUE_SIZE'])
+                )
+            return self._pools[name]
+
+    def submit(self, name: str, hook: str, alert: 'Alert', call: 'Callable', args: 'Tuple') -> None:
+        pool, pending = self._pool(name)
+        if not pending.acquire(blocking=False):
+            self.dead_letter(name, hook, alert, args, 'queue full')
+            return
+
+        if has_request_context():
+            call = copy_current_request_context(call)  # eg. forwarder reads request headers
+        else:
+            call = partial(self._in_app_context, current_app._get_current_object(), call)
+        timeout = current_app.config['PLUGINS_ASYNC_TIMEOUT']
+        try:
+            pool.submit(self._run, name, hook, alert, call, args, timeout, pending)
+        except RuntimeError as e:
+            pending.release()
+            self.dead_letter(name, hook, alert, args, str(e))
+
+    @staticmethod
+    def _in_app_context(app: Flask, call: 'Callable') -> None:
+        with app.app_context():
+            call()
+
+    def _run(self, name, hook, alert, call, args, timeout, pending):
+        token = object()
+        with self._lock:
+            self._running[token] = (time.monotonic() + timeout, name, hook, alert, args, timeout)
+            self._wakeup.notify()
+        error = None
+        try:
+            call()
+        except Exception as e:
+            error = e
+        finally:
+            with self._lock:
+                timed_out = self._running.pop(token, None) is None
+            pending.release()
+        if error and not timed_out:
+            self.dead_letter(name, hook, alert, args, str(error))
+
+    def _watch(self, pid: int) -> None:
+        # dead-letter hooks that are still running after their deadline
+        expired = []  # type: List[Tuple[float, str, str, Alert, Tuple, float]]
+        while self._pid == pid:
+            for _, name, hook, alert, args, timeout in expired:
+                self.dead_letter(name, hook, alert, args, 'timed out after {}s'.format(timeout))
+            with self._lock:
+                now = time.monotonic()
+                expired = [self._running.pop(t) for t, r in list(self._running.items()) if r[0] <= now]
+                if not expired:
+                    deadlines = [r[0] for r in self._running.values()]
+                    self._wakeup.wait(min(deadlines) - now if deadlines else None)
+
+    def dead_letter(self, name, hook, alert, args, reason):
+        self.dead_letters += 1
+        LOG.error("Error while running async {} plugin '{}': {}".format(hook, name, reason))
+        dead_letter(name, hook, alert, args, reason)
@@ -1,7 +1,11 @@
 from functools import wraps
+from typing import Any, Callable, List
 from urllib.parse import urljoin
 
-from flask import current_app, request
+from flask import (Response, current_app, g, has_request_context, jsonify,
+                   request, stream_with_context)
+
+from alerta.utils.format import fast_json_dumps
 
 
 def jsonp(func):
@@ -27,5 +31,44 @@ def absolute_url(path: str = '') -> str:
     return urljoin(base_url + '/', path.lstrip('/')) if path else base_url
 
 
+def absolute_url_prefix(path: str) -> str:
+    """
+    Same as absolute_url(path) but only worked out once per request, to build many urls
+    by appending to it, eg. absolute_url_prefix('/alert/') + id.
+    """
+    if not has_request_context():
+        return absolute_url(path)
+    prefixes = g.setdefault('url_prefixes', {})
+    if path not in prefixes:
+        prefixes[path] = absolute_url(path)
+    return prefixes[path]
+
+
 def base_url():
     return absolute_url(path='')
+
+
+def jsonify_stream(key: str, items: List[Any], serialize: Callable[[Any], Any], **kwargs: Any) -> Response:
+    """
+    Same as jsonify(**kwargs) with "key" set to the serialized "items", but the items are
+    serialized and encoded JSON_STREAM_CHUNK_SIZE at a time while the response is sent.
+    """
+    chunk_size = current_app.config['JSON_STREAM_CHUNK_SIZE']
+    if not chunk_size or current_app.config['JSONIFY_PRETTYPRINT_REGULAR'] or current_app.debug:
+        return jsonify(**{key: [serialize(item) for item in items]}, **kwargs)
+
+    def encode(obj: Any) -> bytes:
+        s = fast_json_dumps(obj)
+        return s if isinstance(s, bytes) else s.encode('utf-8')
+
+    head = encode({k: v for k, v in kwargs.items() if k < key})
+    tail = encode({k: v for k, v in kwargs.items() if k > key})
+
+    def generate():
+        yield head[:-1] + (b',' if len(head) > 2 else b'') + encode(key) + b':['
+        for i in range(0, len(items), chunk_size):
+            chunk = encode([serialize(item) for item in items[i:i + chunk_size]])[1:-1]
+            yield b',' + chunk if i else chunk
+        yield b']' + (b',' + tail[1:] if len(tail) > 2 else b'}')
+
+    return current_app.response_class(stream_with_context(generate()), mimetype=current_app.config['JSONIFY_MIMETYPE'])
@@ -0,0 +1,133 @@
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Set  # noqa
+
+from flask import Flask, current_app  # noqa
+
+from alerta.app import db
+from alerta.database.base import Query
+from alerta.utils.format import custom_json_dumps
+
+LOG = logging.getLogger('alerta')
+
+LISTEN_TIMEOUT = 1  # seconds, how often the listener checks it is still wanted
+RETRY_INTERVAL = 5  # seconds to wait before listening again after an error
+
+
+class Subscriber:
+
+    def __init__(self, query: Query, customers: List[str], maxsize: int) -> None:
+        self.query = query
+        self.customers = customers
+        self.key = repr(query)  # subscribers with the same filter share one query per change
+        self.queue = queue.Queue(maxsize)  # type: queue.Queue
+        self.overflow = False
+
+    def put(self, event: str) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflow = True
+
+    def can_see(self, customer: str) -> bool:
+        return not self.customers or customer in self.customers
+
+
+class AlertStream:
+    """
+    Fan out alert changes notified by the database to /alerts/stream subscribers. One
+    listener thread per process receives all changes, and each distinct subscriber
+    filter is queried once per batch of changes, instead of every client polling.
+    """
+
+    name = 'alert-stream'
+
+    def __init__(self) -> None:
+        self._app = None  # type: Flask
+        self._pid = None  # type: int
+        self._lock = threading.Lock()
+        self._subscribers = set()  # type: Set[Subscriber]
+        self.listening = threading.Event()  # set once changes are being received
+
+    def subscribe(self, query: Query, customers: List[str]) -> Subscriber:
+        subscriber = Subscriber(query, customers, maxsize=current_app.config['STREAM_QUEUE_SIZE'])
+        with self._lock:
+            if self._pid != os.getpid():
+                self._app = current_app._get_current_object()
+                self._pid = os.getpid()
+                self._subscribers = set()
+                self.listening.clear()
+                threading.Thread(target=self._run, name=self.name, daemon=True).start()
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _run(self) -> None:
+        pid = os.getpid()
+        while self._pid == pid:
+            try:
+                with self._app.app_context():
+                    for changes in db.get_alert_changes(timeout=LISTEN_TIMEOUT):
+                        if self._pid != pid:
+                            break
+                        self.listening.set()
+                        if changes:
+                            with self._app.app_context():
+                                self.publish(changes)
+            except Exception as e:
+                LOG.error('Alert stream listener failed: {}'.format(e))
+                self.listening.clear()
+                time.sleep(RETRY_INTERVAL)
+
+    def publish(self, changes: List[Dict[str, Any]]) -> None:
+        from alerta.models.alert import Alert
+
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            return
+
+        by_filter = dict()  # type: Dict[str, List[Subscriber]]
+        for subscriber in subscribers:
+            by_filter.setdefault(subscriber.key, []).append(subscriber)
+
+        ids = list({c['id'] for c in changes if c['change'] != 'delete'})
+        matched = dict()  # type: Dict[str, Dict[str, Alert]]
+        for key, group in by_filter.items():
+            matched[key] = {a.id: a for a in Alert.find_by_ids(ids, group[0].query)} if ids else {}
+
+        # alerts deleted before the change was received can't be matched to a filter
+        found = set().union(*matched.values())
+        missing = [i for i in ids if i not in found]
+        gone = set(missing) - {a.id for a in Alert.find_by_ids(missing)} if missing else set()
+
+        for key, group in by_filter.items():
+            alerts = matched[key]
+            for change in changes:
+                if change['id'] in alerts and change['change'] != 'delete':
+                    # alert state as of the change, not as of now, if the database sent it
+                    event = self.format_event(change['change'], {
+                        'id': change['id'],
+                        'change': change['change'],
+                        'alert': dict(alerts[change['id']].serialize, **change.get('alert', {}))
+                    })
+                    for subscriber in group:
+                        subscriber.put(event)
+                elif change['change'] == 'delete' or change['id'] in gone:
+                    event = self.format_event(change['change'], {'id': change['id'], 'change': change['change']})
+                    for subscriber in group:
+                        if subscriber.can_see(change['customer']):
+                            subscriber.put(event)
+
+    @staticmethod
+    def format_event(event: str, data: Dict[str, Any]) -> str:
+        return 'event: {}\ndata: {}\n\n'.format(event, custom_json_dumps(data))
+
+
+alert_stream = AlertStream()
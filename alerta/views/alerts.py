@@ -1,6 +1,8 @@
-from datetime import datetime
+import queue
+from datetime import datetime, timedelta
+from operator import attrgetter, methodcaller
 
-from flask import current_app, g, jsonify, request
+from flask import Response, current_app, g, jsonify, request
 from flask_cors import cross_origin
 
 from alerta.app import qb
@@ -13,10 +15,12 @@ from alerta.models.enums import Scope
 from alerta.models.metrics import Timer, timer
 from alerta.models.switch import Switch
 from alerta.utils.api import (assign_customer, process_action, process_alert,
-                              process_delete, process_status)
+                              process_alerts, process_delete, process_status)
 from alerta.utils.audit import write_audit_trail
-from alerta.utils.paging import Page
-from alerta.utils.response import absolute_url, jsonp
+from alerta.utils.format import DateTime
+from alerta.utils.paging import Page, encode_cursor
+from alerta.utils.response import absolute_url, jsonify_stream, jsonp
+from alerta.utils.stream import alert_stream
 
 from ..models.note import Note
 from . import api
@@ -77,6 +81,65 @@ def receive():
         raise ApiError('insert or update of received alert failed', 500)
 
 
+@api.route('/alerts/_batch', methods=['OPTIONS', 'POST'])
+@cross_origin()
+@permission(Scope.write_alerts)
+@timer(receive_timer)
+@jsonp
+def receive_batch():
+    data = request.json
+    if isinstance(data, dict):
+        data = data.get('alerts')
+    if not isinstance(data, list):
+        raise ApiError("must supply a list of alerts or 'alerts' as json data", 400)
+
+    results = [None] * len(data)
+    received = []
+    for i, body in enumerate(data):
+        try:
+            alert = Alert.parse(body)
+            alert.customer = assign_customer(wanted=alert.customer)
+        except ValueError as e:
+            results[i] = dict(status='error', message=str(e), code=400)
+            continue
+        except ApiError as e:
+            results[i] = dict(status='error', message=e.message, code=e.code)
+            continue
+        received.append((i, alert))
+
+    def audit_trail_alert(alert: Alert, event: str):
+        write_audit_trail.send(current_app._get_current_object(), event=event, message=alert.text, user=g.login,
+                               customers=g.customers, scopes=g.scopes, resource_id=alert.id, type='alert', request=request)
+
+    processed = process_alerts([alert for _, alert in received])
+
+    for (i, alert), result in zip(received, processed):
+        try:
+            if isinstance(result, Exception):
+                raise result
+        except RejectException as e:
+            audit_trail_alert(alert, event='alert-rejected')
+            results[i] = dict(status='error', message=str(e), id=alert.id, code=403)
+        except RateLimit as e:
+            audit_trail_alert(alert, event='alert-rate-limited')
+            results[i] = dict(status='error', message=str(e), id=alert.id, code=429)
+        except HeartbeatReceived as heartbeat:
+            audit_trail_alert(alert, event='alert-heartbeat')
+            results[i] = dict(status='ok', message=str(heartbeat), id=heartbeat.id, code=202)
+        except BlackoutPeriod as e:
+            audit_trail_alert(alert, event='alert-blackout')
+            results[i] = dict(status='ok', message=str(e), id=alert.id, code=202)
+        except ForwardingLoop as e:
+            results[i] = dict(status='ok', message=str(e), code=202)
+        except Exception as e:
+            results[i] = dict(status='error', message=str(e), id=alert.id, code=500)
+        else:
+            audit_trail_alert(result, event='alert-received')
+            results[i] = dict(status='ok', id=result.id, alert=result.serialize, code=201)
+
+    return jsonify(status='ok', results=results, count=len(results))
+
+
 @api.route('/alert/<alert_id>', methods=['OPTIONS', 'GET'])
 @cross_origin()
 @permission(Scope.read_alerts)
@@ -296,22 +359,27 @@ def delete_alert(alert_id):
 def search_alerts():
     query_time = datetime.utcnow()
     query = qb.from_params(request.args, customers=g.customers, query_time=query_time)
-    severity_count = Alert.get_counts_by_severity(query)
-    status_count = Alert.get_counts_by_status(query)
+    paging = Page.from_params(request.args, items=0)
+    fields = Alert.fields_from_params(request.args)
+
+    if request.args.get('changed-since', None):
+        return changed_alerts(query, query_time, paging, fields)
+
+    alerts, severity_count, status_count, next_key = Alert.find_all_with_counts(
+        query, paging.page, paging.page_size, paging.cursor, fields)
 
     total = sum(severity_count.values())
     paging = Page.from_params(request.args, total)
 
-    alerts = Alert.find_all(query, paging.page, paging.page_size)
-
     if alerts:
-        return jsonify(
+        return jsonify_stream(
+            'alerts', alerts, methodcaller('serialize_fields', fields),
             status='ok',
             page=paging.page,
             pageSize=paging.page_size,
             pages=paging.pages,
-            more=paging.has_more,
-            alerts=[alert.serialize for alert in alerts],
+            more=paging.has_more if not paging.cursor else next_key is not None,
+            nextCursor=encode_cursor(next_key),
             total=total,
             statusCounts=status_count,
             severityCounts=severity_count,
@@ -326,6 +394,7 @@ def search_alerts():
             pageSize=paging.page_size,
             pages=0,
             more=False,
+            nextCursor=None,
             alerts=[],
             total=0,
             severityCounts=severity_count,
@@ -335,6 +404,30 @@ def search_alerts():
         )
 
 
+def changed_alerts(query, query_time, paging, fields):
+    try:
+        changed_since = DateTime.parse(request.args['changed-since'])
+    except ValueError as e:
+        raise ApiError(str(e), 400)
+
+    max_age = current_app.config['DELETED_ALERTS_MAX_AGE']
+    if max_age and changed_since < query_time - timedelta(hours=max_age):
+        raise ApiError('changed-since is older than deleted alerts are kept, reload all alerts', 410)
+
+    alerts, deleted, removed, watermark, more = Alert.find_changed_since(query, changed_since, g.customers, paging.page_size, fields)
+
+    return jsonify(
+        status='ok',
+        alerts=[alert.serialize_fields(fields) for alert in alerts],
+        deleted=deleted,
+        removed=removed,  # changed alerts that no longer match the filter
+        total=len(alerts),
+        more=more,
+        watermark=watermark.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),  # full precision, so no changes are skipped
+        autoRefresh=Switch.find_by_name('auto-refresh-allow').is_on
+    )
+
+
 @api.route('/alerts/history', methods=['OPTIONS', 'GET'])
 @cross_origin()
 @permission(Scope.read_alerts)
@@ -343,13 +436,14 @@ def search_alerts():
 def history():
     query = qb.from_params(request.args, customers=g.customers)
     paging = Page.from_params(request.args, items=0)
-    history = Alert.get_history(query, paging.page, paging.page_size)
+    history = Alert.get_history(query, paging.page, paging.page_size, paging.cursor)
 
     if history:
-        return jsonify(
+        return jsonify_stream(
+            'history', history, attrgetter('serialize'),
             status='ok',
-            history=[h.serialize for h in history],
-            total=len(history)
+            total=len(history),
+            nextCursor=encode_cursor([history[-1].update_time, history[-1].id]) if len(history) == paging.page_size else None
         )
     else:
         return jsonify(
@@ -360,6 +454,31 @@ def history():
         )
 
 
+# stream of alert changes
+@api.route('/alerts/stream', methods=['OPTIONS', 'GET'])
+@cross_origin()
+@permission(Scope.read_alerts)
+def stream_alerts():
+    query = qb.from_params(request.args, customers=g.customers)
+    subscriber = alert_stream.subscribe(query, g.customers)
+    keepalive = current_app.config['STREAM_KEEPALIVE']
+
+    def events():
+        try:
+            yield 'retry: {}\n\n'.format(keepalive * 1000)
+            while not subscriber.overflow:
+                try:
+                    yield subscriber.queue.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+            # client must reload alerts because some changes were dropped
+            yield 'event: overflow\ndata: {}\n\n'
+        finally:
+            alert_stream.unsubscribe(subscriber)
+
+    return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 # severity counts
 # status counts
 @api.route('/alerts/count', methods=['OPTIONS', 'GET'])
@@ -369,8 +488,7 @@ def history():
 @jsonp
 def get_counts():
     query = qb.from_params(request.args, customers=g.customers)
-    severity_count = Alert.get_counts_by_severity(query)
-    status_count = Alert.get_counts_by_status(query)
+    severity_count, status_count = Alert.get_counts_by_severity_and_status(query)
 
     return jsonify(
         status='ok',
@@ -462,6 +580,11 @@ def get_top10_standing():
         )
 
 
+def is_unfiltered(args):
+    # rollups hold counts for all alerts, so can only answer requests without a filter
+    return set(args) <= {'_', 'callback', 'token', 'api-key'}
+
+
 # get alert environments
 @api.route('/environments', methods=['OPTIONS', 'GET'])
 @cross_origin()
@@ -469,8 +592,11 @@ def get_top10_standing():
 @timer(gets_timer)
 @jsonp
 def get_environments():
-    query = qb.from_params(request.args, customers=g.customers)
-    environments = Alert.get_environments(query)
+    if is_unfiltered(request.args):
+        environments = Alert.get_rollup('environment', g.customers)
+    else:
+        query = qb.from_params(request.args, customers=g.customers)
+        environments = Alert.get_environments(query)
 
     if environments:
         return jsonify(
@@ -494,8 +620,11 @@ def get_environments():
 @timer(gets_timer)
 @jsonp
 def get_services():
-    query = qb.from_params(request.args, customers=g.customers)
-    services = Alert.get_services(query)
+    if is_unfiltered(request.args):
+        services = Alert.get_rollup('service', g.customers)
+    else:
+        query = qb.from_params(request.args, customers=g.customers)
+        services = Alert.get_services(query)
 
     if services:
         return jsonify(
@@ -519,8 +648,11 @@ def get_services():
 @timer(gets_timer)
 @jsonp
 def get_projects():
-    query = qb.from_params(request.args, customers=g.customers)
-    projects = Alert.get_projects(query)
+    if is_unfiltered(request.args):
+        projects = Alert.get_rollup('project', g.customers)
+    else:
+        query = qb.from_params(request.args, customers=g.customers)
+        projects = Alert.get_projects(query)
 
     if projects:
         return jsonify(
@@ -544,8 +676,11 @@ def get_projects():
 @timer(gets_timer)
 @jsonp
 def get_groups():
-    query = qb.from_params(request.args, customers=g.customers)
-    groups = Alert.get_groups(query)
+    if is_unfiltered(request.args):
+        groups = Alert.get_rollup('group', g.customers)
+    else:
+        query = qb.from_params(request.args, customers=g.customers)
+        groups = Alert.get_groups(query)
 
     if groups:
         return jsonify(
@@ -569,8 +704,11 @@ def get_groups():
 @timer(gets_timer)
 @jsonp
 def get_tags():
-    query = qb.from_params(request.args, customers=g.customers)
-    tags = Alert.get_tags(query)
+    if is_unfiltered(request.args):
+        tags = Alert.get_rollup('tag', g.customers)
+    else:
+        query = qb.from_params(request.args, customers=g.customers)
+        tags = Alert.get_tags(query)
 
     if tags:
         return jsonify(
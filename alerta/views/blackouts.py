@@ -8,6 +8,7 @@ from alerta.models.blackout import Blackout
 from alerta.models.enums import Scope
 from alerta.utils.api import assign_customer
 from alerta.utils.audit import write_audit_trail
+from alerta.utils.paging import Page, encode_cursor
 from alerta.utils.response import absolute_url, jsonp
 
 from . import api
@@ -63,13 +64,15 @@ def get_blackout(blackout_id):
 @jsonp
 def list_blackouts():
     query = qb.from_params(request.args, customers=g.customers)
-    blackouts = Blackout.find_all(query)
+    paging = Page.from_params(request.args, items=0)
+    blackouts = Blackout.find_all(query, paging.page, paging.page_size, paging.cursor)
 
     if blackouts:
         return jsonify(
             status='ok',
             blackouts=[blackout.serialize for blackout in blackouts],
-            total=len(blackouts)
+            total=len(blackouts),
+            nextCursor=encode_cursor([blackouts[-1].id]) if len(blackouts) == paging.page_size else None
         )
     else:
         return jsonify(
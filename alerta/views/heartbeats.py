@@ -8,6 +8,7 @@ from alerta.models.enums import Scope
 from alerta.models.heartbeat import Heartbeat
 from alerta.utils.api import assign_customer
 from alerta.utils.audit import write_audit_trail
+from alerta.utils.paging import Page, encode_cursor
 from alerta.utils.response import jsonp
 
 from . import api
@@ -59,13 +60,15 @@ def get_heartbeat(heartbeat_id):
 @jsonp
 def list_heartbeats():
     query = qb.from_params(request.args, customers=g.customers)
-    heartbeats = Heartbeat.find_all(query)
+    paging = Page.from_params(request.args, items=0)
+    heartbeats = Heartbeat.find_all(query, paging.page, paging.page_size, paging.cursor)
 
     if heartbeats:
         return jsonify(
             status='ok',
             heartbeats=[heartbeat.serialize for heartbeat in heartbeats],
-            total=len(heartbeats)
+            total=len(heartbeats),
+            nextCursor=encode_cursor([heartbeats[-1].id]) if len(heartbeats) == paging.page_size else None
         )
     else:
         return jsonify(
@@ -7,7 +7,7 @@ from alerta.exceptions import (ApiError, BlackoutPeriod, HeartbeatReceived,
                                RateLimit, RejectException)
 from alerta.models.alert import Alert
 from alerta.models.enums import Scope
-from alerta.utils.api import assign_customer, process_alert
+from alerta.utils.api import assign_customer, process_alerts
 from alerta.utils.audit import write_audit_trail
 
 from . import webhooks
@@ -39,42 +39,46 @@ def custom(webhook, path):
         rv = [rv]
 
     if isinstance(rv, list):
-        alerts = []
         for alert in rv:
             alert.customer = assign_customer(wanted=alert.customer)
 
-            def audit_trail_alert(event: str):
-                write_audit_trail.send(current_app._get_current_object(), event=event, message=alert.text, user=g.login,
-                                       customers=g.customers, scopes=g.scopes, resource_id=alert.id, type='alert',
-                                       request=request)
+        def audit_trail_alert(alert: Alert, event: str, message: str):
+            write_audit_trail.send(current_app._get_current_object(), event=event, message=message, user=g.login,
+                                   customers=g.customers, scopes=g.scopes, resource_id=alert.id, type='alert',
+                                   request=request)
 
+        # alerts are processed together, so every alert gets its own result
+        results = []
+        for alert, result in zip(rv, process_alerts(rv)):
             try:
-                alert = process_alert(alert)
+                if isinstance(result, Exception):
+                    raise result
             except RejectException as e:
-                audit_trail_alert(event='alert-rejected')
-                raise ApiError(str(e), 403)
+                audit_trail_alert(alert, event='alert-rejected', message=alert.text)
+                results.append(dict(status='error', message=str(e), id=alert.id, code=403))
             except RateLimit as e:
-                audit_trail_alert(event='alert-rate-limited')
-                return jsonify(status='error', message=str(e), id=alert.id), 429
+                audit_trail_alert(alert, event='alert-rate-limited', message=alert.text)
+                results.append(dict(status='error', message=str(e), id=alert.id, code=429))
             except HeartbeatReceived as e:
-                audit_trail_alert(event='alert-heartbeat')
-                return jsonify(status='ok', message=str(e), id=alert.id), 202
+                audit_trail_alert(alert, event='alert-heartbeat', message=alert.text)
+                results.append(dict(status='ok', message=str(e), id=alert.id, code=202))
             except BlackoutPeriod as e:
-                audit_trail_alert(event='alert-blackout')
-                return jsonify(status='ok', message=str(e), id=alert.id), 202
+                audit_trail_alert(alert, event='alert-blackout', message=alert.text)
+                results.append(dict(status='ok', message=str(e), id=alert.id, code=202))
             except Exception as e:
-                raise ApiError(str(e), 500)
+                results.append(dict(status='error', message=str(e), id=alert.id, code=500))
+            else:
+                audit_trail_alert(result, event='webhook-received', message='alert received via {} webhook'.format(webhook))
+                results.append(dict(status='ok', id=result.id, alert=result.serialize, code=201))
 
-            text = 'alert received via {} webhook'.format(webhook)
-            write_audit_trail.send(current_app._get_current_object(), event='webhook-received', message=text,
-                                   user=g.login, customers=g.customers, scopes=g.scopes, resource_id=alert.id,
-                                   type='alert', request=request)
-            alerts.append(alert)
-
-        if len(alerts) == 1:
-            return jsonify(status='ok', id=alerts[0].id, alert=alerts[0].serialize), 201
+        if len(results) == 1:
+            result = results.pop()
+            if result['code'] in (403, 500):
+                raise ApiError(result['message'], result['code'])
+            return jsonify(**{k: v for k, v in result.items() if k != 'code'}), result['code']
         else:
-            return jsonify(status='ok', ids=[alert.id for alert in alerts]), 201
+            ids = [r['id'] for r in results if r['code'] == 201]
+            return jsonify(status='ok', ids=ids, results=results, count=len(results)), 201 if len(ids) == len(results) else 200
 
     else:
         text = 'request received via {} webhook'.format(webhook)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Compare the time taken to build the body of an /alerts response with the standard
+JSON encoder and with the streaming encoder, using orjson if it is installed.
+
+    $ python contrib/benchmarks/serialize.py --alerts 1000 --history 100
+
+No database is needed, alerts and history are made up.
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime, timedelta
+from operator import attrgetter
+
+from flask import Flask, jsonify
+
+from alerta.models.alert import Alert
+from alerta.models.history import History
+from alerta.utils.format import CustomJSONEncoder, orjson
+from alerta.utils.response import jsonify_stream
+
+
+def make_alerts(count, history):
+    now = datetime.utcnow()
+    alerts = []
+    for i in range(count):
+        alert = Alert(
+            resource='node{:04d}'.format(i),
+            event='node_down',
+            environment='Production',
+            severity='major',
+            status='open',
+            service=['Network', 'Web'],
+            group='Network',
+            value='DOWN',
+            text='Node is not responding to ping.',
+            tags=['dc1', 'rack:{}'.format(i % 40)],
+            attributes={'region': 'EU', 'ip': '10.0.{}.{}'.format(i // 256 % 256, i % 256)},
+            origin='benchmark',
+            timeout=86400,
+            create_time=now,
+            receive_time=now,
+            last_receive_time=now
+        )
+        alert.update_time = now
+        alert.history = [
+            History(
+                id=alert.id,
+                event=alert.event,
+                severity='major',
+                status='open',
+                value='DOWN',
+                text='duplicate alert',
+                change_type='value',
+                update_time=now - timedelta(seconds=h),
+                user=None,
+                timeout=86400
+            ) for h in range(history)
+        ]
+        alerts.append(alert)
+    return alerts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--alerts', type=int, default=1000, help='alerts per response')
+    parser.add_argument('--history', type=int, default=100, help='history entries per alert')
+    parser.add_argument('--repeat', type=int, default=5, help='best of this many runs')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object('alerta.settings')
+    app.config['BASE_URL'] = 'https://alerta.example.com/api'
+    app.json_encoder = CustomJSONEncoder
+
+    with app.test_request_context('/alerts'):
+        alerts = make_alerts(args.alerts, args.history)
+
+        def standard():
+            return jsonify(status='ok', total=len(alerts), alerts=[a.serialize for a in alerts]).get_data()
+
+        def streamed(encoder):
+            def run():
+                app.config['JSON_ENCODER'] = encoder
+                return jsonify_stream('alerts', alerts, attrgetter('serialize'), status='ok', total=len(alerts)).get_data()
+            return run
+
+        results = [('standard encoder (jsonify)', standard), ('streaming, standard encoder', streamed('json'))]
+        if orjson:
+            results.append(('streaming, orjson', streamed('orjson')))
+        else:
+            print('orjson is not installed, skipping orjson encoder')
+
+        baseline = None
+        expected = json.loads(standard().decode('utf-8'))
+        for name, func in results:
+            assert json.loads(func().decode('utf-8')) == expected, name
+            best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+            baseline = baseline or best
+            print('{:<30} {:8.3f}s  {:5.1f}x'.format(name, best, baseline / best))
+
+
+if __name__ == '__main__':
+    main()
@@ -45,7 +45,7 @@ setuptools.setup(
         'Flask-Cors>=3.0.2',
         'mohawk',
         'PyJWT',
-        'pymongo>=3.6',
+        'pymongo>=3.9',
         'pyparsing',
         'python-dateutil',
         'pytz',
@@ -55,7 +55,7 @@ setuptools.setup(
         'sentry-sdk[flask]>=0.10.2',
     ],
     extras_require={
-        'mongodb': ['pymongo>=3.0'],
+        'mongodb': ['pymongo>=3.9'],
         'postgres': ['psycopg2']
     },
     include_package_data=True,
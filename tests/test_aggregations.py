@@ -326,3 +326,97 @@ class AggregationsTestCase(unittest.TestCase):
                 'tag': 'foo'
             }
         ])
+
+    def test_alert_counts(self):
+
+        for alert in [self.fatal_alert, self.critical_alert, self.major_alert, self.warn_alert]:
+            response = self.client.post('/alert', data=json.dumps(alert), headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+            alert_id = json.loads(response.data.decode('utf-8'))['id']
+
+        response = self.client.put('/alert/' + alert_id + '/status', data=json.dumps({'status': 'ack'}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/alerts/count')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['total'], 4)
+        self.assertEqual(data['severityCounts'], {'critical': 2, 'major': 1, 'warning': 1})
+        self.assertEqual(data['statusCounts'], {'open': 3, 'ack': 1})
+
+        # counts are for all matching alerts, not just the page returned
+        response = self.client.get('/alerts?page=2&page-size=3&sort-by=severity')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(data['alerts']), 1)
+        self.assertEqual(data['total'], 4)
+        self.assertEqual(data['pages'], 2)
+        self.assertEqual(data['severityCounts'], {'critical': 2, 'major': 1, 'warning': 1})
+        self.assertEqual(data['statusCounts'], {'open': 3, 'ack': 1})
+
+        response = self.client.get('/alerts?status=ack')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([a['id'] for a in data['alerts']], [alert_id])
+        self.assertEqual(data['severityCounts'], {'warning': 1})
+        self.assertEqual(data['statusCounts'], {'ack': 1})
+
+        response = self.client.get('/alerts?page=3&page-size=3')
+        self.assertEqual(response.status_code, 416)
+
+        response = self.client.get('/alerts?status=closed')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['alerts'], [])
+        self.assertEqual(data['total'], 0)
+        self.assertEqual(data['severityCounts'], {})
+
+    def test_rollups(self):
+
+        self.normal_alert['severity'] = 'info'
+        for alert in [self.fatal_alert, self.critical_alert, self.major_alert, self.warn_alert, self.normal_alert]:
+            response = self.client.post('/alert', data=json.dumps(alert), headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+            alert_id = json.loads(response.data.decode('utf-8'))['id']
+
+        # duplicate, correlate, ack, tag and delete alerts
+        response = self.client.post('/alert', data=json.dumps(self.fatal_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        self.major_alert['severity'] = 'minor'
+        response = self.client.post('/alert', data=json.dumps(self.major_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        response = self.client.put('/alert/' + alert_id + '/status', data=json.dumps({'status': 'ack'}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.put('/alert/' + alert_id + '/tag', data=json.dumps({'tags': ['foo', 'new']}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.put('/alert/' + alert_id + '/untag', data=json.dumps({'tags': ['quux']}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.put('/_bulk/alerts/tag?resource=' + self.critical_alert['resource'], data=json.dumps({'tags': ['new']}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.delete('/_bulk/alerts?resource=' + self.warn_alert['resource'])
+        self.assertEqual(response.status_code, 200)
+
+        def counts(path, key):
+            # unfiltered requests are answered from rollups, filtered ones by scanning alerts
+            unfiltered = json.loads(self.client.get(path).data.decode('utf-8'))[key]
+            filtered = json.loads(self.client.get(path + '?environment=Production').data.decode('utf-8'))[key]
+            self.assertEqual(sorted(unfiltered, key=repr), sorted(filtered, key=repr))
+            return unfiltered
+
+        environments = counts('/environments', 'environments')
+        self.assertEqual(environments, [{
+            'environment': 'Production',
+            'severityCounts': {'critical': 2, 'minor': 1, 'info': 1},
+            'statusCounts': {'open': 3, 'ack': 1},
+            'count': 4
+        }])
+        counts('/services', 'services')
+        counts('/projects', 'projects')
+        counts('/alerts/groups', 'groups')
+        tags = counts('/alerts/tags', 'tags')
+        self.assertEqual(sorted((t['tag'], t['count']) for t in tags), [('bar', 1), ('baz', 1), ('foo', 2), ('new', 2)])
+
+        with self.app.app_context():
+            db.rebuild_rollups()
+        self.assertEqual(counts('/environments', 'environments'), environments)
+        self.assertEqual(counts('/alerts/tags', 'tags'), tags)
@@ -1,6 +1,7 @@
 import json
 import unittest
-from datetime import datetime
+from datetime import datetime, timedelta
+from unittest.mock import patch
 from uuid import uuid4
 
 from alerta.app import alarm_model, create_app, db, plugins
@@ -746,6 +747,377 @@ class AlertsTestCase(unittest.TestCase):
             self.assertEqual(type(body['receiveTime']), str)
             self.assertEqual(type(body['updateTime']), str)
 
+    def test_duplicate_or_correlated(self):
+        from flask import g
+        with self.app.test_request_context('/'):
+            g.login = 'foo'
+
+            alert = Alert(resource='net01', event='node_down', environment='Production', service=['Network'], severity='major',
+                          correlate=['node_down', 'node_marginal'])
+            self.assertIsNone(alert.is_duplicate_or_correlated())
+            created = process_alert(alert)
+
+            # same event and severity is a duplicate
+            dup = Alert(resource='net01', event='node_down', environment='Production', service=['Network'], severity='major',
+                        correlate=['node_down', 'node_marginal'])
+            self.assertEqual(dup.is_duplicate_or_correlated().id, created.id)
+            alert = process_alert(dup)
+            self.assertEqual(alert.id, created.id)
+            self.assertEqual(alert.duplicate_count, 1)
+            self.assertTrue(alert.repeat)
+
+            # correlated event returns previous severity and trend
+            corr = Alert(resource='net01', event='node_marginal', environment='Production', service=['Network'], severity='minor',
+                         correlate=['node_down', 'node_marginal'])
+            self.assertEqual(corr.is_duplicate_or_correlated().id, created.id)
+            alert = process_alert(corr)
+            self.assertEqual(alert.id, created.id)
+            self.assertEqual(alert.event, 'node_marginal')
+            self.assertEqual(alert.previous_severity, 'major')
+            self.assertEqual(alert.trend_indication, 'lessSevere')
+            self.assertEqual(alert.duplicate_count, 0)
+
+    def test_batch_alerts(self):
+
+        major = {'resource': 'net01', 'event': 'node_down', 'environment': 'Production',
+                 'service': ['Network'], 'severity': 'major', 'correlate': ['node_down', 'node_marginal']}
+        minor = {'resource': 'net01', 'event': 'node_marginal', 'environment': 'Production',
+                 'service': ['Network'], 'severity': 'minor', 'correlate': ['node_down', 'node_marginal']}
+        other = {'resource': 'net02', 'event': 'node_down', 'environment': 'Production',
+                 'service': ['Network'], 'severity': 'major'}
+
+        # create, duplicate and correlate in a single batch
+        response = self.client.post('/alerts/_batch', data=json.dumps([major, major, minor, other, {'event': 'foo'}]), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['count'], 5)
+        results = data['results']
+        self.assertEqual([r['code'] for r in results], [201, 201, 201, 201, 400])
+        self.assertEqual(results[0]['id'], results[1]['id'])
+        self.assertEqual(results[0]['id'], results[2]['id'])
+        self.assertNotEqual(results[0]['id'], results[3]['id'])
+        self.assertEqual(results[1]['alert']['duplicateCount'], 1)
+        self.assertTrue(results[1]['alert']['repeat'])
+        self.assertEqual(results[2]['alert']['event'], 'node_marginal')
+        self.assertEqual(results[2]['alert']['previousSeverity'], 'major')
+        self.assertEqual(results[2]['alert']['trendIndication'], 'lessSevere')
+        self.assertEqual(results[2]['alert']['duplicateCount'], 0)
+
+        # existing alerts are de-duplicated in a later batch
+        response = self.client.post('/alerts/_batch', data=json.dumps({'alerts': [minor, other]}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['results'][0]['id'], results[0]['id'])
+        self.assertEqual(data['results'][0]['alert']['duplicateCount'], 1)
+        self.assertEqual(data['results'][1]['id'], results[3]['id'])
+        self.assertEqual(data['results'][1]['alert']['duplicateCount'], 1)
+        self.assertEqual(len(data['results'][1]['alert']['history']), 1)
+
+        response = self.client.get('/alerts?resource=net01')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['total'], 1)
+
+    def test_batch_alerts_conflict(self):
+
+        response = self.client.post('/alert', data=json.dumps(self.major_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        alert_id = json.loads(response.data.decode('utf-8'))['id']
+
+        # alert created by another request after the lookup is de-duplicated, not lost
+        lookup = db.get_duplicates_or_correlated
+        lookups = []
+
+        def racing_lookup(alerts):
+            lookups.append(len(alerts))
+            return [None] * len(alerts) if len(lookups) == 1 else lookup(alerts)
+
+        with patch.object(db, 'get_duplicates_or_correlated', side_effect=racing_lookup):
+            response = self.client.post('/alerts/_batch', data=json.dumps([self.major_alert]), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(lookups, [1, 1])
+        result = json.loads(response.data.decode('utf-8'))['results'][0]
+        self.assertEqual(result['code'], 201)
+        self.assertEqual(result['id'], alert_id)
+        self.assertEqual(result['alert']['duplicateCount'], 1)
+
+    def test_id_prefix(self):
+
+        response = self.client.post('/alert', data=json.dumps(self.major_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        alert_id = json.loads(response.data.decode('utf-8'))['id']
+
+        # short ids are case-insensitive prefix matches
+        for id in [alert_id, alert_id[:8], alert_id[:8].upper()]:
+            response = self.client.get('/alert/' + id)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.data.decode('utf-8'))['alert']['id'], alert_id)
+
+        # pattern characters are not wildcards
+        for id in [alert_id[:7] + '_', alert_id[:7] + '%', alert_id[:7] + '.']:
+            response = self.client.get('/alert/' + id)
+            self.assertEqual(response.status_code, 404)
+
+        response = self.client.put('/alert/' + alert_id[:8] + '/status', data=json.dumps({'status': 'ack'}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/alert/' + alert_id)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['alert']['status'], 'ack')
+
+    def test_history_table(self):
+
+        # history stored in alerts
+        response = self.client.post('/alert', data=json.dumps(self.major_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        alert_id = json.loads(response.data.decode('utf-8'))['id']
+        response = self.client.put('/alert/' + alert_id + '/status', data=json.dumps({'status': 'ack'}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        app = create_app({
+            'TESTING': True,
+            'AUTH_REQUIRED': False,
+            'HISTORY_LIMIT': 5,
+            'HISTORY_TABLE': True
+        })
+        client = app.test_client()
+
+        # existing history is not visible until migrated
+        response = client.get('/alert/' + alert_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['alert']['history'], [])
+
+        with app.app_context():
+            self.assertEqual(db.migrate_history(), 1)
+            self.assertEqual(db.migrate_history(), 0)
+
+        response = client.get('/alert/' + alert_id)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([h['status'] for h in data['alert']['history']], ['open', 'ack'])
+
+        # new history is appended to history table
+        for alert in [self.critical_alert, self.warn_alert, self.critical_alert, self.warn_alert]:
+            response = client.post('/alert', data=json.dumps(alert), headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+            data = json.loads(response.data.decode('utf-8'))
+            self.assertEqual(data['id'], alert_id)
+            self.assertEqual(data['alert']['history'][-1]['severity'], alert['severity'])
+
+        response = client.post('/alerts/_batch', data=json.dumps({'alerts': [self.critical_alert]}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['results'][0]['alert']['history'][-1]['severity'], 'critical')
+
+        # only most recent history is returned with alerts
+        response = client.get('/alerts?fields=history&id=' + alert_id)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(data['alerts'][0]['history']), 5)
+        self.assertEqual(data['alerts'][0]['history'][-1]['severity'], 'critical')
+
+        # history beyond the limit is kept until pruned by housekeeping
+        response = client.get('/alerts/history?resource=' + self.resource)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(data['history']), 7)
+        self.assertEqual(data['history'][0]['severity'], 'critical')
+
+        response = client.get('/management/housekeeping')
+        self.assertEqual(response.status_code, 200)
+
+        response = client.get('/alerts/history?resource=' + self.resource)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(data['history']), 5)
+        self.assertEqual(data['history'][0]['severity'], 'critical')
+
+        response = client.delete('/alert/' + alert_id)
+        self.assertEqual(response.status_code, 200)
+
+    def test_lazy_history(self):
+
+        response = self.client.post('/alert', data=json.dumps(self.major_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        alert_id = json.loads(response.data.decode('utf-8'))['id']
+        response = self.client.put('/alert/' + alert_id + '/status', data=json.dumps({'status': 'ack'}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        with self.app.test_request_context('/'):
+            alert = Alert.find_by_id(alert_id)
+            self.assertFalse(hasattr(alert, '__dict__'))
+            self.assertIsNone(alert._history)
+            self.assertEqual(sorted(h.status for h in alert.history), ['ack', 'open'])
+            self.assertIs(alert.history, alert.history)
+            self.assertEqual(alert.vars['history'], alert.history)
+            self.assertEqual(alert.vars['event_type'], 'exceptionAlert')
+
+            with self.assertRaises(AttributeError):
+                alert.foo = 'bar'
+
+    def test_sparse_fields(self):
+
+        alert = dict(self.major_alert, rawData='raw data')
+        response = self.client.post('/alert', data=json.dumps(alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        alert_id = json.loads(response.data.decode('utf-8'))['id']
+
+        # history and raw data left out by default
+        response = self.client.get('/alerts?id=' + alert_id)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['alerts'][0]['resource'], self.resource)
+        self.assertNotIn('history', data['alerts'][0])
+        self.assertNotIn('rawData', data['alerts'][0])
+
+        response = self.client.get('/alerts?fields=resource,event&fields=rawData&sort-by=severity&id=' + alert_id)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(set(data['alerts'][0]), {'id', 'href', 'resource', 'event', 'rawData'})
+        self.assertEqual(data['alerts'][0]['rawData'], 'raw data')
+        self.assertEqual(data['severityCounts'], {'major': 1})
+
+        response = self.client.get('/alerts?fields=history&changed-since=' + (datetime.utcnow() - timedelta(hours=1)).isoformat() + 'Z')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(set(data['alerts'][0]), {'id', 'href', 'history'})
+        self.assertEqual(len(data['alerts'][0]['history']), 1)
+
+        response = self.client.get('/alerts?fields=resource,foo')
+        self.assertEqual(response.status_code, 400)
+
+        # all fields
+        app = create_app({
+            'TESTING': True,
+            'AUTH_REQUIRED': False,
+            'ALERTS_EXCLUDE_FIELDS': []
+        })
+        response = app.test_client().get('/alerts?id=' + alert_id)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['alerts'][0]['rawData'], 'raw data')
+        self.assertEqual(len(data['alerts'][0]['history']), 1)
+
+    def test_cursor_paging(self):
+
+        for i in range(5):
+            alert = dict(self.major_alert, event='event{}'.format(i), severity='major' if i % 2 else 'minor')
+            response = self.client.post('/alert', data=json.dumps(alert), headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+
+        for sort_by in ['lastReceiveTime', 'severity', 'event']:
+            response = self.client.get('/alerts?sort-by={}&page-size=5'.format(sort_by))
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.data.decode('utf-8'))
+            self.assertIsNone(data['nextCursor'])
+            expected = [a['id'] for a in data['alerts']]
+
+            ids = []
+            url = '/alerts?sort-by={}&page-size=2'.format(sort_by)
+            response = self.client.get(url)
+            while True:
+                self.assertEqual(response.status_code, 200)
+                data = json.loads(response.data.decode('utf-8'))
+                self.assertEqual(data['total'], 5)
+                ids.extend(a['id'] for a in data['alerts'])
+                if not data['nextCursor']:
+                    break
+                self.assertTrue(data['more'])
+                response = self.client.get(url + '&cursor=' + data['nextCursor'])
+            self.assertListEqual(ids, expected)
+
+        # history
+        response = self.client.get('/alerts/history?page-size=2')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        first = [h['id'] for h in data['history']]
+        response = self.client.get('/alerts/history?page-size=2&cursor=' + data['nextCursor'])
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['total'], 2)
+        self.assertFalse(set(first) & {h['id'] for h in data['history']})
+
+        response = self.client.get('/alerts?cursor=foo')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/alerts?sort-by=severity&page-size=2')
+        cursor = json.loads(response.data.decode('utf-8'))['nextCursor']
+        response = self.client.get('/alerts?sort-by=severity&sort-by=event&cursor=' + cursor)
+        self.assertEqual(response.status_code, 400)
+
+    def test_changed_since(self):
+
+        self.app.config['CHANGED_SINCE_OVERLAP'] = 0
+
+        ids = []
+        for i in range(3):
+            response = self.client.post('/alert', data=json.dumps(dict(self.major_alert, event='event{}'.format(i))), headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+            ids.append(json.loads(response.data.decode('utf-8'))['id'])
+
+        an_hour_ago = (datetime.utcnow() - timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        response = self.client.get('/alerts?changed-since=' + an_hour_ago)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertListEqual([a['id'] for a in data['alerts']], ids)
+        self.assertListEqual(data['deleted'], [])
+        self.assertFalse(data['more'])
+        watermark = data['watermark']
+
+        # nothing changed
+        response = self.client.get('/alerts?changed-since=' + watermark)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['total'], 0)
+
+        response = self.client.put('/alert/' + ids[0] + '/status', data=json.dumps({'status': 'ack'}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.delete('/alert/' + ids[1])
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/alerts?changed-since=' + watermark)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertListEqual([a['id'] for a in data['alerts']], [ids[0]])
+        self.assertEqual(data['alerts'][0]['status'], 'ack')
+        self.assertListEqual(data['deleted'], [ids[1]])
+
+        # page through changes
+        response = self.client.get('/alerts?page-size=1&changed-since=' + an_hour_ago)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertTrue(data['more'])
+        self.assertListEqual([a['id'] for a in data['alerts']], [ids[2]])
+        response = self.client.get('/alerts?page-size=1&changed-since=' + data['watermark'])
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertListEqual([a['id'] for a in data['alerts']], [ids[0]])
+
+        # paged watermark is also set back, so recent changes are returned again
+        self.app.config['CHANGED_SINCE_OVERLAP'] = 60
+        response = self.client.get('/alerts?page-size=1&changed-since=' + an_hour_ago)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertTrue(data['more'])
+        self.assertListEqual([a['id'] for a in data['alerts']], [ids[2]])
+        response = self.client.get('/alerts?page-size=1&changed-since=' + data['watermark'])
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertListEqual([a['id'] for a in data['alerts']], [ids[2]])
+        self.app.config['CHANGED_SINCE_OVERLAP'] = 0
+
+        # alerts that stop matching the filter are removed
+        response = self.client.get('/alerts?status=open&changed-since=' + an_hour_ago)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertListEqual([a['id'] for a in data['alerts']], [ids[2]])
+        self.assertListEqual(data['removed'], [ids[0]])
+        watermark = data['watermark']
+
+        response = self.client.put('/alert/' + ids[2] + '/status', data=json.dumps({'status': 'ack'}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/alerts?status=open&changed-since=' + watermark)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertListEqual(data['alerts'], [])
+        self.assertListEqual(data['removed'], [ids[2]])
+        self.assertListEqual(data['deleted'], [])
+
+        response = self.client.get('/alerts?changed-since=yesterday')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/alerts?changed-since=2000-01-01T00:00:00.000Z')
+        self.assertEqual(response.status_code, 410)
+
 
 class DummyRemoteIPPlugin(PluginBase):
 
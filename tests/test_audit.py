@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+import unittest
+
+import requests_mock
+
+from alerta.app import audit, create_app, db
+
+
+class AuditTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        self.spill_file = os.path.join(tempfile.mkdtemp(), 'audit.log')
+        test_config = {
+            'TESTING': True,
+            'AUTH_REQUIRED': False,
+            'AUDIT_TRAIL': ['admin', 'write'],
+            'AUDIT_URL': 'http://localhost:9200/audit',
+            'AUDIT_QUEUE_SIZE': 2,
+            'AUDIT_FLUSH_INTERVAL': 3600,
+            'AUDIT_SPILL_FILE': self.spill_file
+        }
+        self.app = create_app(test_config)
+        self.client = self.app.test_client()
+
+        self.alert = {
+            'event': 'node_down',
+            'resource': 'net01',
+            'environment': 'Production',
+            'service': ['Network'],
+            'severity': 'major'
+        }
+
+        self.headers = {
+            'Content-type': 'application/json'
+        }
+
+    def tearDown(self):
+        audit.sender.stop()
+        db.destroy()
+
+    @requests_mock.mock()
+    def test_batched_audit_events(self, m):
+
+        m.post('http://localhost:9200/audit', text='{"status": "ok"}')
+
+        for _ in range(3):
+            response = self.client.post('/alert', data=json.dumps(self.alert), headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+
+        # events are sent in the background, not during the request
+        self.assertEqual(m.called, False)
+        self.assertEqual(audit.sender.queue_depth, 2)
+        self.assertEqual(audit.sender.stats['spilled'], 1)
+
+        with self.app.app_context():
+            audit.sender.flush()
+
+        self.assertEqual(m.call_count, 2)
+        self.assertEqual(m.request_history[0].headers['Content-Type'], 'application/x-ndjson')
+        events = [json.loads(line) for r in m.request_history for line in r.text.splitlines()]
+        self.assertEqual([e['event'] for e in events], ['alert-received'] * 3)
+        self.assertEqual(audit.sender.queue_depth, 0)
+        self.assertEqual(audit.sender.stats['sent'], 3)
+
+    @requests_mock.mock()
+    def test_audit_url_down(self, m):
+
+        m.post('http://localhost:9200/audit', status_code=503)
+
+        response = self.client.post('/alert', data=json.dumps(self.alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+
+        with self.app.app_context():
+            audit.sender.flush()
+            audit.sender.flush()  # backing off, so not sent again
+        self.assertEqual(m.call_count, 1)
+        self.assertEqual(audit.sender.queue_depth, 1)
+        self.assertEqual(audit.sender.stats['errors'], 1)
+
+        response = self.client.get('/management/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('alerta_audit_queue_depth 1', response.data.decode('utf-8'))
+        self.assertIn('alerta_audit_errors_total 1', response.data.decode('utf-8'))
@@ -4,8 +4,9 @@ import unittest
 
 from alerta.app import create_app, db
 from alerta.models.enums import Scope
-from alerta.models.key import ApiKey
+from alerta.models.key import KEY_CACHE_SIZE, ApiKey, key_usage
 from alerta.models.token import Jwt
+from alerta.utils.cache import app_cache
 
 
 class AuthTestCase(unittest.TestCase):
@@ -316,6 +317,54 @@ class AuthTestCase(unittest.TestCase):
         self.assertEqual(data['key']['text'], 'devops automation key')
         self.assertEqual(data['key']['expireTime'], '2022-12-31T23:59:59.999Z')
 
+    def test_api_key_cache(self):
+
+        payload = {
+            'user': 'rw-demo-key-user',
+            'type': 'read-write'
+        }
+        response = self.client.post('/key', data=json.dumps(payload), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data.decode('utf-8'))
+
+        rw_api_key = data['key']
+
+        # repeated requests are verified from the cache
+        with self.app.app_context():
+            key_cache = app_cache('keys', KEY_CACHE_SIZE)
+        hits = key_cache.hits
+        for _ in range(5):
+            response = self.client.get('/alerts', headers={'Authorization': 'Key ' + rw_api_key})
+            self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(key_cache.hits - hits, 4)
+
+        # last used updates are coalesced until flushed
+        with self.app.app_context():
+            key_usage.flush()
+        response = self.client.get('/key/' + rw_api_key, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['key']['count'], 5)
+        self.assertIsNotNone(data['key']['lastUsedTime'])
+
+        # deleted keys are rejected immediately
+        response = self.client.delete('/key/' + rw_api_key, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/alerts', headers={'Authorization': 'Key ' + rw_api_key})
+        self.assertEqual(response.status_code, 401)
+
+        # unknown keys are cached too
+        misses = key_cache.misses
+        for _ in range(3):
+            response = self.client.get('/alerts', headers={'Authorization': 'Key bad-key'})
+            self.assertEqual(response.status_code, 401)
+        self.assertEqual(key_cache.misses - misses, 1)
+
+        # keys cached by one app are not seen by another
+        other_app = create_app({'TESTING': True, 'AUTH_REQUIRED': True})
+        with other_app.app_context():
+            self.assertIsNot(app_cache('keys'), key_cache)
+
     def test_basic_auth(self):
 
         # add customer mapping
@@ -354,6 +403,83 @@ class AuthTestCase(unittest.TestCase):
         data = json.loads(response.data.decode('utf-8'))
         self.assertEqual(data['status'], 'ok', response.data)
 
+    def test_basic_auth_cache(self):
+
+        payload = {
+            'customer': 'Bonaparte Industries',
+            'match': 'bonaparte.fr'
+        }
+        response = self.client.post('/customer', data=json.dumps(payload), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+
+        payload = {
+            'name': 'Napoleon Bonaparte',
+            'email': 'napoleon@bonaparte.fr',
+            'password': 'blackforest',
+            'text': 'added to circle of trust'
+        }
+        response = self.client.post('/auth/signup', data=json.dumps(payload),
+                                    content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/users', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        user_id = [u['id'] for u in data['users'] if u['email'] == 'napoleon@bonaparte.fr'][0]
+
+        payload = {
+            'match': 'ops',
+            'scopes': ['read']
+        }
+        response = self.client.post('/perm', data=json.dumps(payload), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data.decode('utf-8'))
+        perm_id = data['id']
+
+        response = self.client.put('/user/' + user_id, data=json.dumps({'roles': ['ops']}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        headers = {
+            'Authorization': 'Basic ' + base64.b64encode(b'napoleon@bonaparte.fr:blackforest').decode(),
+            'Content-type': 'application/json'
+        }
+
+        # repeated requests use cached credentials and scopes
+        response = self.client.get('/users', headers=headers)
+        self.assertEqual(response.status_code, 403)
+        with self.app.app_context():
+            hits = app_cache('credentials').hits, app_cache('scopes').hits
+        for _ in range(3):
+            response = self.client.get('/users', headers=headers)
+            self.assertEqual(response.status_code, 403)
+        with self.app.app_context():
+            self.assertEqual(app_cache('credentials').hits - hits[0], 3)
+            self.assertEqual(app_cache('scopes').hits - hits[1], 3)
+
+        # permission changes take effect immediately
+        payload = {
+            'scopes': ['read', 'admin:users']
+        }
+        response = self.client.put('/perm/' + perm_id, data=json.dumps(payload), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/users', headers=headers)
+        self.assertEqual(response.status_code, 200)
+
+        # wrong password is never served from the cache
+        bad_headers = {
+            'Authorization': 'Basic ' + base64.b64encode(b'napoleon@bonaparte.fr:wrongpassword').decode()
+        }
+        response = self.client.get('/alerts', headers=bad_headers)
+        self.assertEqual(response.status_code, 401)
+
+        # password change invalidates cached credentials
+        response = self.client.put('/user/' + user_id, data=json.dumps({'password': 'elba'}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/alerts', headers=headers)
+        self.assertEqual(response.status_code, 401)
+
     def test_edit_user(self):
 
         # add customer mapping
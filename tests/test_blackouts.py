@@ -637,6 +637,40 @@ class BlackoutsTestCase(unittest.TestCase):
         self.assertIsInstance(DateTime.parse(data['blackout']['createTime']), datetime)
         self.assertEqual(data['blackout']['text'], 'administratively down')
 
+    def test_blackout_index(self):
+
+        from alerta.models.alert import Alert
+        from alerta.models.blackout import Blackout as BlackoutModel
+
+        with self.app.test_request_context('/'):
+            blackouts = [
+                BlackoutModel(environment='Production', service=['Network', 'Web'], tags=['switch:off']).create(),
+                BlackoutModel(environment='Production', resource='node404', event='node_up').create(),
+                BlackoutModel(environment='Development', group='Network', customer='Foo').create()
+            ]
+
+            def alert(**kwargs):
+                return Alert.parse({**self.prod_alert, **kwargs})
+
+            cases = [
+                alert(),
+                alert(service=['Network']),
+                alert(tags=['level=20']),
+                alert(event='node_up'),
+                alert(event='node_up', resource='node405', service=['Core']),
+                alert(environment='Development'),
+                alert(environment='Development', customer='Foo'),
+                alert(environment='Staging'),
+                alert(createTime='2019-01-01T00:00:00.000Z')
+            ]
+            for a in cases:
+                self.assertEqual(a.is_blackout(), db.is_blackout_period(a), a)
+            self.assertEqual([a.is_blackout() for a in cases], [True, False, False, True, False, False, True, False, False])
+
+            # index is rebuilt when a blackout is deleted
+            blackouts[0].delete()
+            self.assertFalse(cases[0].is_blackout())
+
 
 class Blackout(PluginBase):
 
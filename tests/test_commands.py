@@ -1,8 +1,12 @@
 import unittest
 
+from alerta.app import db
 from alerta.commands import create_app
+from alerta.commands import indexes as indexes_cmd
 from alerta.commands import key as key_cmd
 from alerta.commands import keys as keys_cmd
+from alerta.commands import migrate_history as migrate_history_cmd
+from alerta.commands import rebuild_rollups as rebuild_rollups_cmd
 from alerta.commands import user as user_cmd
 from alerta.commands import users as users_cmd
 
@@ -41,3 +45,50 @@ class CommandsTestCase(unittest.TestCase):
         result = self.runner.invoke(users_cmd)
         self.assertEqual(result.exit_code, 0)
         self.assertIn('me@work.com', result.output.strip())
+
+    def test_migrate_history_cmd(self):
+
+        result = self.runner.invoke(migrate_history_cmd)
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn('HISTORY_TABLE', result.output)
+
+        self.app.config['HISTORY_TABLE'] = True
+        result = self.runner.invoke(migrate_history_cmd)
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Migrated history of 0 alerts', result.output)
+
+    def test_indexes_cmd(self):
+
+        result = self.runner.invoke(indexes_cmd, ['--check'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('alerts', result.output)
+        self.assertNotIn('MISSING', result.output)
+
+        if not self.app.config['DATABASE_URL'].startswith('postgres'):
+            return
+
+        # eg. left behind by a failed CREATE INDEX CONCURRENTLY
+        with self.app.app_context():
+            conn = db.connect()
+            cursor = conn.cursor()
+            cursor.execute('CREATE INDEX IF NOT EXISTS alerts_test_invalid_idx ON alerts (text)')
+            cursor.execute("UPDATE pg_index SET indisvalid=false WHERE indexrelid='alerts_status_idx'::regclass "
+                           "OR indexrelid='alerts_test_invalid_idx'::regclass")
+            conn.commit()
+            try:
+                result = self.runner.invoke(indexes_cmd, ['--check'])
+            finally:
+                cursor.execute('DROP INDEX alerts_test_invalid_idx')
+                cursor.execute("UPDATE pg_index SET indisvalid=true WHERE indexrelid='alerts_status_idx'::regclass")
+                conn.commit()
+                conn.close()
+        self.assertEqual(result.exit_code, 1)
+        self.assertRegex(result.output, r'alerts\s+alerts_status_idx\s+INVALID')
+        self.assertRegex(result.output, r'alerts\s+alerts_test_invalid_idx\s+INVALID')
+        self.assertIn('2 missing or invalid indexes', result.output)
+
+    def test_rebuild_rollups_cmd(self):
+
+        result = self.runner.invoke(rebuild_rollups_cmd)
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Rebuilt', result.output)
@@ -1,10 +1,14 @@
 import json
+import os
+import tempfile
+import time
 import unittest
 from uuid import uuid4
 
 import requests_mock
 
 from alerta.app import create_app, db
+from alerta.plugins.forwarder import delivery
 from alerta.utils.response import base_url
 
 
@@ -67,6 +71,8 @@ class ForwarderTestCase(unittest.TestCase):
         }
 
     def tearDown(self):
+        delivery._retries.clear()
+        delivery._failing.clear()
         db.destroy()
 
     @requests_mock.mock()
@@ -240,3 +246,141 @@ class ForwarderTestCase(unittest.TestCase):
 
         with self.app.test_request_context('/'):
             self.assertEqual(base_url(), 'http://localhost:8080')
+
+    @requests_mock.mock()
+    def test_batch_alerts(self, m):
+
+        ok_response = """
+        {"status": "ok"}
+        """
+        m.post('http://localhost:9000/alerts/_batch', text=ok_response)
+        m.post('http://localhost:9003/alerts/_batch', text=ok_response)
+
+        self.app.config['FWD_BATCH_WINDOW'] = 60
+        headers = {
+            'Content-type': 'application/json'
+        }
+        response = self.client.post('/alert', data=json.dumps(self.major_alert), headers=headers)
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/alert', data=json.dumps(self.warn_alert), headers=headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(m.called, False)
+
+        with self.app.app_context():
+            delivery.flush()
+
+        history = m.request_history
+        self.assertEqual(sorted(r.port for r in history), [9000, 9003])
+        for r in history:
+            self.assertEqual([a['severity'] for a in r.json()['alerts']], ['major', 'warning'])
+            self.assertEqual(r.headers['X-Alerta-Loop'], 'http://localhost:8080')
+
+    @requests_mock.mock()
+    def test_batch_not_supported(self, m):
+
+        ok_response = """
+        {"status": "ok"}
+        """
+        m.post('http://localhost:9000/alerts/_batch', status_code=404, text='Not Found')
+        m.post('http://localhost:9000/alert', text=ok_response)
+        m.post('http://localhost:9003/alerts/_batch', status_code=400, text='{"status": "error"}')
+
+        self.app.config['FWD_BATCH_WINDOW'] = 60
+        headers = {
+            'Content-type': 'application/json'
+        }
+        response = self.client.post('/alert', data=json.dumps(self.major_alert), headers=headers)
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/alert', data=json.dumps(self.warn_alert), headers=headers)
+        self.assertEqual(response.status_code, 201)
+
+        # batches are resent as single alerts, and rejected requests are logged
+        with self.app.app_context(), self.assertLogs('alerta.plugins.forwarder', level='WARNING') as cm:
+            delivery.flush()
+
+        single = [r for r in m.request_history if r.path == '/alert']
+        self.assertEqual([r.port for r in single], [9000, 9000])
+        self.assertEqual([r.json()['severity'] for r in single], ['major', 'warning'])
+        self.assertEqual(single[0].headers['X-Alerta-Loop'], 'http://localhost:8080')
+        self.assertEqual(len(cm.output), 2)
+        self.assertIn('does not accept batches', ''.join(cm.output))
+        self.assertIn('rejected request, dropped - [400]', ''.join(cm.output))
+        self.assertEqual(delivery.queued(), 0)
+
+    @requests_mock.mock()
+    def test_concurrent_destinations(self, m):
+
+        ok_response = """
+        {"status": "ok"}
+        """
+        m.post('http://localhost:9000/alert', text=ok_response)
+        m.post('http://localhost:9003/alert', text=ok_response)
+
+        self.app.config['FWD_CONCURRENCY'] = 4
+        headers = {
+            'Content-type': 'application/json'
+        }
+        response = self.client.post('/alert', data=json.dumps(self.major_alert), headers=headers)
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(sorted(r.port for r in m.request_history), [9000, 9003])
+
+    @requests_mock.mock()
+    def test_retry_failed(self, m):
+
+        ok_response = """
+        {"status": "ok"}
+        """
+        m.post('http://localhost:9000/alert', status_code=503, text='unavailable')
+        m.post('http://localhost:9003/alert', text=ok_response)
+
+        headers = {
+            'Content-type': 'application/json'
+        }
+        response = self.client.post('/alert', data=json.dumps(self.major_alert), headers=headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(delivery.queued(), 1)
+
+        # requests for a failing remote are queued without trying
+        response = self.client.post('/alert', data=json.dumps(self.warn_alert), headers=headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(delivery.queued(), 2)
+        self.assertEqual([r.port for r in m.request_history], [9000, 9003, 9003])
+
+        m.post('http://localhost:9000/alert', text=ok_response)
+        with self.app.app_context():
+            delivery.retry(time.time() + 3600)
+        self.assertEqual(delivery.queued(), 0)
+        self.assertEqual([r.json()['severity'] for r in m.request_history[3:]], ['major', 'warning'])
+
+    @requests_mock.mock()
+    def test_retry_spill_to_disk(self, m):
+
+        ok_response = """
+        {"status": "ok"}
+        """
+        m.post('http://localhost:9000/alert', status_code=503, text='unavailable')
+        m.post('http://localhost:9003/alert', exc=ConnectionError)
+
+        spill_dir = tempfile.mkdtemp()
+        self.app.config['FWD_RETRY_QUEUE_SIZE'] = 1
+        self.app.config['FWD_RETRY_SPILL_DIR'] = spill_dir
+
+        headers = {
+            'Content-type': 'application/json'
+        }
+        response = self.client.post('/alert', data=json.dumps(self.major_alert), headers=headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(delivery.queued(), 1)
+        spilled = os.path.join(spill_dir, 'forwarder-{}.jsonl'.format(os.getpid()))
+        with open(spilled) as f:
+            self.assertEqual(json.loads(f.read())['remote'], 'http://localhost:9003')
+
+        m.post('http://localhost:9000/alert', text=ok_response)
+        m.post('http://localhost:9003/alert', text=ok_response)
+        with self.app.app_context():
+            delivery.retry(time.time() + 3600)
+            delivery.retry(time.time() + 3600)
+        self.assertEqual(delivery.queued(), 0)
+        self.assertFalse(os.path.exists(spilled))
+        self.assertEqual(sorted(r.port for r in m.request_history[2:]), [9000, 9003])
@@ -244,3 +244,21 @@ class HeartbeatsTestCase(unittest.TestCase):
             )
         )
         self.assertEqual(data['heartbeats'][0]['timeout'], 4)
+
+    def test_cursor_paging(self):
+
+        for i in range(3):
+            response = self.client.post('/heartbeat', data=json.dumps(dict(self.heartbeat, origin='{}-{}'.format(self.origin, i))), headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+
+        ids = []
+        response = self.client.get('/heartbeats?page-size=2')
+        while True:
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.data.decode('utf-8'))
+            ids.extend(hb['id'] for hb in data['heartbeats'])
+            if not data.get('nextCursor'):
+                break
+            response = self.client.get('/heartbeats?page-size=2&cursor=' + data['nextCursor'])
+        self.assertEqual(len(ids), 3)
+        self.assertListEqual(ids, sorted(ids))
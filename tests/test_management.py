@@ -3,7 +3,7 @@ import time
 import unittest
 from uuid import uuid4
 
-from alerta.app import create_app, db
+from alerta.app import create_app, db, qb
 
 
 class ManagementTestCase(unittest.TestCase):
@@ -95,6 +95,67 @@ class ManagementTestCase(unittest.TestCase):
             if metric['name'] == 'total':
                 self.assertGreaterEqual(metric['value'], 1)
 
+    def test_pool_metrics(self):
+
+        response = self.client.get('/management/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('alerta_pool_size ', response.data.decode('utf-8'))
+        self.assertIn('alerta_pool_checkouts_total ', response.data.decode('utf-8'))
+
+        # connections are reused across requests
+        with self.app.app_context():
+            checkouts = db.pool_stats['checkouts']
+            size = db.pool_stats['size']
+        for _ in range(5):
+            response = self.client.get('/alerts')
+            self.assertEqual(response.status_code, 200)
+        with self.app.app_context():
+            self.assertEqual(db.pool_stats['checkouts'], checkouts + 5)
+            self.assertEqual(db.pool_stats['size'], size)
+            self.assertEqual(db.pool_stats['in_use'], 0)
+
+    def test_query_cache_metrics(self):
+
+        # quotes are passed as bound parameters, not inlined
+        q = "resource:{} AND text:o'brien".format(uuid4())
+        hits, misses = qb.query_cache.hits, qb.query_cache.misses
+        for _ in range(3):
+            response = self.client.get('/alerts', query_string={'q': q})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(qb.query_cache.hits, hits + 2)
+        self.assertEqual(qb.query_cache.misses, misses + 1)
+
+        response = self.client.get('/management/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('alerta_query_cache_hit_ratio ', response.data.decode('utf-8'))
+        self.assertIn('alerta_query_cache_hits_total ', response.data.decode('utf-8'))
+
+    def test_query_metrics(self):
+
+        # query timing is disabled by default
+        response = self.client.get('/management/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('alerta_database_query_seconds', response.data.decode('utf-8'))
+
+        app = create_app({
+            'TESTING': True,
+            'AUTH_REQUIRED': False,
+            'DATABASE_QUERY_TIMING': True,
+            'DATABASE_SLOW_QUERY_THRESHOLD': 1000
+        })
+        client = app.test_client()
+
+        response = client.get('/alerts')
+        self.assertEqual(response.status_code, 200)
+
+        response = client.get('/management/metrics')
+        self.assertEqual(response.status_code, 200)
+        metrics = response.data.decode('utf-8')
+        self.assertIn('# TYPE alerta_database_query_seconds histogram', metrics)
+        self.assertIn('alerta_database_query_seconds_bucket{method="get_alerts_and_counts",le="+Inf"} 1', metrics)
+        self.assertIn('alerta_database_query_seconds_count{method="get_alerts_and_counts"} 1', metrics)
+        self.assertNotIn('method="get_counts_by_severity"', metrics)
+
     def test_housekeeping(self):
 
         # create an alert with short timeout that will expire
@@ -232,3 +293,64 @@ class ManagementTestCase(unittest.TestCase):
         self.assertEqual(data['alert']['history'][2]['timeout'], 3)
         self.assertEqual(data['alert']['history'][3]['status'], 'ack')
         self.assertEqual(data['alert']['history'][3]['timeout'], 4)
+
+    def test_housekeeping_chunks(self):
+
+        app = create_app({
+            'TESTING': True,
+            'AUTH_REQUIRED': False,
+            'HOUSEKEEPING_CHUNK_SIZE': 2
+        })
+        client = app.test_client()
+
+        expired_ids = []
+        for resource in ['net01', 'net02', 'net03', 'net04', 'net05']:
+            response = client.post('/alert', data=json.dumps(dict(self.expired_alert, resource=resource, timeout=1)),
+                                   headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+            expired_ids.append(json.loads(response.data.decode('utf-8'))['id'])
+
+        acked_ids = []
+        for resource in ['net06', 'net07', 'net08']:
+            response = client.post('/alert', data=json.dumps(dict(self.acked_alert, resource=resource)), headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+            acked_id = json.loads(response.data.decode('utf-8'))['id']
+            response = client.put('/alert/' + acked_id + '/action',
+                                  data=json.dumps({'action': 'ack', 'timeout': 1}), headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            acked_ids.append(acked_id)
+
+        time.sleep(2)
+
+        # only one node at a time
+        with app.app_context():
+            self.assertTrue(db.acquire_lease('housekeeping', 'node1:1234', ttl=60))
+        response = client.get('/management/housekeeping')
+        self.assertEqual(response.status_code, 409)
+        with app.app_context():
+            self.assertTrue(db.release_lease('housekeeping', 'node1:1234'))
+
+        response = client.get('/management/housekeeping')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['count'], 8)
+        self.assertListEqual(sorted(data['expired']), sorted(expired_ids))
+        self.assertListEqual(sorted(data['unack']), sorted(acked_ids))
+        self.assertFalse(data['more'])
+
+        for expired_id in expired_ids:
+            response = client.get('/alert/' + expired_id)
+            data = json.loads(response.data.decode('utf-8'))
+            self.assertEqual(data['alert']['status'], 'expired')
+            self.assertEqual(data['alert']['history'][-1]['type'], 'expired')
+
+        for acked_id in acked_ids:
+            response = client.get('/alert/' + acked_id)
+            data = json.loads(response.data.decode('utf-8'))
+            self.assertEqual(data['alert']['status'], 'open')
+            self.assertEqual(data['alert']['history'][-1]['type'], 'timeout')
+            self.assertEqual(data['alert']['history'][-1]['timeout'], 86400)
+
+        # lease is released after the run
+        with app.app_context():
+            self.assertTrue(db.acquire_lease('housekeeping', 'node1:1234', ttl=60))
@@ -34,3 +34,26 @@ class MetricsTestCase(unittest.TestCase):
             timer = [t for t in Timer.find_all() if t.title == 'Test timer'][0]
             self.assertGreaterEqual(timer.count, 1)
             self.assertGreaterEqual(timer.total_time, 999)
+
+    def test_aggregated_metrics(self):
+
+        self.app = create_app({'METRICS_FLUSH_INTERVAL': 60})
+
+        with self.app.test_request_context():
+            self.app.preprocess_request()
+
+            test_timer = Timer(group='test', name='aggregated', title='Aggregated timer',
+                               description='total time to process timed events')
+            for _ in range(10):
+                test_timer.stop_timer(test_timer.start_timer() - 100)
+
+            # not written to the database until flushed
+            self.assertEqual([t for t in db.get_metrics(type='timer') if Timer.from_db(t).name == 'aggregated'], [])
+
+            timer = [t for t in Timer.find_all() if t.title == 'Aggregated timer'][0]
+            self.assertEqual(timer.count, 10)
+            self.assertGreaterEqual(timer.total_time, 1000)
+            self.assertGreaterEqual(timer.percentiles[0.5], 100)
+            self.assertGreaterEqual(timer.percentiles[0.99], timer.percentiles[0.5])
+            self.assertIn('p95', timer.serialize())
+            self.assertIn('alerta_test_aggregated{quantile="0.99"}', timer.serialize(format='prometheus'))
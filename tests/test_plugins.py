@@ -1,10 +1,14 @@
 import json
 import os
+import threading
+import time
 import unittest
 from uuid import uuid4
 
 from alerta.app import create_app, db, plugins
 from alerta.plugins import PluginBase, app
+from alerta.plugins.acked_by import AckedBy
+from alerta.plugins.remote_ip import RemoteIpAddr
 
 
 class PluginsTestCase(unittest.TestCase):
@@ -247,6 +251,74 @@ class PluginsTestCase(unittest.TestCase):
         self.assertIn('a:Triple:Tag', data['alert']['tags'])
         self.assertNotIn('aDouble:Tag', data['alert']['tags'])
 
+    def test_async_hooks(self):
+
+        plugins.plugins['async1'] = AsyncPlugin1()
+        self.addCleanup(plugins.plugins.pop, 'async1')
+
+        # async hooks run after the response and do not change the alert
+        response = self.client.post('/alert', data=json.dumps(self.accept_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data.decode('utf-8'))
+        alert_id = data['id']
+        self.assertNotIn('async', data['alert']['attributes'])
+        self.assertTrue(AsyncPlugin1.called.wait(5))
+        self.assertEqual(AsyncPlugin1.calls, [('post_receive', alert_id)])
+
+        AsyncPlugin1.called.clear()
+        response = self.client.put('/alert/' + alert_id + '/status', data=json.dumps({'status': 'ack'}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(AsyncPlugin1.called.wait(5))
+        self.assertEqual(AsyncPlugin1.calls[-1], ('status_change', alert_id, 'assign'))
+
+        # failed and timed out hooks are dead-lettered
+        self.app.config['PLUGINS_ASYNC_TIMEOUT'] = 0.1
+        with self.assertLogs('alerta.plugins.deadletter', level='ERROR') as cm:
+            response = self.client.post('/alert', data=json.dumps(self.critical_alert), headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+            for _ in range(50):
+                if len(cm.output) >= 1:
+                    break
+                time.sleep(0.1)
+        self.assertEqual(len(cm.output), 1)
+        self.assertIn('timed out after 0.1s', cm.output[0])
+        self.assertIn('"hook": "post_receive"', cm.output[0])
+
+        # run all hooks inline
+        self.app.config['PLUGINS_ASYNC_BACKEND'] = None
+        AsyncPlugin1.called.clear()
+        response = self.client.post('/alert', data=json.dumps(self.accept_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['alert']['attributes']['async'], 'post')
+
+    def test_plugin_hooks(self):
+
+        # hooks that do nothing are skipped, keyword arguments are passed only if accepted
+        self.assertDictEqual(plugins.hooks(RemoteIpAddr()), {'pre_receive': None})
+        self.assertDictEqual(plugins.hooks(AckedBy()), {'take_action': None, 'take_actions': None})
+        self.assertDictEqual(plugins.hooks(plugins.plugins['old1']), {
+            'pre_receive': frozenset(['alert']),
+            'post_receive': frozenset(['alert']),
+            'status_change': frozenset(['alert', 'status', 'text'])
+        })
+        self.assertNotIn('status_change', plugins.hooks(plugins.plugins['test2']))
+        self.assertIn('status_change', plugins.hooks(plugins.plugins['test3']))
+
+        response = self.client.post('/alert', data=json.dumps(self.accept_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['alert']['attributes']['old'], 'post1')
+
+        # hook timing by plugin and hook
+        response = self.client.get('/management/metrics')
+        self.assertEqual(response.status_code, 200)
+        metrics = response.data.decode('utf-8')
+        self.assertIn('# TYPE alerta_plugins_hook_seconds histogram', metrics)
+        self.assertIn('alerta_plugins_hook_seconds_count{plugin="old1",hook="pre_receive"} 1', metrics)
+        self.assertIn('alerta_plugins_hook_seconds_count{plugin="test1",hook="post_receive"} 1', metrics)
+        self.assertNotIn('plugin="test2",hook="status_change"', metrics)
+
 
 class OldPlugin1(PluginBase):
 
@@ -408,3 +480,25 @@ class CustDeletePlugin2(PluginBase):
 
     def delete(self, alert, **kwargs):
         return True
+
+
+class AsyncPlugin1(PluginBase):
+
+    async_hooks = ('post_receive', 'status_change')
+    calls = []  # type: ignore
+    called = threading.Event()
+
+    def pre_receive(self, alert, **kwargs):
+        return alert
+
+    def post_receive(self, alert, **kwargs):
+        if alert.severity == 'critical':
+            time.sleep(1)
+        alert.attributes['async'] = 'post'
+        AsyncPlugin1.calls.append(('post_receive', alert.id))
+        AsyncPlugin1.called.set()
+        return alert
+
+    def status_change(self, alert, status, text, **kwargs):
+        AsyncPlugin1.calls.append(('status_change', alert.id, status))
+        AsyncPlugin1.called.set()
@@ -23,35 +23,41 @@ class PostgresQueryTestCase(unittest.TestCase):
 
         # default field (ie. "text") contains word
         string = r'''quick'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '"text" ILIKE \'%%quick%%\'')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '"text" ILIKE %(q0)s')
+        self.assertEqual(params, {'q0': '%quick%'})
 
         # default field (ie. "text") contains phrase
         string = r'''"quick brown"'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '"text" ~* \'\\yquick brown\\y\'')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '"text" ~* %(q0)s')
+        self.assertEqual(params, {'q0': '\\yquick brown\\y'})
 
     def test_field_names(self):
 
-        # field contains word
+        # keyword field is word
         string = r'''status:active'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '"status" ILIKE \'%%active%%\'')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '"status"=%(q0)s')
+        self.assertEqual(params, {'q0': 'active'})
 
         # field contains either words
         string = r'''title:(quick OR brown)'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("title" ILIKE \'%%quick%%\' OR "title" ILIKE \'%%brown%%\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("title" ILIKE %(q0)s OR "title" ILIKE %(q1)s)')
+        self.assertEqual(params, {'q0': '%quick%', 'q1': '%brown%'})
 
         # field contains either words (default operator)
         string = r'''title:(quick brown)'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("title" ILIKE \'%%quick%%\' OR "title" ILIKE \'%%brown%%\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("title" ILIKE %(q0)s OR "title" ILIKE %(q1)s)')
+        self.assertEqual(params, {'q0': '%quick%', 'q1': '%brown%'})
 
         # field exact match
         string = r'''author:"John Smith"'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '"author" ~* \'\\yJohn Smith\\y\'')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '"author" ~* %(q0)s')
+        self.assertEqual(params, {'q0': '\\yJohn Smith\\y'})
 
         # # any attribute contains word or phrase
         # string = r'''attributes.\*:(quick brown)'''
@@ -60,41 +66,48 @@ class PostgresQueryTestCase(unittest.TestCase):
 
         # attribute field has non-null value
         string = r'''_exists_:title'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '"attributes"::jsonb ? \'title\'')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '"attributes" ? %(q0)s')
+        self.assertEqual(params, {'q0': 'title'})
 
-        # attribute contains word
+        # attribute is word
         string = r'''foo.vendor:cisco'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '"foo"::jsonb ->>\'vendor\' ILIKE \'%%cisco%%\'')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '"foo" @> %(q0)s::jsonb')
+        self.assertEqual(params, {'q0': '{"vendor": "cisco"}'})
 
-        # attribute contains word ("_" shortcut)
+        # attribute is word ("_" shortcut)
         string = r'''_.vendor:cisco'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '"attributes"::jsonb ->>\'vendor\' ILIKE \'%%cisco%%\'')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '"attributes" @> %(q0)s::jsonb')
+        self.assertEqual(params, {'q0': '{"vendor": "cisco"}'})
 
-        # attribute contains either words (default operator)
+        # attribute is either word (default operator)
         string = r'''attributes.vendor:(cisco juniper)'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("attributes"::jsonb ->>\'vendor\' ILIKE \'%%cisco%%\' OR "attributes"::jsonb ->>\'vendor\' ILIKE \'%%juniper%%\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("attributes" @> %(q0)s::jsonb OR "attributes" @> %(q1)s::jsonb)')
+        self.assertEqual(params, {'q0': '{"vendor": "cisco"}', 'q1': '{"vendor": "juniper"}'})
 
-        # attribute contains either words ("_" shortcut, default operator)
+        # attribute is either word ("_" shortcut, default operator)
         string = r'''_.vendor:(cisco juniper)'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("attributes"::jsonb ->>\'vendor\' ILIKE \'%%cisco%%\' OR "attributes"::jsonb ->>\'vendor\' ILIKE \'%%juniper%%\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("attributes" @> %(q0)s::jsonb OR "attributes" @> %(q1)s::jsonb)')
+        self.assertEqual(params, {'q0': '{"vendor": "cisco"}', 'q1': '{"vendor": "juniper"}'})
 
     def test_wildcards(self):
 
         # ? = single character, * = one or more characters
         string = r'''text:qu?ck bro*'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("text" ~* \'\\yqu.?ck\\y\' OR "text" ~* \'\\ybro.*\\y\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("text" ~* %(q0)s OR "text" ~* %(q1)s)')
+        self.assertEqual(params, {'q0': '\\yqu.?ck\\y', 'q1': '\\ybro.*\\y'})
 
     def test_regular_expressions(self):
 
         string = r'''name:/joh?n(ath[oa]n)/'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '"name" ~* \'joh?n(ath[oa]n)\'')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '"name" ~* %(q0)s')
+        self.assertEqual(params, {'q0': 'joh?n(ath[oa]n)'})
 
     def test_fuzziness(self):
         pass
@@ -105,46 +118,56 @@ class PostgresQueryTestCase(unittest.TestCase):
     def test_ranges(self):
 
         string = r'''date:[2012-01-01 TO 2012-12-31]'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("date" >= \'2012-01-01\' AND "date" <= \'2012-12-31\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("date" >= %(q0)s AND "date" <= %(q1)s)')
+        self.assertEqual(params, {'q0': '2012-01-01', 'q1': '2012-12-31'})
 
         string = r'''count:[1 TO 5]'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("count" >= \'1\' AND "count" <= \'5\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("count" >= %(q0)s AND "count" <= %(q1)s)')
+        self.assertEqual(params, {'q0': '1', 'q1': '5'})
 
         string = r'''tag:{alpha TO omega}'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("tag" > \'alpha\' AND "tag" < \'omega\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("tag" > %(q0)s AND "tag" < %(q1)s)')
+        self.assertEqual(params, {'q0': 'alpha', 'q1': 'omega'})
 
         string = r'''count:[10 TO *]'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("count" >= \'10\' AND 1=1)')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("count" >= %(q0)s AND 1=1)')
+        self.assertEqual(params, {'q0': '10'})
 
         string = r'''date:{* TO 2012-01-01}'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '(1=1 AND "date" < \'2012-01-01\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '(1=1 AND "date" < %(q0)s)')
+        self.assertEqual(params, {'q0': '2012-01-01'})
 
         string = r'''count:[1 TO 5}'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("count" >= \'1\' AND "count" < \'5\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("count" >= %(q0)s AND "count" < %(q1)s)')
+        self.assertEqual(params, {'q0': '1', 'q1': '5'})
 
     def test_unbounded_ranges(self):
 
         string = r'''age:>10'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("age" > \'10\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("age" > %(q0)s)')
+        self.assertEqual(params, {'q0': '10'})
 
         string = r'''age:>=10'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("age" >= \'10\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("age" >= %(q0)s)')
+        self.assertEqual(params, {'q0': '10'})
 
         string = r'''age:<10'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("age" < \'10\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("age" < %(q0)s)')
+        self.assertEqual(params, {'q0': '10'})
 
         string = r'''age:<=10'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("age" <= \'10\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("age" <= %(q0)s)')
+        self.assertEqual(params, {'q0': '10'})
 
     def test_boosting(self):
         pass
@@ -153,45 +176,54 @@ class PostgresQueryTestCase(unittest.TestCase):
 
         # OR (||)
         string = r'''"jakarta apache" jakarta'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("text" ~* \'\\yjakarta apache\\y\' OR "text" ILIKE \'%%jakarta%%\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("text" ~* %(q0)s OR "text" ILIKE %(q1)s)')
+        self.assertEqual(params, {'q0': '\\yjakarta apache\\y', 'q1': '%jakarta%'})
 
         string = r'''"jakarta apache" OR jakarta'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("text" ~* \'\\yjakarta apache\\y\' OR "text" ILIKE \'%%jakarta%%\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("text" ~* %(q0)s OR "text" ILIKE %(q1)s)')
+        self.assertEqual(params, {'q0': '\\yjakarta apache\\y', 'q1': '%jakarta%'})
 
         string = r'''"jakarta apache" || jakarta'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("text" ~* \'\\yjakarta apache\\y\' OR "text" ILIKE \'%%jakarta%%\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("text" ~* %(q0)s OR "text" ILIKE %(q1)s)')
+        self.assertEqual(params, {'q0': '\\yjakarta apache\\y', 'q1': '%jakarta%'})
 
         # AND (&&)
         string = r'''"jakarta apache" AND "Apache Lucene"'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("text" ~* \'\\yjakarta apache\\y\' AND "text" ~* \'\\yApache Lucene\\y\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("text" ~* %(q0)s AND "text" ~* %(q1)s)')
+        self.assertEqual(params, {'q0': '\\yjakarta apache\\y', 'q1': '\\yApache Lucene\\y'})
 
         string = r'''"jakarta apache" && "Apache Lucene"'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("text" ~* \'\\yjakarta apache\\y\' AND "text" ~* \'\\yApache Lucene\\y\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("text" ~* %(q0)s AND "text" ~* %(q1)s)')
+        self.assertEqual(params, {'q0': '\\yjakarta apache\\y', 'q1': '\\yApache Lucene\\y'})
 
         # + (required)
         pass
 
         # NOT (!)
         string = r'''"jakarta apache" NOT "Apache Lucene"'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("text" ~* \'\\yjakarta apache\\y\' AND NOT ("text" ~* \'\\yApache Lucene\\y\'))')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("text" ~* %(q0)s AND NOT ("text" ~* %(q1)s))')
+        self.assertEqual(params, {'q0': '\\yjakarta apache\\y', 'q1': '\\yApache Lucene\\y'})
 
         string = r'''"jakarta apache" !"Apache Lucene"'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("text" ~* \'\\yjakarta apache\\y\' AND NOT ("text" ~* \'\\yApache Lucene\\y\'))')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("text" ~* %(q0)s AND NOT ("text" ~* %(q1)s))')
+        self.assertEqual(params, {'q0': '\\yjakarta apache\\y', 'q1': '\\yApache Lucene\\y'})
 
         string = r'''NOT "jakarta apache"'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, 'NOT ("text" ~* \'\\yjakarta apache\\y\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, 'NOT ("text" ~* %(q0)s)')
+        self.assertEqual(params, {'q0': '\\yjakarta apache\\y'})
 
         string = r'''group:"jakarta apache" NOT group:"Apache Lucene"'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '("group" ~* \'\\yjakarta apache\\y\' AND NOT ("group" ~* \'\\yApache Lucene\\y\'))')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("group"=%(q0)s AND NOT ("group"=%(q1)s))')
+        self.assertEqual(params, {'q0': 'jakarta apache', 'q1': 'Apache Lucene'})
 
         # - (prohibit)
         pass
@@ -200,14 +232,65 @@ class PostgresQueryTestCase(unittest.TestCase):
 
         # field exact match
         string = r'''(quick OR brown) AND fox'''
-        r = self.parser.parse(string)
-        self.assertEqual(r, '(("text" ILIKE \'%%quick%%\' OR "text" ILIKE \'%%brown%%\') AND "text" ILIKE \'%%fox%%\')')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '(("text" ILIKE %(q0)s OR "text" ILIKE %(q1)s) AND "text" ILIKE %(q2)s)')
+        self.assertEqual(params, {'q0': '%quick%', 'q1': '%brown%', 'q2': '%fox%'})
 
         # field exact match
         string = r'''status:(active OR pending) title:(full text search)'''
-        r = self.parser.parse(string)
-        self.assertEqual(
-            r, '(("status" ILIKE \'%%active%%\' OR "status" ILIKE \'%%pending%%\') OR ("title" ILIKE \'%%full%%\' OR "title" ILIKE \'%%text%%\'))')
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("status"=ANY(%(q0)s) OR (("title" ILIKE %(q1)s OR "title" ILIKE %(q2)s) OR "title" ILIKE %(q3)s))')
+        self.assertEqual(params, {'q0': ['active', 'pending'], 'q1': '%full%', 'q2': '%text%', 'q3': '%search%'})
+
+    def test_index_operators(self):
+
+        # keyword field starts with, ignoring case
+        string = r'''resource:net*'''
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, 'lower("resource") LIKE lower(%(q0)s)')
+        self.assertEqual(params, {'q0': 'net%'})
+
+        # alert ids still match on part of the id
+        string = r'''id:4f3e2a'''
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '"id" ILIKE %(q0)s')
+        self.assertEqual(params, {'q0': '%4f3e2a%'})
+
+        # keyword field is any of words
+        string = r'''severity:(critical OR major OR minor)'''
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '"severity"=ANY(%(q0)s)')
+        self.assertEqual(params, {'q0': ['critical', 'major', 'minor']})
+
+        # array field contains word
+        string = r'''tags:foo'''
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '"tags" @> %(q0)s::text[]')
+        self.assertEqual(params, {'q0': ['foo']})
+
+        # array field contains any of words
+        string = r'''service:(Web Network)'''
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '"service" && %(q0)s::text[]')
+        self.assertEqual(params, {'q0': ['Web', 'Network']})
+
+        # attribute is number or string
+        string = r'''_.port:8080'''
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '("attributes" @> %(q0)s::jsonb OR "attributes" @> %(q1)s::jsonb)')
+        self.assertEqual(params, {'q0': '{"port": "8080"}', 'q1': '{"port": 8080}'})
+
+        # literals are never inlined
+        string = r'''resource:o'brien'''
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '"resource"=%(q0)s')
+        self.assertEqual(params, {'q0': "o'brien"})
+
+        # prohibit, and more than two operands
+        string = r'''-foo bar baz'''
+        where, params = self.parser.parse(string)
+        self.assertEqual(where, '((NOT ("text" ILIKE %(q0)s) OR "text" ILIKE %(q1)s) OR "text" ILIKE %(q2)s)')
+        self.assertEqual(params, {'q0': '%foo%', 'q1': '%bar%', 'q2': '%baz%'})
 
 
 def skip_mongodb():
@@ -36,3 +36,30 @@ class ApiResponseTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 201)
         data = json.loads(response.data.decode('utf-8'))
         self.assertEqual(data['alert']['href'], 'https://api.alerta.dev:9898/_/alert/custom-alert-id')
+
+    def test_streamed_alerts(self):
+
+        for resource in ['node401', 'node402', 'node403', 'node404', 'node405']:
+            response = self.client.post('/alert', json=dict(self.prod_alert, id=None, resource=resource))
+            self.assertEqual(response.status_code, 201)
+
+        expected = {}
+        for path in ['/alerts', '/alerts/history']:
+            for encoder in ['json', 'orjson']:
+                for chunk_size in [0, 2]:
+                    self.app.config['JSON_ENCODER'] = encoder
+                    self.app.config['JSON_STREAM_CHUNK_SIZE'] = chunk_size
+                    response = self.client.get(path)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.content_type, 'application/json')
+                    self.assertEqual('Content-Length' in response.headers, chunk_size == 0)
+                    data = json.loads(response.data.decode('utf-8'))
+                    expected.setdefault(path, data)
+                    self.assertDictEqual(data, expected[path])
+
+        self.assertEqual(expected['/alerts']['total'], 5)
+        self.assertEqual(len(expected['/alerts']['alerts']), 5)
+        self.assertEqual(len(expected['/alerts/history']['history']), 5)
+        for alert in expected['/alerts']['alerts']:
+            self.assertEqual(alert['href'], 'https://api.alerta.dev:9898/_/alert/' + alert['id'])
+            self.assertRegex(alert['createTime'], r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}Z$')
@@ -0,0 +1,86 @@
+import json
+import unittest
+from uuid import uuid4
+
+from alerta.app import create_app, db
+from alerta.utils.stream import alert_stream
+
+
+class AlertStreamTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        test_config = {
+            'TESTING': True,
+            'AUTH_REQUIRED': False,
+            'STREAM_KEEPALIVE': 1
+        }
+        self.app = create_app(test_config)
+        self.client = self.app.test_client()
+
+        self.resource = str(uuid4()).upper()[:8]
+
+        self.alert = {
+            'event': 'node_down',
+            'resource': self.resource,
+            'environment': 'Production',
+            'service': ['Network'],
+            'severity': 'major'
+        }
+
+        self.headers = {
+            'Content-type': 'application/json'
+        }
+
+    def tearDown(self):
+        db.destroy()
+
+    def read_events(self, stream, expected):
+        events = dict()
+        for _ in range(50):
+            chunk = next(stream).decode('utf-8')
+            if chunk.startswith('event:'):
+                event, data = chunk.strip().split('\n')
+                events[event[len('event: '):]] = json.loads(data[len('data: '):])
+                if set(events) >= expected:
+                    break
+        return events
+
+    def test_stream(self):
+
+        response = self.client.get('/alerts/stream?environment=Production', buffered=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        stream = iter(response.response)
+        self.assertEqual(next(stream), b'retry: 1000\n\n')
+        self.assertTrue(alert_stream.listening.wait(timeout=10))
+
+        response = self.client.post('/alert', data=json.dumps(self.alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        alert_id = json.loads(response.data.decode('utf-8'))['id']
+
+        # not matched by stream filter
+        response = self.client.post('/alert', data=json.dumps(dict(self.alert, environment='Development')), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.post('/alert', data=json.dumps(self.alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/alert', data=json.dumps(dict(self.alert, severity='minor')), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        response = self.client.put('/alert/' + alert_id + '/status', data=json.dumps({'status': 'ack'}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.put('/alert/' + alert_id + '/tag', data=json.dumps({'tags': ['foo']}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.delete('/alert/' + alert_id)
+        self.assertEqual(response.status_code, 200)
+
+        expected = {'create', 'dedup', 'correlate', 'status', 'tag', 'delete'}
+        events = self.read_events(stream, expected)
+        self.assertSetEqual(set(events), expected)
+        self.assertTrue(all(data['id'] == alert_id for data in events.values()))
+        self.assertEqual(events['create']['alert']['severity'], 'major')
+        self.assertEqual(events['dedup']['alert']['duplicateCount'], 1)
+        self.assertEqual(events['correlate']['alert']['severity'], 'minor')
+        self.assertEqual(events['status']['alert']['status'], 'ack')
+        self.assertListEqual(events['tag']['alert']['tags'], ['foo'])
+        self.assertNotIn('alert', events['delete'])
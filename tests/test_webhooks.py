@@ -941,6 +941,34 @@ class WebhooksTestCase(unittest.TestCase):
         self.assertEqual(data['alert']['type'], 'ALERT_TYPE_APPLICATION_PROBLEM')
         self.assertEqual(data['alert']['text'], 'sample-info')
 
+    def test_custom_webhook_list(self):
+
+        custom_webhooks.webhooks['list'] = DummyListWebhook()
+
+        # rejected alerts do not stop the others from being stored
+        payload = [{'resource': 'web01', 'environment': 'Production'},
+                   {'resource': 'web02', 'environment': 'Testing'},
+                   {'resource': 'web03', 'environment': 'Production'}]
+        response = self.client.post('/webhooks/list', data=json.dumps(payload), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['count'], 3)
+        self.assertEqual([r['code'] for r in data['results']], [201, 403, 201])
+        self.assertEqual(data['results'][1]['status'], 'error')
+        self.assertEqual(data['ids'], [data['results'][0]['id'], data['results'][2]['id']])
+
+        for id in data['ids']:
+            response = self.client.get('/alert/' + id, headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+        response = self.client.get('/alert/' + data['results'][1]['id'], headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+        # all stored
+        response = self.client.post('/webhooks/list', data=json.dumps(payload[:1] + payload[2:]), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(data['ids']), 2)
+
     def test_custom_webhook(self):
 
         # setup custom webhook
@@ -1067,6 +1095,19 @@ class DummyMultiPartFormWebhook(WebhookBase):
         )
 
 
+class DummyListWebhook(WebhookBase):
+
+    def incoming(self, path, query_string, payload):
+        return [
+            Alert(
+                resource=p['resource'],
+                event='node_down',
+                environment=p['environment'],
+                service=['Foo']
+            ) for p in payload
+        ]
+
+
 class DummyUserDefinedWebhook(WebhookBase):
 
     def incoming(self, path, query_string, payload):